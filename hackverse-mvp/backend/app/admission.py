@@ -0,0 +1,221 @@
+"""Admission control for the detection routes: shed load early instead of queueing it.
+
+A request asks admit() for its events, counted per source. In order:
+
+  1. quota   each source has a token bucket (events/s, burst). If any of the
+             request's sources is short, the request is rejected with a
+             Retry-After of when the tokens will be there; nothing is taken.
+  2. slot    at most `max_in_flight` admitted requests run at once. Others
+             wait in a queue of at most `max_queue`, highest priority first
+             (FIFO within a class), for at most `queue_timeout`. When the
+             queue is full, a request evicts the newest waiter of a lower
+             class, or is rejected itself if there is none.
+
+Rejected requests get AdmissionRejected (429 with Retry-After at the API) in
+microseconds, without touching the scoring pool, so the latency of admitted
+requests stays bounded by max_in_flight and the queue timeout however large
+the offered load. Priority classes are per source (higher is shed later); a
+request with several sources gets the lowest of their classes.
+
+Everything runs on the event loop, so no locks are needed. Quota tokens are
+given back when a request is rejected for lack of a slot.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from backend.app.metrics import admission_decisions, admission_wait_seconds
+
+# sources whose buckets are remembered; the least recently seen are dropped (and start full again)
+MAX_SOURCES = 10000
+# smoothing for the mean time a slot is held, used for Retry-After
+HOLD_ALPHA = 0.05
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        # whole seconds, as the Retry-After header wants them
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, n: float) -> float:
+        """Seconds until `n` tokens are available (0 if they are).
+
+        A request larger than the burst goes through on a full bucket and
+        leaves it in debt, which later requests wait out.
+        """
+        return max(0.0, (min(n, self.burst) - self.tokens) / self.rate)
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 64, max_queue: int = 256, queue_timeout_ms: float = 100.0,
+                 source_rate: float = 0.0, source_burst: float = 0.0, source_rates: Optional[Dict[str, float]] = None,
+                 priorities: Optional[Dict[str, int]] = None, enabled: bool = True):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = max(0.0, queue_timeout_ms) / 1000.0
+        # events/s per source, 0 = unlimited; burst defaults to one second's worth
+        self.source_rate = source_rate
+        self.source_burst = source_burst
+        self.source_rates = dict(source_rates or {})
+        self.priorities = dict(priorities or {})
+        self.enabled = enabled
+        self.in_flight = 0
+        self.queued = 0
+        self.hold_time = 0.0
+        self._waiters = []  # heap of (-priority, seq, future)
+        self._seq = itertools.count()
+        self._buckets: OrderedDict = OrderedDict()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            max_in_flight=settings.admission_max_in_flight,
+            max_queue=settings.admission_max_queue,
+            queue_timeout_ms=settings.admission_queue_timeout_ms,
+            source_rate=settings.admission_source_rate,
+            source_burst=settings.admission_source_burst,
+            source_rates=settings.admission_source_rates,
+            priorities=settings.admission_priorities,
+            enabled=settings.admission_enabled,
+        )
+
+    def priority(self, sources) -> int:
+        return min((self.priorities.get(s, 0) for s in sources), default=0)
+
+    def _bucket(self, source: str, now: float) -> Optional[TokenBucket]:
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            rate = self.source_rates.get(source, self.source_rate)
+            if rate <= 0:
+                return None
+            bucket = self._buckets[source] = TokenBucket(rate, self.source_burst or rate, now)
+            if len(self._buckets) > MAX_SOURCES:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(source)
+        bucket.refill(now)
+        return bucket
+
+    def _take(self, costs: Dict[str, int]):
+        now = time.monotonic()
+        buckets = [(self._bucket(s, now), n) for s, n in costs.items()]
+        wait = max((b.shortfall(n) for b, n in buckets if b is not None), default=0.0)
+        if wait > 0:
+            raise AdmissionRejected('source quota exceeded', wait)
+        for b, n in buckets:
+            if b is not None:
+                b.tokens -= n
+
+    def _refund(self, costs: Dict[str, int]):
+        for s, n in costs.items():
+            bucket = self._buckets.get(s)
+            if bucket is not None:
+                bucket.tokens = min(bucket.burst, bucket.tokens + n)
+
+    def _overloaded(self, reason: str) -> AdmissionRejected:
+        # roughly when the queue ahead will have drained
+        return AdmissionRejected(reason, self.hold_time * (self.queued + 1) / self.max_in_flight)
+
+    def _shed_for(self, priority: int) -> bool:
+        """Reject the newest waiter of the lowest class below `priority`; False if there is none."""
+        live = [w for w in self._waiters if not w[2].done()]
+        if not live:
+            return False
+        victim = max(live, key=lambda w: (w[0], w[1]))
+        if -victim[0] >= priority:
+            return False
+        self.queued -= 1
+        admission_decisions.inc('shed')
+        victim[2].set_exception(self._overloaded('shed for higher-priority traffic'))
+        return True
+
+    async def acquire(self, costs: Dict[str, int]):
+        """Take quota and a slot for a request with `costs` events per source, or raise AdmissionRejected."""
+        if not self.enabled:
+            self.in_flight += 1
+            return
+        try:
+            self._take(costs)
+        except AdmissionRejected:
+            admission_decisions.inc('rejected_quota')
+            raise
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            admission_decisions.inc('admitted')
+            return
+        priority = self.priority(costs)
+        if self.queued >= self.max_queue and not self._shed_for(priority):
+            self._refund(costs)
+            admission_decisions.inc('rejected_overload')
+            raise self._overloaded('too many detection requests in flight')
+        if len(self._waiters) > 2 * self.max_queue + 16:
+            # drop entries of waiters that timed out or were shed
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._seq), fut))
+        self.queued += 1
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.queued -= 1
+            self._refund(costs)
+            admission_decisions.inc('rejected_timeout')
+            raise self._overloaded('timed out waiting for a detection slot')
+        except AdmissionRejected:
+            # shed by a higher-priority request (already counted)
+            self._refund(costs)
+            raise
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                # the slot was handed over just as the caller went away
+                self.release()
+            elif not fut.done() or fut.cancelled():
+                self.queued -= 1
+            raise
+        admission_wait_seconds.observe(time.monotonic() - t0)
+        admission_decisions.inc('admitted_after_wait')
+
+    def release(self):
+        """Give a slot back, to the best waiter if there is one."""
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.queued -= 1
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, costs: Dict[str, int]):
+        await self.acquire(costs)
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.hold_time += HOLD_ALPHA * (time.monotonic() - t0 - self.hold_time)
+            self.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {'in_flight': self.in_flight, 'queued': self.queued, 'hold_time': self.hold_time,
+                'sources': len(self._buckets)}
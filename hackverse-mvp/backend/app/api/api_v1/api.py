@@ -1,7 +1,9 @@
 from fastapi import APIRouter
-from backend.app.api.api_v1.endpoints import threats, auth, weights
+from backend.app.api.api_v1.endpoints import threats, auth, weights, signatures, detections
 
 api_router = APIRouter()
 api_router.include_router(threats.router, prefix='/threats', tags=['threats'])
 api_router.include_router(auth.router, prefix='/auth', tags=['auth'])
 api_router.include_router(weights.router, prefix='/weights', tags=['weights'])
+api_router.include_router(signatures.router, prefix='/signatures', tags=['signatures'])
+api_router.include_router(detections.router, prefix='/detections', tags=['detections'])
@@ -1,14 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from backend.app.auth import authenticate_user, create_access_token
+from backend.app.auth import authenticate_user_async, create_access_token, require_role, principal_cache, token_cache
 from backend.app.schemas import UserOut
+from backend.app.deps import get_db
 
 router = APIRouter()
 
 @router.post('/token')
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail='Incorrect username or password')
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get('/cache')
+def cache_stats(current_user=Depends(require_role('admin'))):
+    return {'principals': principal_cache.stats(), 'tokens': token_cache.stats()}
@@ -0,0 +1,207 @@
+"""History of stored detections (see detection_store.py).
+
+Listing is keyset-paginated, newest first: `next_cursor` encodes the
+(detected_at, id) of the last row and the next page starts strictly after it,
+so a page costs the same at any depth. Aggregates read the rollup tables
+(detection_rollups.py) and count whole buckets: `since` is rounded down and
+`until` up to a bucket edge (a minute for techniques, an hour for IPs).
+"""
+import datetime
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import false, func, select, true, tuple_, union_all
+
+from backend.app.auth import get_current_user
+from backend.app.deps import get_db
+from backend.app.detection_rollups import IP, TECHNIQUE, floor, spans
+from backend.app.models.detection import Detection, DetectionHour, DetectionMinute
+
+router = APIRouter()
+
+MAX_PAGE = 1000
+DEFAULT_WINDOW = datetime.timedelta(hours=24)
+
+LIST_COLUMNS = (Detection.id, Detection.detected_at, Detection.source, Detection.timestamp, Detection.ip,
+                Detection.user, Detection.event_type, Detection.aggregate_score, Detection.is_threat,
+                Detection.top_technique)
+
+
+def _utc(dt: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # stored timestamps are naive UTC
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _window(since, until):
+    until = _utc(until) or datetime.datetime.utcnow()
+    since = _utc(since) or until - DEFAULT_WINDOW
+    if since > until:
+        raise HTTPException(status_code=422, detail='since must not be after until')
+    return since, until
+
+
+def _encode_cursor(row) -> str:
+    return f"{row.detected_at.isoformat()}_{row.id}"
+
+
+def _decode_cursor(cursor: str):
+    try:
+        at, _, id_ = cursor.rpartition('_')
+        return datetime.datetime.fromisoformat(at), int(id_)
+    except ValueError:
+        raise HTTPException(status_code=422, detail='invalid cursor')
+
+
+def _item(row, detail=False):
+    item = {
+        'id': row.id, 'detected_at': row.detected_at.isoformat(), 'source': row.source, 'timestamp': row.timestamp,
+        'ip': row.ip, 'user': row.user, 'event_type': row.event_type, 'aggregate_score': row.aggregate_score,
+        'is_threat': row.is_threat, 'top_technique': row.top_technique,
+    }
+    if detail:
+        item['features'] = json.loads(row.features) if row.features else None
+        item['result'] = json.loads(row.result) if row.result else None
+    return item
+
+
+@router.get('/')
+def list_detections(
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    technique: Optional[str] = None,
+    ip: Optional[str] = None,
+    user: Optional[str] = None,
+    is_threat: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    detail: bool = False,
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Detections newest first; pass `next_cursor` back as `cursor` for the next page."""
+    conditions = []
+    if since is not None:
+        conditions.append(Detection.detected_at >= _utc(since))
+    if until is not None:
+        conditions.append(Detection.detected_at < _utc(until))
+    if technique is not None:
+        conditions.append(Detection.top_technique == technique)
+    if ip is not None:
+        conditions.append(Detection.ip == ip)
+    if user is not None:
+        conditions.append(Detection.user == user)
+    if is_threat is not None:
+        # literal, so the planner can match the partial index on threats
+        conditions.append(Detection.is_threat == (true() if is_threat else false()))
+    if cursor:
+        at, id_ = _decode_cursor(cursor)
+        conditions.append(tuple_(Detection.detected_at, Detection.id) < tuple_(at, id_))
+    columns = (Detection,) if detail else LIST_COLUMNS
+    q = select(*columns).where(*conditions).order_by(Detection.detected_at.desc(), Detection.id.desc()).limit(limit + 1)
+    rows = db.execute(q).scalars().all() if detail else db.execute(q).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {'items': [_item(r, detail) for r in rows], 'next_cursor': _encode_cursor(rows[-1]) if more else None}
+
+
+@router.get('/stats/techniques')
+def technique_counts(
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    technique: Optional[str] = None,
+    bucket_minutes: int = Query(1, ge=1, le=1440),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Detections per top technique per time bucket (default: per minute over the last 24h)."""
+    since, until = _window(since, until)
+    # whole hours come from the hourly rollup
+    table, unit = (DetectionHour, 'hour') if bucket_minutes % 60 == 0 else (DetectionMinute, 'minute')
+    q = (select(table.bucket, table.technique, table.count, table.threats, table.score_sum, table.max_score)
+         .where(table.bucket >= floor(since, unit), table.bucket < until))
+    if technique is not None:
+        q = q.where(table.technique == technique)
+    width = datetime.timedelta(minutes=bucket_minutes)
+    buckets = {}
+    for at, name, count, threats, score_sum, max_score in db.execute(q.order_by(table.bucket)):
+        start = at - (at - datetime.datetime.min) % width
+        b = buckets.get((start, name))
+        if b is None:
+            b = buckets[(start, name)] = [start, name, 0, 0, 0.0, max_score]
+        b[2] += count
+        b[3] += threats
+        b[4] += score_sum
+        b[5] = max(b[5], max_score)
+    return [
+        {'bucket': start.isoformat(), 'technique': name or None, 'count': count, 'threats': threats,
+         'avg_score': score_sum / count if count else 0.0, 'max_score': max_score}
+        for start, name, count, threats, score_sum, max_score in buckets.values()
+    ]
+
+
+@router.get('/stats/summary')
+def summary(
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Totals and per-technique counts over a window (default: the last 24h)."""
+    since, until = _window(since, until)
+    totals = {}
+    for table, lo, hi in spans(TECHNIQUE, since, until):
+        q = (select(table.technique, func.sum(table.count), func.sum(table.threats), func.sum(table.score_sum),
+                    func.max(table.max_score))
+             .where(table.bucket >= lo, table.bucket < hi)
+             .group_by(table.technique))
+        for name, count, threats, score_sum, max_score in db.execute(q):
+            t = totals.setdefault(name, [0, 0, 0.0, max_score])
+            t[0] += count
+            t[1] += threats
+            t[2] += score_sum
+            t[3] = max(t[3], max_score)
+    per_technique = sorted((
+        {'technique': name or None, 'count': count, 'threats': threats,
+         'avg_score': score_sum / count if count else 0.0, 'max_score': max_score}
+        for name, (count, threats, score_sum, max_score) in totals.items()
+    ), key=lambda r: r['count'], reverse=True)
+    return {
+        'since': since.isoformat(), 'until': until.isoformat(),
+        'count': sum(r['count'] for r in per_technique), 'threats': sum(r['threats'] for r in per_technique),
+        'per_technique': per_technique,
+    }
+
+
+@router.get('/stats/top-ips')
+def top_ips(
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    threats_only: bool = False,
+    limit: int = Query(10, ge=1, le=1000),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Source IPs with the most detections (or threats) over a window."""
+    since, until = _window(since, until)
+    parts = union_all(*(
+        select(table.ip, table.count, table.threats).where(table.bucket >= lo, table.bucket < hi)
+        for table, lo, hi in spans(IP, since, until)
+    )).subquery()
+    count = func.sum(parts.c.count)
+    threats = func.sum(parts.c.threats)
+    q = (select(parts.c.ip, count, threats)
+         .group_by(parts.c.ip)
+         .order_by((threats if threats_only else count).desc())
+         .limit(limit))
+    return [{'ip': ip or None, 'count': int(n), 'threats': int(k)} for ip, n, k in db.execute(q)]
+
+
+@router.get('/{detection_id}')
+def get_detection(detection_id: int, current_user=Depends(get_current_user), db=Depends(get_db)):
+    row = db.get(Detection, detection_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail='detection not found')
+    return _item(row, detail=True)
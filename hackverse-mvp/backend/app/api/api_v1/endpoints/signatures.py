@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+from backend.app.auth import require_role
+from backend.app.ml.signatures import get_engine
+
+router = APIRouter()
+
+
+def _summary(engine):
+    return {'path': str(engine.path), 'version': engine.version, 'rules': len(engine)}
+
+
+@router.get('/')
+def signature_info(current_user=Depends(require_role('admin'))):
+    return _summary(get_engine())
+
+
+@router.post('/reload')
+def reload_signatures(current_user=Depends(require_role('admin'))):
+    # rebuilds in this process; other workers pick the change up from the file's mtime
+    engine = get_engine()
+    engine.reload()
+    return _summary(engine)
@@ -1,16 +1,228 @@
-from fastapi import APIRouter, Depends, HTTPException
-from backend.app.schemas import ThreatEvent, DetectionResult
-from backend.app.ml.ensemble import EnsembleAnalyzer
+import asyncio
+import json
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import ValidationError
+from backend.app import columnar
+from backend.app.admission import AdmissionController, AdmissionRejected
+from backend.app.schemas import MAX_BATCH_EVENTS, ThreatEvent, ThreatEventBatch, DetectionResult
+from backend.app.ml.ensemble import EnsembleAnalyzer, shutdown_agent_pool
+from backend.app.ml.feature_schema import FeatureSchemaError, get_registry
 from backend.app.auth import get_current_user
+from backend.app.deps import get_settings
+from backend.app.detection_store import get_detection_store
+from backend.app.executor import DetectionExecutor
+from backend.app.logger import get_logger
+from backend.app.metrics import detection_store_rows, queue_depth
+from backend.app.streaming import NDJSONStreamingResponse, iter_lines
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 analyzer = EnsembleAnalyzer()
 
+
+def analyze_batch(events):
+    # module-level so the process pool can pickle it by reference
+    return analyzer.analyze_batch(events)
+
+
+settings = get_settings()
+executor = DetectionExecutor.from_settings(analyze_batch, settings)
+feature_schemas = get_registry()
+detection_store = get_detection_store()
+admission = AdmissionController.from_settings(settings)
+
+queue_depth.track(executor.queue_depth, 'detect_executor')
+queue_depth.track(lambda: admission.queued, 'admission')
+queue_depth.track(lambda: admission.in_flight, 'admission_in_flight')
+queue_depth.track(lambda: detection_store.stats()['queued'], 'detection_store')
+for _outcome in ('written', 'dropped', 'spilled', 'replayed', 'failed'):
+    detection_store_rows.track(lambda key=_outcome: detection_store.counters[key], _outcome)
+
+
+@router.on_event('shutdown')
+async def shutdown_executor():
+    await executor.shutdown()
+    shutdown_agent_pool()
+    # after the executor, so detections of drained requests are written too
+    detection_store.close()
+    for agent in analyzer.agents:
+        agent.close()
+
+
+def _rejected(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=429, detail=e.reason, headers={'Retry-After': str(e.retry_after)})
+
+
 @router.post('/detect')
 async def detect(event: ThreatEvent, current_user=Depends(get_current_user)):
+    event = event.dict()
     try:
-        res = analyzer.analyze(event.dict())
+        feature_schemas.validate(event)
+        async with admission.admit({event['source']: 1}):
+            res = await executor.submit(event)
+        await detection_store.arecord([event], [res])
         return res
+    except FeatureSchemaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post('/detect/batch')
+async def detect_batch(batch: ThreatEventBatch, current_user=Depends(get_current_user)):
+    events = [e.dict() for e in batch.events]
+    errors = []
+    for i, event in enumerate(events):
+        try:
+            feature_schemas.validate(event)
+        except FeatureSchemaError as e:
+            errors.append({'index': i, 'error': str(e)})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    try:
+        async with admission.admit(Counter(e['source'] for e in events)):
+            results = await executor.run_batch(events)
+        await detection_store.arecord(events, results)
+        return results
+    except FeatureSchemaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise _rejected(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """The request body, refused with 413 as soon as it is known to exceed `max_bytes`."""
+    too_large = HTTPException(status_code=413, detail=f'request body is larger than {max_bytes} bytes')
+    length = request.headers.get('content-length', '')
+    if length.isdigit() and int(length) > max_bytes:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+@router.post('/detect/columnar')
+async def detect_columnar(request: Request, current_user=Depends(get_current_user)):
+    """Score a msgpack batch of event columns and a float32 feature matrix (see columnar.py)."""
+    if not columnar.available():
+        raise HTTPException(status_code=415, detail='msgpack is not installed on this server')
+    body = await _read_body(request, settings.columnar_max_bytes)
+    try:
+        batch = columnar.decode_batch(body, feature_schemas, MAX_BATCH_EVENTS)
+    except columnar.ColumnarError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FeatureSchemaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        async with admission.admit(Counter(e['source'] for e in batch)):
+            results = await executor.run_batch(batch)
+        await detection_store.arecord(batch, results)
+    except AdmissionRejected as e:
+        raise _rejected(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if columnar.MEDIA_TYPE in request.headers.get('accept', ''):
+        return Response(columnar.encode_results(results, [a.technique for a in analyzer.agents]),
+                        media_type=columnar.MEDIA_TYPE)
+    return results
+
+
+_END = object()
+
+
+async def _read_events(request: Request, queue: asyncio.Queue):
+    """Parse NDJSON events off the request body onto a bounded queue.
+
+    Puts (seq, event, error) tuples; the queue bound is what stops us reading
+    the socket when scoring or the client's reading falls behind.
+    """
+    seq = 0
+    try:
+        async for line, too_long in iter_lines(request.stream(), settings.stream_max_line_bytes):
+            if too_long:
+                await queue.put((seq, None, f'line exceeds {settings.stream_max_line_bytes} bytes'))
+            else:
+                try:
+                    event = ThreatEvent.parse_raw(line).dict()
+                    feature_schemas.validate(event)
+                except ValidationError as e:
+                    await queue.put((seq, None, e.errors()))
+                except FeatureSchemaError as e:
+                    await queue.put((seq, None, str(e)))
+                else:
+                    await queue.put((seq, event, None))
+            seq += 1
+    finally:
+        await queue.put(_END)
+
+
+async def _stream_detections(request: Request):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=settings.stream_chunk_size)
+    reader = asyncio.create_task(_read_events(request, queue))
+    flush_after = settings.stream_flush_ms / 1000.0
+    try:
+        done = False
+        while not done:
+            # score whatever arrived within stream_flush_ms, up to one chunk
+            items = [await queue.get()]
+            deadline = loop.time() + flush_after
+            while len(items) < settings.stream_chunk_size and items[-1] is not _END:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if items[-1] is _END:
+                done = True
+                items.pop()
+            if not items:
+                continue
+            events = [ev for _, ev, _ in items if ev is not None]
+            rejected = None
+            scored = []
+            if events:
+                # each chunk is admitted on its own; a rejected chunk is reported per line and the stream goes on
+                try:
+                    async with admission.admit(Counter(e['source'] for e in events)):
+                        scored = await executor.run_batch(events)
+                except AdmissionRejected as e:
+                    rejected = {'error': e.reason, 'retry_after': e.retry_after}
+                except Exception as e:
+                    # a chunk that fails to score is reported per line like a rejected one; the stream goes on
+                    logger.exception('scoring a stream chunk failed')
+                    rejected = {'error': str(e)}
+                else:
+                    await detection_store.arecord(events, scored)
+            results = iter(scored)
+            lines = []
+            for seq, ev, err in items:
+                if ev is None:
+                    lines.append(json.dumps({'seq': seq, 'error': err}, default=str))
+                elif rejected is not None:
+                    lines.append(json.dumps({'seq': seq, **rejected}))
+                else:
+                    lines.append(json.dumps({'seq': seq, **next(results)}))
+            yield ('\n'.join(lines) + '\n').encode()
+        # surface body errors (e.g. ClientDisconnect) from the reader
+        await reader
+    finally:
+        reader.cancel()
+
+
+@router.post('/detect/stream')
+async def detect_stream(request: Request, current_user=Depends(get_current_user)):
+    """Score a chunked NDJSON body of ThreatEvents; streams one NDJSON result per input line, in order."""
+    return NDJSONStreamingResponse(_stream_detections(request))
@@ -1,58 +1,73 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from backend.app.ml.ensemble import AgentWeight
+from backend.app.ml.weight_store import bump_weight_version, weight_store
 from backend.app.ml.agents import ALL_AGENTS
-from backend.app.database import SessionLocal, init_db
+from backend.app.database import init_db
+from backend.app.deps import get_db
+from backend.app.schemas import WeightItem
 from backend.app.auth import require_role, get_current_user
 
 router = APIRouter()
 
 
 @router.get('/', response_model=List[dict])
-def list_weights(current_user=Depends(get_current_user)):
-    db = SessionLocal()
-    items = []
-    try:
-        for w in db.query(AgentWeight).all():
-            items.append({'technique': w.technique, 'weight': float(w.weight)})
-    finally:
-        db.close()
+def list_weights(current_user=Depends(get_current_user), db=Depends(get_db)):
+    items = [{'technique': w.technique, 'weight': float(w.weight)} for w in db.query(AgentWeight).all()]
     # if empty, return defaults
     if not items:
         items = [{'technique': a.technique, 'weight': 1.0} for a in ALL_AGENTS]
     return items
 
 
+@router.put('/')
+def update_weights(items: List[WeightItem], current_user=Depends(require_role('admin')), db=Depends(get_db)):
+    """Update many techniques in one transaction (one weight version bump)."""
+    new = {i.technique: float(i.weight) for i in items}
+    existing = {w.technique: w for w in db.query(AgentWeight).filter(AgentWeight.technique.in_(list(new))).all()}
+    for technique, wval in new.items():
+        if technique in existing:
+            existing[technique].weight = wval
+        else:
+            db.add(AgentWeight(technique=technique, weight=wval))
+    bump_weight_version(db)
+    db.commit()
+    weight_store.refresh()
+    return [{'technique': t, 'weight': w} for t, w in new.items()]
+
+
 @router.put('/{technique}')
-def update_weight(technique: str, payload: dict, current_user=Depends(require_role('admin'))):
+def update_weight(technique: str, payload: dict, current_user=Depends(require_role('admin')), db=Depends(get_db)):
     if 'weight' not in payload:
         raise HTTPException(status_code=400, detail='weight required')
-    wval = float(payload['weight'])
-    db = SessionLocal()
     try:
-        w = db.query(AgentWeight).filter(AgentWeight.technique == technique).first()
-        if not w:
-            w = AgentWeight(technique=technique, weight=wval)
-            db.add(w)
-        else:
-            w.weight = wval
-        db.commit()
-    finally:
-        db.close()
+        wval = float(payload['weight'])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail='weight must be a number')
+    # same rule as WeightItem on the bulk route; the cascade's bounds assume it
+    if not wval >= 0:
+        raise HTTPException(status_code=422, detail='weight must be >= 0')
+    w = db.query(AgentWeight).filter(AgentWeight.technique == technique).first()
+    if not w:
+        w = AgentWeight(technique=technique, weight=wval)
+        db.add(w)
+    else:
+        w.weight = wval
+    bump_weight_version(db)
+    db.commit()
+    weight_store.refresh()
     return {'technique': technique, 'weight': wval}
 
 
 @router.post('/reset')
-def reset_weights(current_user=Depends(require_role('admin'))):
+def reset_weights(current_user=Depends(require_role('admin')), db=Depends(get_db)):
     # create table and seed defaults
     init_db()
-    db = SessionLocal()
-    try:
-        # clear existing
-        db.query(AgentWeight).delete()
-        for a in ALL_AGENTS:
-            db.add(AgentWeight(technique=a.technique, weight=1.0))
-        db.commit()
-    finally:
-        db.close()
+    # clear existing
+    db.query(AgentWeight).delete()
+    for a in ALL_AGENTS:
+        db.add(AgentWeight(technique=a.technique, weight=1.0))
+    bump_weight_version(db)
+    db.commit()
+    weight_store.refresh()
     return {'status': 'seeded'}
@@ -1,21 +1,36 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 import os
+import hashlib
+import time
 from backend.app.models.user import User
 from backend.app.database import SessionLocal
+from backend.app.cache import TTLCache
+from backend.app.hashing import pwd_context, PasswordPool, PasswordPoolOverloaded
+from backend.app.deps import get_settings, get_db
+from backend.app.metrics import auth_seconds, track_cache
 
 SECRET_KEY = os.getenv('HACKVERSE_SECRET', 'change-this-secret')
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
+settings = get_settings()
+# username -> User loaded from the DB. Entries are dropped via invalidate_principal()
+# whenever a User row is written in this process; other worker processes pick up
+# the change when the entry's TTL runs out.
+principal_cache = TTLCache(maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl)
+# sha256(token) -> username, so repeated requests with the same JWT skip verification
+token_cache = TTLCache(maxsize=settings.token_cache_size, ttl=settings.principal_cache_ttl)
+track_cache('principals', principal_cache)
+track_cache('tokens', token_cache)
+password_pool = PasswordPool(workers=settings.password_workers, max_pending=settings.password_max_pending)
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -42,6 +57,35 @@ def authenticate_user(username: str, password: str):
         return False
     return user
 
+def _overloaded():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent password operations, retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def authenticate_user_async(db, username: str, password: str):
+    """authenticate_user with bcrypt on the password pool; 503 when the pool is saturated."""
+    user = get_user(db, username)
+    if not user:
+        return False
+    try:
+        ok = await password_pool.verify(password, user.hashed_password)
+    except PasswordPoolOverloaded:
+        raise _overloaded()
+    if not ok:
+        return False
+    return user
+
+
+async def get_password_hash_async(password: str) -> str:
+    try:
+        return await password_pool.hash(password)
+    except PasswordPoolOverloaded:
+        raise _overloaded()
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -52,24 +96,43 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def invalidate_principal(username: str):
+    """Drop a cached principal; call after any write to that user's row."""
+    principal_cache.pop(username)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    t0 = time.perf_counter()
+    token_key = hashlib.sha256(token.encode()).digest()
+    username = token_cache.get(token_key)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    db = SessionLocal()
+        # never keep a token cached past its own expiry
+        remaining = payload.get("exp", 0) - time.time()
+        if remaining > 0:
+            token_cache.set(token_key, username, ttl=min(token_cache.ttl, remaining))
+    user = principal_cache.get(username)
+    if user is not None:
+        auth_seconds.observe(time.perf_counter() - t0, 'cache')
+        return user
     user = get_user(db, username=username)
-    db.close()
     if user is None:
         raise credentials_exception
+    # detach so a commit later in this request cannot expire the shared cached instance
+    db.expunge(user)
+    principal_cache.set(username, user)
+    auth_seconds.observe(time.perf_counter() - t0, 'db')
     return user
 
 
@@ -0,0 +1,162 @@
+"""Columnar msgpack batches for /api/v1/threats/detect/columnar.
+
+A request body is one msgpack map of columns, all with one entry per event:
+
+    {"source": [...], "ip": [...], "user": [...], "event_type": [...],
+     "timestamp": [...],                      # optional
+     "feature_names": ["f0", "f1", ...],
+     "features": <bytes>}                     # n x len(feature_names) little-endian float32, row-major
+
+A string column may also be a single string, shared by every event. The
+feature matrix goes into the EventBatch as is (columns reordered to a
+source's registered schema where there is one), so no per-event feature
+dict is built or validated one value at a time; agents read the matrix. The
+per-event dicts carry the string fields and a read-only RowFeatures view of
+their row for the few consumers that want features by name (baselines, the
+detection store).
+
+With `Accept: application/x-msgpack` results come back as columns too:
+
+    {"n": n, "techniques": [...],
+     "aggregate_score": <float32 bytes>, "is_threat": [...], "top_technique": [...],
+     "scores": <bytes>}                       # n x len(techniques) float32, row-major
+
+with a NaN score where an agent did not run for an event (cascade mode,
+missed deadlines); agents' details are left out (the JSON response has them).
+
+msgpack is imported on first use; without it the route answers 415.
+"""
+from typing import Any, Dict, List, Mapping
+
+import numpy as np
+
+from backend.app.ml.feature_schema import EventBatch, FeatureSchema, FeatureSchemaError, FeatureSchemaRegistry
+
+MEDIA_TYPE = 'application/x-msgpack'
+STRING_COLUMNS = ('source', 'ip', 'user', 'event_type', 'timestamp')
+
+
+class ColumnarError(ValueError):
+    pass
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def available() -> bool:
+    return _msgpack() is not None
+
+
+class RowFeatures(Mapping):
+    """{name: value} view of one row of the batch matrix."""
+    __slots__ = ('names', 'row')
+
+    def __init__(self, names: Dict[str, int], row: np.ndarray):
+        self.names = names
+        self.row = row
+
+    def __getitem__(self, name):
+        return float(self.row[self.names[name]])
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _column(body: Dict[str, Any], name: str, n: int) -> List[Any]:
+    values = body.get(name, '' if name == 'timestamp' else None)
+    if isinstance(values, str):
+        return [values] * n
+    if not isinstance(values, list) or len(values) != n or not all(isinstance(v, str) for v in values):
+        raise ColumnarError(f"column {name!r} must be a string or a list of {n} strings")
+    return values
+
+
+def decode_batch(data: bytes, registry: FeatureSchemaRegistry, max_events: int) -> EventBatch:
+    """Body bytes to an EventBatch; ColumnarError for a malformed body, FeatureSchemaError for bad features."""
+    msgpack = _msgpack()
+    try:
+        body = msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise ColumnarError(f"body is not valid msgpack: {e}")
+    if not isinstance(body, dict):
+        raise ColumnarError('body must be a map of columns')
+    names = body.get('feature_names') or []
+    if not isinstance(names, list) or not all(isinstance(f, str) for f in names) or len(set(names)) != len(names):
+        raise ColumnarError('feature_names must be a list of distinct strings')
+    raw = body.get('features') or b''
+    if not isinstance(raw, bytes) or (names and len(raw) % (4 * len(names))) or (raw and not names):
+        raise ColumnarError(f"features must be n x {len(names)} float32 values as bytes")
+    M = np.frombuffer(raw, dtype='<f4').reshape(-1, len(names)) if names else None
+    sources = body.get('source')
+    n = len(M) if M is not None else len(sources) if isinstance(sources, list) else 0
+    if not 0 < n <= max_events:
+        raise ColumnarError(f"a batch has 1 to {max_events} events")
+    columns = {name: _column(body, name, n) for name in STRING_COLUMNS}
+    # a writable copy: frombuffer arrays are read-only views of the body
+    X = M.copy() if M is not None else np.empty((n, 0), dtype=np.float32)
+    bad = np.flatnonzero(~np.isfinite(X).all(axis=1))
+    if len(bad):
+        raise FeatureSchemaError(f"features must be finite numbers (rows {bad[:10].tolist()})")
+
+    # one layout per distinct source: its registered schema (columns reordered to it) or the columns as sent
+    sent = FeatureSchema('columnar', names)
+    schemas = [None] * n
+    by_source: Dict[str, List[int]] = {}
+    for i, s in enumerate(columns['source']):
+        by_source.setdefault(s, []).append(i)
+    for source, rows in by_source.items():
+        registry.check_width(len(names), source)
+        schema = registry.get(source)
+        if schema is None:
+            if registry.strict:
+                raise FeatureSchemaError(f"no feature schema registered for source {source!r}")
+            schema = sent
+        else:
+            schema.validate(sent.index)
+            if schema.features != sent.features:
+                X[rows] = M[rows][:, [sent.index[f] for f in schema.features]]
+        for i in rows:
+            schemas[i] = schema
+
+    events = []
+    src, ip, user, event_type, timestamp = (columns[c] for c in STRING_COLUMNS)
+    for i in range(n):
+        events.append({'source': src[i], 'timestamp': timestamp[i], 'ip': ip[i], 'user': user[i],
+                       'event_type': event_type[i], 'features': RowFeatures(schemas[i].index, X[i])})
+    return EventBatch(events, X, np.full(n, len(names), dtype=np.intp), schemas)
+
+
+def encode_results(results: List[Dict[str, Any]], techniques: List[str]) -> bytes:
+    """Ensemble results as one msgpack map of columns; NaN scores for agents that did not run (cascade, deadlines)."""
+    index = {t: j for j, t in enumerate(techniques)}
+    scores = np.full((len(results), len(techniques)), np.nan, dtype='<f4')
+    for i, r in enumerate(results):
+        for p in r['per_technique']:
+            j = index.get(p['technique'])
+            if j is not None:
+                scores[i, j] = p.get('score', 0.0)
+    return _msgpack().packb({
+        'n': len(results),
+        'techniques': techniques,
+        'aggregate_score': np.array([r['aggregate_score'] for r in results], dtype='<f4').tobytes(),
+        'is_threat': [bool(r['is_threat']) for r in results],
+        'top_technique': [(r.get('top_technique') or {}).get('technique') for r in results],
+        'scores': scores.tobytes(),
+    })
+
+
+def encode_batch(events: List[Dict[str, Any]]) -> bytes:
+    """The columnar request body for `events` (ThreatEvent-shaped dicts with the same feature names), e.g. for clients."""
+    names = list(events[0]['features']) if events else []
+    X = np.array([[e['features'][f] for f in names] for e in events], dtype='<f4').reshape(len(events), len(names))
+    body = {c: [e.get(c, '') for e in events] for c in STRING_COLUMNS}
+    body.update(feature_names=names, features=X.tobytes())
+    return _msgpack().packb(body)
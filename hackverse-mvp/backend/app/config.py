@@ -1,6 +1,6 @@
 import os
 from pydantic import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     app_name: str = "HACKVERSE"
@@ -8,6 +8,96 @@ class Settings(BaseSettings):
     secret_key: str = os.getenv('HACKVERSE_SECRET', 'change-this-secret')
     access_token_expire_minutes: int = 60
     cors_origins: List[str] = ["http://localhost:3000"]
+    # connection pool and SQLite tuning
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456
+    # per-source feature layouts (defaults to ml/feature_schemas.json); strict rejects unregistered sources
+    feature_schema_path: str = ''
+    feature_schema_strict: bool = False
+    # model registry directory (defaults to ml/models/registry) and how often CURRENT is re-read (s)
+    model_registry_path: str = ''
+    model_check_interval: float = 5.0
+    # 'full' runs every agent; 'cascade' runs cheapest first and stops once the verdict is settled;
+    # 'concurrent' runs agents at once on a shared thread pool, each against a deadline
+    ensemble_mode: str = 'full'
+    # concurrent mode: pool threads, default per-agent deadline (ms), per-technique overrides (JSON,
+    # e.g. {"EDR": 20}) and the measured cost per call (us) under which an agent runs inline instead
+    ensemble_workers: int = 8
+    agent_deadline_ms: float = 100.0
+    agent_deadlines_ms: Dict[str, float] = {}
+    ensemble_inline_us: float = 50.0
+    # per-agent result caches keyed by the agent's cache_fields: entries per agent (0 disables) and TTL (s)
+    agent_cache_size: int = 100000
+    agent_cache_ttl: float = 300.0
+    # detection executor: 'thread' or 'process' worker pool fed by micro-batches
+    detect_executor: str = 'thread'
+    detect_workers: int = 4
+    detect_max_batch_size: int = 64
+    detect_max_wait_ms: float = 2.0
+    detect_queue_size: int = 10000
+    # NDJSON streaming: events scored per chunk, max wait to fill one, max line length
+    stream_chunk_size: int = 256
+    stream_flush_ms: float = 50.0
+    stream_max_line_bytes: int = 1048576
+    # columnar batches: largest request body read (bytes); larger ones get 413
+    columnar_max_bytes: int = 33554432
+    # authenticated principal / verified token caches (seconds, entries)
+    principal_cache_ttl: float = 60.0
+    principal_cache_size: int = 10000
+    token_cache_size: int = 50000
+    # bcrypt process pool: concurrent hashes, and total calls allowed to wait
+    password_workers: int = 2
+    password_max_pending: int = 32
+    # IOC index directory built by `python -m backend.app.ml.ioc_index` (defaults to ml/models/ioc)
+    # and how often its meta.json mtime is checked for a rebuilt index (s)
+    ioc_index_path: str = ''
+    ioc_check_interval: float = 5.0
+    # how often each process checks the shared weight version (ms)
+    weight_check_interval_ms: float = 500.0
+    # signature rules JSON (defaults to ml/rules/signatures.json) and how often its mtime is checked (s)
+    signature_rules_path: str = ''
+    signature_check_interval: float = 5.0
+    # SIEM correlation rules JSON (defaults to ml/rules/correlations.json), ring-buffer buckets per window,
+    # lock shards and keys kept per rule
+    correlation_enabled: bool = True
+    correlation_rules_path: str = ''
+    correlation_buckets: int = 10
+    correlation_shards: int = 16
+    correlation_max_keys: int = 1000000
+    # per-entity behavioral baselines: lock shards, LRU bound, idle TTL (s), snapshot file (defaults to
+    # ml/models/baselines.pkl) and snapshot period (s, 0 = only on shutdown)
+    baseline_shards: int = 16
+    baseline_max_entities: int = 1000000
+    baseline_ttl: float = 604800.0
+    baseline_snapshot_path: str = ''
+    baseline_snapshot_interval: float = 300.0
+    # detection store: write-behind queue bound, rows per insert transaction, max delay before a flush (ms),
+    # full-queue policy ('drop', 'block' or 'spill'), how long 'block' waits (s) and the spill file
+    # (defaults to ./detections.spill.ndjson)
+    detection_store_enabled: bool = True
+    detection_queue_size: int = 50000
+    detection_batch_size: int = 500
+    detection_flush_ms: float = 500.0
+    detection_overflow: str = 'drop'
+    detection_block_timeout: float = 1.0
+    detection_spill_path: str = ''
+    # admission control for the detection routes (see admission.py): requests scored at once, how many may
+    # wait and for how long (ms), per-source token buckets (events/s and burst, 0 = unlimited / one second's
+    # worth; per-source rates as JSON) and per-source priority classes (JSON, higher is shed later)
+    admission_enabled: bool = True
+    admission_max_in_flight: int = 64
+    admission_max_queue: int = 256
+    admission_queue_timeout_ms: float = 100.0
+    admission_source_rate: float = 0.0
+    admission_source_burst: float = 0.0
+    admission_source_rates: Dict[str, float] = {}
+    admission_priorities: Dict[str, int] = {}
+    # per-thread hot-path metrics served on /metrics (see metrics.py)
+    metrics_enabled: bool = True
 
     class Config:
         env_file = '.env'
@@ -1,8 +1,76 @@
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from backend.app.config import Settings
+from backend.app.metrics import db_seconds
 from backend.app.models.user import Base
 
-engine = create_engine('sqlite:///hackverse.db', connect_args={"check_same_thread": False})
+settings = Settings()
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers proceed while a writer commits; NORMAL sync is durable in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}')
+    cursor.execute(f'PRAGMA mmap_size={int(settings.sqlite_mmap_size)}')
+    cursor.close()
+
+
+STATEMENTS = {'select', 'insert', 'update', 'delete', 'with'}
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    # on the statement's execution context, which is dropped with it whether or not the statement
+    # succeeds (after_cursor_execute only runs on success)
+    if context is not None:
+        context._statement_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_statement_start', None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    head = statement.lstrip()[:7].split(None, 1)
+    kind = head[0].lower() if head else ''
+    db_seconds.observe(seconds, kind if kind in STATEMENTS else 'other')
+
+
+def _instrument(eng):
+    event.listen(eng, 'before_cursor_execute', _before_execute)
+    event.listen(eng, 'after_cursor_execute', _after_execute)
+    return eng
+
+
+def make_engine(url: str):
+    if url.startswith('sqlite'):
+        connect_args = {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000.0}
+        if ':memory:' in url or url.rstrip('/') == 'sqlite:':
+            # in-memory databases live in a single connection; keep SQLAlchemy's default pool
+            return _instrument(create_engine(url, connect_args=connect_args))
+        eng = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+        event.listen(eng, 'connect', _sqlite_pragmas)
+        return _instrument(eng)
+    return _instrument(create_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=True,
+        pool_recycle=settings.db_pool_recycle,
+    ))
+
+
+engine = make_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
@@ -0,0 +1,126 @@
+"""Time-bucketed rollups of the detections table.
+
+Each rollup counts detections per key per bucket at two resolutions:
+
+    technique  detection_rollup_minute, detection_rollup_hour
+    ip         detection_rollup_ip_hour, detection_rollup_ip_day
+
+update_rollups() folds a batch of new detection rows into all of them with
+one upsert per table (INSERT ... ON CONFLICT on SQLite and PostgreSQL; on
+other databases an UPDATE per rollup row, then an INSERT if it matched
+nothing), inside the transaction that inserts the rows, so the rollups always
+match the table. Queries cover a time range with spans(): the
+coarse table for the whole coarse buckets in the middle, the fine table for
+the partial ones at the edges. Their cost grows with the number of (bucket,
+key) rows in the range, never with the number of detections.
+"""
+import datetime
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import and_, case, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from backend.app.models.detection import DetectionHour, DetectionIpDay, DetectionIpHour, DetectionMinute
+
+UNITS = {
+    'minute': datetime.timedelta(minutes=1),
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+}
+
+# (key, fine table, fine unit, coarse table, coarse unit)
+TECHNIQUE = ('technique', DetectionMinute, 'minute', DetectionHour, 'hour')
+IP = ('ip', DetectionIpHour, 'hour', DetectionIpDay, 'day')
+
+
+def floor(at: datetime.datetime, unit: str) -> datetime.datetime:
+    at = at.replace(second=0, microsecond=0)
+    if unit == 'minute':
+        return at
+    at = at.replace(minute=0)
+    return at if unit == 'hour' else at.replace(hour=0)
+
+
+def ceil(at: datetime.datetime, unit: str) -> datetime.datetime:
+    start = floor(at, unit)
+    return start if start == at else start + UNITS[unit]
+
+
+def spans(rollup, since: datetime.datetime, until: datetime.datetime) -> List[Tuple[Any, datetime.datetime, datetime.datetime]]:
+    """(table, start, end) pieces covering [since, until) in whole fine buckets.
+
+    Rows are selected by bucket >= start and bucket < end, so the bucket
+    containing `until` is included whole.
+    """
+    _, fine, fine_unit, coarse, coarse_unit = rollup
+    since = floor(since, fine_unit)
+    lo, hi = ceil(since, coarse_unit), floor(until, coarse_unit)
+    if lo >= hi:
+        return [(fine, since, until)]
+    pieces = [(fine, since, lo), (coarse, lo, hi), (fine, hi, until)]
+    return [(table, a, b) for table, a, b in pieces if a < b]
+
+
+def _upsert(db, table, keys, rows, add, greatest=()):
+    """INSERT rows, or add their `add` columns to (and max their `greatest` columns into) existing ones."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        return _update_or_insert(db, table.__table__, keys, rows, add, greatest)
+    t = table.__table__
+    stmt = upsert(t)
+    new = stmt.excluded
+    updates = {c: t.c[c] + new[c] for c in add}
+    updates.update({c: case((new[c] > t.c[c], new[c]), else_=t.c[c]) for c in greatest})
+    db.execute(stmt.on_conflict_do_update(index_elements=keys, set_=updates), rows)
+
+
+def _update_or_insert(db, t, keys, rows, add, greatest):
+    """Portable _upsert: UPDATE each row's bucket, INSERT it where none existed."""
+    for row in rows:
+        values = {c: t.c[c] + row[c] for c in add}
+        values.update({c: case((t.c[c] < row[c], row[c]), else_=t.c[c]) for c in greatest})
+        stmt = update(t).where(and_(*(t.c[k] == row[k] for k in keys))).values(values)
+        if db.execute(stmt).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(insert(t).values(row))
+        except IntegrityError:
+            # another writer inserted the bucket in between
+            db.execute(stmt)
+
+
+def _fold(rows, key: str, unit: str, scores: bool) -> List[Dict[str, Any]]:
+    field = 'top_technique' if key == 'technique' else key
+    out: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        bucket = floor(row['detected_at'], unit)
+        value = row[field] or ''
+        agg = out.get((bucket, value))
+        if agg is None:
+            agg = out[(bucket, value)] = {'bucket': bucket, key: value, 'count': 0, 'threats': 0}
+            if scores:
+                agg['score_sum'] = 0.0
+                agg['max_score'] = row['aggregate_score']
+        agg['count'] += 1
+        agg['threats'] += 1 if row['is_threat'] else 0
+        if scores:
+            agg['score_sum'] += row['aggregate_score']
+            agg['max_score'] = max(agg['max_score'], row['aggregate_score'])
+    return list(out.values())
+
+
+def update_rollups(db, rows: List[Dict[str, Any]]):
+    """Add a batch of detection rows (as inserted) to every rollup table."""
+    for key, fine, fine_unit, coarse, coarse_unit in (TECHNIQUE, IP):
+        scores = key == 'technique'
+        for table, unit in ((fine, fine_unit), (coarse, coarse_unit)):
+            _upsert(db, table, ['bucket', key], _fold(rows, key, unit, scores),
+                    ('count', 'threats', 'score_sum') if scores else ('count', 'threats'),
+                    ('max_score',) if scores else ())
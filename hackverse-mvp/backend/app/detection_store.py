@@ -0,0 +1,329 @@
+"""Write-behind store for detection results.
+
+Requests only put (event, result, time) on a bounded in-memory queue; a
+background thread turns them into rows and inserts up to `batch_size` rows per
+transaction, at most `flush_ms` after the first of them arrived. Persistence
+therefore costs a request one queue put.
+
+When the queue is full the overflow policy decides:
+  drop   discard the detection and count it (the default; scoring never waits)
+  block  wait up to `block_timeout` seconds for room, then drop; async callers
+         wait on a thread, not on the event loop
+  spill  append it to a local NDJSON file, which the writer loads into the
+         database once the queue has drained; async callers write it from a
+         thread, not from the event loop
+With `spill`, batches the database rejects are spilled too; otherwise they are
+counted as failed. close() writes everything still queued before returning.
+
+Each insert transaction also folds the batch into the rollup tables
+(detection_rollups.py) that the history API's aggregates read.
+"""
+import asyncio
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from backend.app.database import SessionLocal
+from backend.app.detection_rollups import update_rollups
+from backend.app.logger import get_logger
+from backend.app.models.detection import Detection
+
+logger = get_logger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'block', 'spill')
+# seconds before retrying a spill file the database rejected
+REPLAY_RETRY = 5.0
+
+
+def to_row(event: Dict[str, Any], result: Dict[str, Any], at: float) -> Dict[str, Any]:
+    top = result.get('top_technique') or {}
+    features = event.get('features')
+    if features is not None and not isinstance(features, dict):
+        # a view over a columnar batch's matrix (columnar.RowFeatures)
+        features = dict(features)
+    return {
+        'detected_at': datetime.datetime.utcfromtimestamp(at),
+        'source': event.get('source'),
+        'timestamp': event.get('timestamp'),
+        'ip': event.get('ip'),
+        'user': event.get('user'),
+        'event_type': event.get('event_type'),
+        'features': json.dumps(features, default=str),
+        'aggregate_score': float(result.get('aggregate_score', 0.0)),
+        'is_threat': bool(result.get('is_threat')),
+        'top_technique': top.get('technique'),
+        'result': json.dumps(result, default=str),
+    }
+
+
+class DetectionStore:
+    def __init__(self, session_factory=SessionLocal, batch_size: int = 500, flush_ms: float = 500.0,
+                 max_queue: int = 50000, overflow: str = 'drop', block_timeout: float = 1.0,
+                 spill_path: Optional[str] = None, enabled: bool = True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_ms) / 1000.0
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.spill_path = Path(spill_path or 'detections.spill.ndjson')
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread = None
+        self._closing = threading.Event()
+        self._next_replay = 0.0
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        # flush() waits until everything accepted so far has been handled
+        self._cond = threading.Condition()
+        self._accepted = 0
+        self._handled = 0
+        self.counters = {'written': 0, 'batches': 0, 'dropped': 0, 'spilled': 0, 'replayed': 0, 'failed': 0}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            batch_size=settings.detection_batch_size,
+            flush_ms=settings.detection_flush_ms,
+            max_queue=settings.detection_queue_size,
+            overflow=settings.detection_overflow,
+            block_timeout=settings.detection_block_timeout,
+            spill_path=settings.detection_spill_path or None,
+            enabled=settings.detection_store_enabled,
+        )
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='detection-store', daemon=True)
+                    self._thread.start()
+
+    def _items(self, events, results) -> List[tuple]:
+        now = time.time()
+        # failed events have an exception in their result slot
+        return [(e, r, now) for e, r in zip(events, results) if isinstance(r, dict)]
+
+    def _offer(self, items) -> List[tuple]:
+        """Queue what fits without waiting; returns the rest."""
+        for i, item in enumerate(items):
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._count_accepted(i)
+                return items[i:]
+        self._count_accepted(len(items))
+        return []
+
+    def _count_accepted(self, n: int):
+        if n:
+            with self._cond:
+                self._accepted += n
+
+    def _put_blocking(self, items):
+        deadline = time.monotonic() + self.block_timeout
+        for i, item in enumerate(items):
+            try:
+                self._queue.put(item, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                self._count_accepted(i)
+                self._drop(len(items) - i)
+                return
+        self._count_accepted(len(items))
+
+    def _drop(self, n: int):
+        before = self.counters['dropped']
+        self.counters['dropped'] += n
+        if before == 0 or before // 1000 != self.counters['dropped'] // 1000:
+            logger.warning('detection store queue full, %d detections dropped so far', self.counters['dropped'])
+
+    def _overflow(self, items):
+        if self.overflow == 'spill':
+            self._spill([to_row(*item) for item in items])
+        else:
+            self._drop(len(items))
+
+    def record(self, events, results):
+        """Queue detections for writing; may block only under the 'block' policy."""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        rest = self._offer(self._items(events, results))
+        if rest:
+            if self.overflow == 'block':
+                self._put_blocking(rest)
+            else:
+                self._overflow(rest)
+
+    async def arecord(self, events, results):
+        """record() for the event loop: the 'block' wait and the 'spill' file write happen on a worker thread."""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        rest = self._offer(self._items(events, results))
+        if rest:
+            if self.overflow == 'drop':
+                self._drop(len(rest))
+            else:
+                fn = self._put_blocking if self.overflow == 'block' else self._overflow
+                await asyncio.get_running_loop().run_in_executor(None, fn, rest)
+
+    def _next_batch(self) -> List[tuple]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval or 0.05)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0 and not self._closing.is_set():
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, rows: List[Dict[str, Any]]):
+        db = self.session_factory()
+        try:
+            db.execute(insert(Detection.__table__), rows)
+            update_rollups(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write(self, batch: List[tuple]):
+        rows = [to_row(*item) for item in batch]
+        try:
+            self._insert(rows)
+        except Exception as e:
+            if self.overflow == 'spill':
+                logger.warning('detection insert failed, spilling %d rows: %s', len(rows), e)
+                self._spill(rows)
+            else:
+                logger.warning('detection insert failed, %d rows lost: %s', len(rows), e)
+                self.counters['failed'] += len(rows)
+        else:
+            self.counters['written'] += len(rows)
+            self.counters['batches'] += 1
+        finally:
+            with self._cond:
+                self._handled += len(batch)
+                self._cond.notify_all()
+
+    def _spill(self, rows: List[Dict[str, Any]]):
+        with self._spill_lock:
+            with self.spill_path.open('a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + '\n')
+            self.counters['spilled'] += len(rows)
+
+    def _replay_path(self) -> Path:
+        return self.spill_path.with_name(self.spill_path.name + '.replay')
+
+    def replay_spill(self):
+        """Insert spilled rows, batch_size at a time; what fails stays on disk for the next try."""
+        replay = self._replay_path()
+        with self._spill_lock:
+            if not replay.exists():
+                if not self.spill_path.exists():
+                    return
+                os.replace(self.spill_path, replay)
+        with replay.open('r', encoding='utf-8') as f:
+            lines = []
+            for line in f:
+                if line.strip():
+                    lines.append(line)
+                if len(lines) >= self.batch_size:
+                    if not self._replay_batch(lines, f, replay):
+                        return
+                    lines = []
+            if lines and not self._replay_batch(lines, f, replay):
+                return
+        replay.unlink()
+        logger.info('replayed spilled detections from %s', replay)
+
+    def _replay_batch(self, lines: List[str], rest, replay: Path) -> bool:
+        rows = []
+        for line in lines:
+            row = json.loads(line)
+            row['detected_at'] = datetime.datetime.fromisoformat(row['detected_at'])
+            rows.append(row)
+        try:
+            self._insert(rows)
+        except Exception as e:
+            # keep this batch and everything after it, so no row is inserted twice
+            logger.warning('could not replay spilled detections from %s: %s', replay, e)
+            tmp = replay.with_name(replay.name + '.tmp')
+            with tmp.open('w', encoding='utf-8') as out:
+                out.writelines(lines)
+                for line in rest:
+                    out.write(line)
+            os.replace(tmp, replay)
+            self._next_replay = time.monotonic() + REPLAY_RETRY
+            return False
+        self.counters['replayed'] += len(rows)
+        return True
+
+    def _spilled_pending(self) -> bool:
+        return self.spill_path.exists() or self._replay_path().exists()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            if not self._queue.empty():
+                continue
+            closing = self._closing.is_set()
+            if self.overflow == 'spill' and (closing or time.monotonic() >= self._next_replay) and self._spilled_pending():
+                self.replay_spill()
+            if closing:
+                break
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every detection queued so far is written (or spilled/failed)."""
+        with self._cond:
+            target = self._accepted
+            return self._cond.wait_for(lambda: self._handled >= target, timeout)
+
+    def close(self, timeout: float = 30.0):
+        """Write what is still queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._closing.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning('detection store did not drain in %.0fs, %d detections left', timeout, self._queue.qsize())
+        logger.info('detection store closed: %s', self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, queued=self._queue.qsize(), overflow=self.overflow)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_detection_store() -> DetectionStore:
+    """Process-wide store (batching, queue bound and overflow policy from settings)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from backend.app.deps import get_settings
+                _store = DetectionStore.from_settings(get_settings())
+    return _store
@@ -0,0 +1,144 @@
+"""Detection executor: runs CPU-bound scoring off the asyncio event loop.
+
+Single-event requests go onto a bounded asyncio.Queue. A dispatcher task
+coalesces them into micro-batches of up to `max_batch_size` events, waiting at
+most `max_wait_ms` after the first one, and runs each batch on a thread or
+process pool. Each caller awaits a future that resolves to its own result, so
+the per-request API does not change.
+
+`batch_fn(events) -> results` must return one result per event, in order. A
+result that is an Exception instance is raised to that event's caller only.
+In 'process' mode `batch_fn` must be picklable (a module-level function).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class DetectionExecutor:
+    def __init__(self, batch_fn: Callable[[List[Dict[str, Any]]], List[Any]], max_batch_size: int = 64,
+                 max_wait_ms: float = 2.0, max_queue: int = 10000, workers: int = 4, mode: str = 'thread'):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"unknown executor mode: {mode}")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue = max_queue
+        self.workers = max(1, workers)
+        self.mode = mode
+        self._loop = None
+        self._queue = None
+        self._pool = None
+        self._dispatcher = None
+        self._slots = None
+        self._running = set()
+
+    @classmethod
+    def from_settings(cls, batch_fn, settings):
+        return cls(
+            batch_fn,
+            max_batch_size=settings.detect_max_batch_size,
+            max_wait_ms=settings.detect_max_wait_ms,
+            max_queue=settings.detect_queue_size,
+            workers=settings.detect_workers,
+            mode=settings.detect_executor,
+        )
+
+    def _ensure_started(self):
+        # started lazily on first use so it binds to the server's running loop
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is not None and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.workers)
+        if self._pool is None:
+            if self.mode == 'process':
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='detect')
+        self._dispatcher = loop.create_task(self._dispatch())
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, event: Dict[str, Any]):
+        """Score one event as part of the next micro-batch and return its result."""
+        self._ensure_started()
+        fut = self._loop.create_future()
+        await self._queue.put((event, fut))
+        return await fut
+
+    async def run_batch(self, events: List[Dict[str, Any]]):
+        """Score an already-formed batch on the pool, bypassing coalescing."""
+        self._ensure_started()
+        results = await self._loop.run_in_executor(self._pool, self.batch_fn, events)
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+        return results
+
+    async def _dispatch(self):
+        while True:
+            # only assemble a batch once a worker is free; requests arriving while
+            # all workers are busy accumulate in the queue and form larger batches
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = self._loop.create_task(self._run(batch))
+            # keep a reference so the task is not garbage collected mid-flight
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await self._loop.run_in_executor(self._pool, self.batch_fn, [e for e, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} events")
+        except Exception as e:
+            logger.exception('detection batch failed')
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, fut), r in zip(batch, results):
+                if fut.done():
+                    # caller went away (e.g. client disconnected)
+                    continue
+                if isinstance(r, Exception):
+                    fut.set_exception(r)
+                else:
+                    fut.set_result(r)
+        finally:
+            self._slots.release()
+
+    async def shutdown(self):
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError('detection executor shut down'))
+        await self._loop.run_in_executor(None, self._pool.shutdown)
+        self._dispatcher = None
+        self._pool = None
@@ -0,0 +1,79 @@
+"""Password hashing and verification on a dedicated, bounded process pool.
+
+bcrypt is deliberately slow (~100-300 ms per call). Running it inline in an
+async handler freezes the event loop, so a login storm stalls every other
+request, detection included. PasswordPool runs bcrypt in separate processes:
+at most `workers` hashes run at once, up to `max_pending` calls may wait in
+total, and anything beyond that fails fast with PasswordPoolOverloaded so the
+API can answer 503 instead of queueing without bound.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordPoolOverloaded(Exception):
+    pass
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _ping():
+    return True
+
+
+class PasswordPool:
+    def __init__(self, workers: int = 2, max_pending: int = 32):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self.pending = 0
+        self.rejected = 0
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: workers only import this module, and never inherit the
+            # parent's threads, sockets or DB connections
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordPoolOverloaded(f"{self.pending} password operations pending")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), fn, *args)
+        except BrokenProcessPool:
+            # a worker died; start a fresh pool on the next call
+            self._pool = None
+            raise
+        finally:
+            self.pending -= 1
+
+    def warm(self):
+        """Spawn the worker processes now rather than on the first login."""
+        pool = self._get_pool()
+        for f in [pool.submit(_ping) for _ in range(self.workers)]:
+            f.result()
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
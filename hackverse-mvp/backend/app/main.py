@@ -1,21 +1,40 @@
+import time
+
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from backend.app.api.api_v1.api import api_router
+from backend.app.api.api_v1.endpoints import threats
 from backend.app.config import Settings
 from pydantic import BaseModel
-from backend.app.ml.anomaly_detector import AnomalyDetector
 from fastapi.security import OAuth2PasswordRequestForm
-from backend.app.auth import authenticate_user, create_access_token, Token
-from backend.app.auth import get_current_user, require_role
-from backend.app.database import SessionLocal, init_db
+from backend.app.auth import authenticate_user_async, create_access_token, Token
+from backend.app.auth import get_current_user, require_role, invalidate_principal
+from backend.app.auth import get_password_hash_async, password_pool
+from backend.app.database import init_db
+from backend.app.deps import get_db
 from backend.app.models.user import User
+from backend.app import metrics
+from backend.app.ml.agents import ForestAgent
+from backend.app.ml.feature_schema import get_registry
+from backend.app.ml.signatures import get_engine
+from backend.app.ml.weight_store import weight_store
+from backend.app.warmup import Warmup
 
 
-# initialize sqlite DB
-init_db()
-
 settings = Settings()
-app = FastAPI(title=settings.app_name)
+
+
+class TimedJSONResponse(JSONResponse):
+    # JSON rendering is part of every response's latency; time it on its own
+    def render(self, content) -> bytes:
+        t0 = time.perf_counter()
+        body = super().render(content)
+        metrics.serialize_seconds.observe(time.perf_counter() - t0)
+        return body
+
+
+app = FastAPI(title=settings.app_name, default_response_class=TimedJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -29,31 +48,70 @@ app.add_middleware(
 # include api router
 app.include_router(api_router, prefix='/api/v1')
 
-class Event(BaseModel):
-    source: str
-    timestamp: str
-    ip: str
-    user: str
-    event_type: str
-    features: dict
+metrics.queue_depth.track(lambda: password_pool.pending, 'password_pool')
+
+
+# everything a first request would otherwise pay for; importing this module stays cheap
+WARMUP_EVENT = {'source': 'warmup', 'timestamp': '', 'ip': '', 'user': '', 'event_type': 'warmup', 'features': {}}
+
+
+def warm_agents():
+    for agent in threats.analyzer.agents:
+        agent.warm()
+
+
+def check_models():
+    # forest agents without a published model score random placeholders; say so on /readyz
+    missing = [a.model_name for a in threats.analyzer.agents
+               if isinstance(a, ForestAgent) and a.current_model() is None]
+    if missing:
+        raise RuntimeError(f"no published model for {', '.join(missing)}; those agents score placeholders")
+
+
+warmup = Warmup([
+    # initialize sqlite DB
+    ('database', init_db, True),
+    ('weights', weight_store.refresh, True),
+    ('feature_schemas', get_registry, True),
+    ('signatures', get_engine, True),
+    ('agents', warm_agents, True),
+    ('models', check_models, False),
+    ('ensemble', lambda: threats.analyzer.analyze(WARMUP_EVENT), True),
+    ('password_pool', password_pool.warm, False),
+])
+
+
+@app.on_event('startup')
+async def start_warmup():
+    warmup.start()
+
+
+@app.get('/healthz')
+async def healthz():
+    # liveness: the process is up and serving
+    return {"status": "ok"}
+
+
+@app.get('/readyz')
+async def readyz():
+    # readiness: warm-up finished, with per-step progress either way
+    return JSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    # Prometheus text format; see backend/app/metrics.py for what is recorded and what it costs
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
-# simple in-memory detector instance
-detector = AnomalyDetector()
 
-@app.post('/api/v1/threats/detect')
-async def detect(event: Event, current_user: User = Depends(get_current_user)):
-    features = list(event.features.values())
-    try:
-        score = detector.score([features])[0]
-        is_anom = detector.is_anomaly(score)
-        return {"is_threat": bool(is_anom), "score": float(score)}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.on_event('shutdown')
+async def shutdown_password_pool():
+    password_pool.shutdown()
 
 
 @app.post('/api/v1/auth/token', response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail='Incorrect username or password')
     access_token = create_access_token(data={"sub": user.username})
@@ -67,18 +125,15 @@ class CreateUserRequest(BaseModel):
 
 
 @app.post('/api/v1/users', status_code=201)
-async def create_user(req: CreateUserRequest, current_user: User = Depends(require_role('admin'))):
-    db = SessionLocal()
-    existing = db.query(User).filter(User.username == req.username).first()
-    if existing:
-        db.close()
+async def create_user(req: CreateUserRequest, current_user: User = Depends(require_role('admin')), db=Depends(get_db)):
+    if db.query(User).filter(User.username == req.username).first():
         raise HTTPException(status_code=400, detail='User exists')
-    from backend.app.auth import get_password_hash
-    user = User(username=req.username, hashed_password=get_password_hash(req.password), role=req.role)
+    hashed_password = await get_password_hash_async(req.password)
+    user = User(username=req.username, hashed_password=hashed_password, role=req.role)
     db.add(user)
     db.commit()
     db.refresh(user)
-    db.close()
+    invalidate_principal(user.username)
     return {"id": user.id, "username": user.username, "role": user.role}
 
 @app.get('/')
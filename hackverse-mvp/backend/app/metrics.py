@@ -0,0 +1,283 @@
+"""In-process metrics, exposed in the Prometheus text format on /metrics.
+
+Three kinds of families, all labelled:
+
+  Counter    inc() on the hot path
+  Histogram  observe() on the hot path; fixed bucket bounds, cumulative on output
+  Gauge      no hot-path cost: values come from callbacks (track()) that run
+             at scrape time, e.g. queue depths and cache statistics
+
+Recording never takes a lock. Each thread writes to its own shard (a dict
+from label values to a small list of numbers, reached through a
+threading.local), and only scrapes read across shards, so threads never
+contend and never lose an update. Shards of threads that have exited are
+folded into a retired shard at scrape time, so totals never go backwards.
+A scrape can see a thread's observation half-applied (bucket counted, sum not
+yet), which is off by one observation at most.
+
+Cost: one observe() is a thread-local lookup, a dict lookup, a bisect over
+the bucket bounds and two in-place adds; inc() skips the bisect. Measured on
+a development machine: 1.2 us per observe(), 0.7 us per inc(), 0.3 us when
+disabled (METRICS_ENABLED=false). Per scored batch (a /detect micro-batch or
+a /detect/batch request) the ensemble records one observation per agent plus
+one for itself, 11 with the 10 agents, weighted by the batch size rather than
+repeated per event; a request adds one for auth, one for rendering and one
+per SQL statement (none with a cached principal). The bound is therefore
+about 13 observations, ~16 us, per request, and at most
+that per event (batch of one), against ~500 us for the ensemble alone.
+Admission control adds one inc() per request, and an observe() for one that
+waited for a slot; errors add one inc() each.
+
+Metrics are per process: with several uvicorn workers, or the 'process'
+detect executor, each process has its own (scrape every worker, or use
+'thread' mode).
+"""
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from backend.app.config import Settings
+
+# seconds; covers a 10 us dictionary lookup up to a multi-second stall
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    type = ''
+
+    def __init__(self, registry, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+
+
+class _Sharded(_Family):
+    """Per-thread shards of {label values: cell}; cells are merged at scrape time."""
+
+    def __init__(self, registry, name, help, labelnames=()):
+        super().__init__(registry, name, help, labelnames)
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, Dict[tuple, list]]] = []
+        self._retired: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def _new_cell(self) -> list:
+        raise NotImplementedError
+
+    def _shard(self) -> Dict[tuple, list]:
+        shard = {}
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def _merge_into(self, total: Dict[tuple, list], shard: Dict[tuple, list]):
+        for labels, cell in list(shard.items()):
+            acc = total.get(labels)
+            if acc is None:
+                acc = total[labels] = self._new_cell()
+            for i, v in enumerate(cell):
+                acc[i] += v
+
+    def collect(self) -> Dict[tuple, list]:
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge_into(self._retired, shard)
+            self._shards = live
+            total = {}
+            self._merge_into(total, self._retired)
+            for _, shard in live:
+                self._merge_into(total, shard)
+        return total
+
+
+class Counter(_Sharded):
+    type = 'counter'
+
+    def _new_cell(self):
+        return [0]
+
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled:
+            return
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0]
+        cell[0] += amount
+
+    def value(self, *labels):
+        cell = self.collect().get(labels)
+        return cell[0] if cell else 0
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(cell[0])}'
+                for labels, cell in sorted(self.collect().items())]
+
+
+class Histogram(_Sharded):
+    """Cells are [count per bucket..., count above the last bound, sum]."""
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_cell(self):
+        return [0] * (len(self.bounds) + 1) + [0.0]
+
+    def observe(self, value: float, *labels, count: int = 1):
+        """Record `count` observations of `value` (e.g. a batch's per-event time, once per event)."""
+        if not self.registry.enabled:
+            return
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = self._new_cell()
+        cell[bisect_left(self.bounds, value)] += count
+        cell[-1] += value * count
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, cell in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, n in zip(self.bounds + (float('inf'),), cell):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(cell[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Gauge(_Family):
+    """Values read at scrape time from callbacks; `kind='counter'` for monotonic sources."""
+
+    def __init__(self, registry, name, help, labelnames=(), kind='gauge'):
+        super().__init__(registry, name, help, labelnames)
+        self.type = kind
+        self._sources: Dict[tuple, Callable[[], float]] = {}
+
+    def track(self, fn: Callable[[], float], *labels):
+        """Report fn() under these label values (replacing an earlier source for them)."""
+        self._sources[labels] = fn
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, fn in sorted(self._sources.items(), key=lambda kv: kv[0]):
+            try:
+                value = fn()
+            except Exception:
+                # a broken source must not fail the whole scrape
+                continue
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = cls(self, name, help, labelnames, **kwargs)
+            elif type(family) is not cls or family.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name} already registered as {family.type} {family.labelnames}")
+            return family
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get(Counter, name, help, tuple(labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, tuple(labelnames), buckets=buckets)
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = (), kind: str = 'gauge') -> Gauge:
+        return self._get(Gauge, name, help, tuple(labelnames), kind=kind)
+
+    def render(self) -> str:
+        """All families in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.header())
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Starlette appends '; charset=utf-8'
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+registry = MetricsRegistry(enabled=Settings().metrics_enabled)
+
+# hot paths
+agent_seconds = registry.histogram('hv_agent_seconds', 'Agent scoring time per event', ('technique',))
+agent_errors = registry.counter('hv_agent_errors_total', 'Agent errors reported as details.error instead of a score',
+                                ('technique', 'error'))
+agent_timeouts = registry.counter('hv_agent_timeouts_total', 'Agent calls that missed their deadline (concurrent mode)',
+                                  ('technique',))
+ensemble_seconds = registry.histogram('hv_ensemble_seconds', 'Ensemble scoring time per event', ('call',))
+auth_seconds = registry.histogram('hv_auth_seconds', 'get_current_user time, by where the principal came from',
+                                  ('principal',))
+db_seconds = registry.histogram('hv_db_statement_seconds', 'SQL statement execution time', ('statement',))
+serialize_seconds = registry.histogram('hv_serialize_seconds', 'JSON response rendering time')
+
+admission_decisions = registry.counter('hv_admission_total', 'Detection requests by admission decision', ('decision',))
+admission_wait_seconds = registry.histogram('hv_admission_wait_seconds',
+                                            'Time admitted detection requests waited for a slot')
+
+# scrape-time sources
+queue_depth = registry.gauge('hv_queue_depth', 'Items queued or pending', ('queue',))
+detection_store_rows = registry.gauge('hv_detection_store_rows_total', 'Detections by what the store did with them',
+                                      ('outcome',), kind='counter')
+_cache_hits = registry.gauge('hv_cache_hits_total', 'Cache lookups that hit', ('cache',), kind='counter')
+_cache_misses = registry.gauge('hv_cache_misses_total', 'Cache lookups that missed', ('cache',), kind='counter')
+_cache_evictions = registry.gauge('hv_cache_evictions_total', 'Cache entries evicted by the size bound', ('cache',),
+                                  kind='counter')
+_cache_size = registry.gauge('hv_cache_size', 'Cache entries', ('cache',))
+_cache_hit_ratio = registry.gauge('hv_cache_hit_ratio', 'Hits over lookups since start', ('cache',))
+
+
+def track_cache(name: str, cache):
+    """Expose a TTLCache's counters (see cache.py) under cache=`name`."""
+    _cache_hits.track(lambda: cache.hits, name)
+    _cache_misses.track(lambda: cache.misses, name)
+    _cache_evictions.track(lambda: cache.evictions, name)
+    _cache_size.track(lambda: len(cache), name)
+    _cache_hit_ratio.track(lambda: cache.stats()['hit_ratio'], name)
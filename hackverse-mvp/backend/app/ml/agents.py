@@ -6,174 +6,438 @@ Each agent implements analyze(event) -> dict with keys:
  - score: float (0-1)
  - details: dict
 
+Agents also expose analyze_batch(events) -> list of the same dicts. The default
+implementation loops over analyze(); agents that use numeric features override it
+to score the whole batch in one NumPy pass over the shared EventBatch matrix
+(feature_schema.py), so features are converted once per batch, not per agent.
+Model-backed agents get their models from the model registry
+(model_registry.py) and score through the compiled forest engine in
+forest_engine.py rather than sklearn directly.
+Keyword agents (SIEM, Signature, SOAR, Vulnerability) look their patterns up in
+the shared signature engine (signatures.py, rules in rules/signatures.json);
+SIEMAgent also counts events against sliding-window correlation rules
+(correlation.py, rules in rules/correlations.json).
+
+Agents whose result is a pure function of a few event fields declare them in
+`cache_fields` ('features' stands for the event's feature row), and
+cache_version() returns whatever identifies their rules, model or index; the
+ensemble memoizes their results per field tuple (see ensemble.py). Stateful
+agents (BehavioralAgent, SIEMAgent with correlation rules) leave cache_fields
+as None.
+
 These are lightweight, explainable stubs suitable for MVP. Replace with production models later.
 """
-from typing import Dict, Any
-import random
+from typing import Dict, Any, List
 import hashlib
-from sklearn.ensemble import IsolationForest
+import threading
 import numpy as np
-import joblib
 from pathlib import Path
+from backend.app.ml.model_registry import get_model_registry
+from backend.app.ml.ioc_index import IOCIndexWatcher
+from backend.app.ml.signatures import get_engine
+from backend.app.ml.correlation import get_correlator
+from backend.app.ml.baselines import BaselineStore, entity_keys
+from backend.app.ml.feature_schema import as_batch, get_registry
+from backend.app.deps import get_settings
+from backend.app.metrics import agent_errors
 
 MODELS_DIR = Path(__file__).parent / 'models'
 MODELS_DIR.mkdir(exist_ok=True)
 
+# score for an IP found in the IOC index (exact or inside a listed CIDR)
+IOC_MATCH_SCORE = 0.95
+
 
 class BaseAgent:
     technique = 'base'
+    # (min, max) score this agent can return; the ensemble cascade relies on it
+    score_range = (0.0, 1.0)
+    # event fields the result depends on, or None if it cannot be cached
+    cache_fields = None
+    # analyzing an event updates state (counters, baselines), so a failed batch must not be replayed
+    stateful = False
 
     def analyze(self, event: Dict[str, Any]) -> Dict[str, Any]:
         raise NotImplementedError()
 
+    def analyze_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self.analyze(e) for e in events]
+
+    def error_result(self, exc: Exception) -> Dict[str, Any]:
+        agent_errors.inc(self.technique, type(exc).__name__)
+        return {'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {'error': str(exc)}}
+
+    def cache_version(self):
+        """Changes whenever results for the same cache_fields may change (rules, model, index)."""
+        return None
+
+    def warm(self):
+        """Load whatever the first analyze() call would otherwise load."""
+
+    def close(self):
+        """Persist state at shutdown."""
+
+
+class RuleAgent(BaseAgent):
+    """Agent scored from the signature rules of its technique's group.
+
+    Its result depends on the fields those rules search plus `extra_fields`,
+    and changes with the rule set's version.
+    """
+    extra_fields = ()
+
+    @property
+    def cache_fields(self):
+        return tuple(sorted(set(self.extra_fields) | set(get_engine().group_fields(self.technique))))
 
-class SIEMAgent(BaseAgent):
+    def cache_version(self):
+        return get_engine().current_version()
+
+
+def _group_by_width(widths):
+    """Group row indices by feature count so each group is one dense block of the batch matrix."""
+    groups = {}
+    for i, w in enumerate(widths):
+        groups.setdefault(int(w), []).append(i)
+    return groups
+
+
+class SIEMAgent(RuleAgent):
     technique = 'SIEM'
+    score_range = (0.2, 1.0)
+    extra_fields = ('event_type', 'user')
+    stateful = True
+
+    @property
+    def cache_fields(self):
+        # correlation counts depend on every earlier event, so results cannot be reused
+        return None if get_correlator().rules else super().cache_fields
+
+    def warm(self):
+        get_correlator()
 
     def analyze(self, event):
-        # simple correlation heuristic: many fields present => lower risk; rare event types => higher
         et = event.get('event_type', '')
-        score = 0.2
-        if 'error' in et or 'failed' in et:
-            score += 0.5
+        rules = get_engine().match(event, self.technique)
+        score = 0.2 + max((r.score for r in rules), default=0.0)
         if event.get('user') == 'root' or event.get('user') == 'Administrator':
             score += 0.2
-        return self._out(score, {'event_type': et})
+        # every event is counted, whatever its score
+        correlations = get_correlator().observe(event)
+        score += max((c['score'] for c in correlations), default=0.0)
+        return self._out(score, {'event_type': et, 'rules': [r.id for r in rules],
+                                 'correlations': [{'id': c['id'], 'count': c['count']} for c in correlations]})
 
     def _out(self, score, details):
         return {'technique': self.technique, 'is_threat': score > 0.5, 'score': min(1.0, score), 'details': details}
 
 
-class EDRAgent(BaseAgent):
-    technique = 'EDR'
-
-    def __init__(self):
-        self.model_file = MODELS_DIR / 'edr_iso.joblib'
-        if self.model_file.exists():
-            try:
-                self.model = joblib.load(self.model_file)
-            except Exception:
-                self.model = None
-        else:
-            self.model = None
+class ForestAgent(BaseAgent):
+    """Base for agents that score numeric features with an IsolationForest.
+
+    The model comes from the model registry (model_registry.py) by name: it is
+    loaded on first use, memory-mapped, and swapped when a new version is
+    activated. Until a model exists, scores are random placeholders. Each
+    loaded model's input width is registered with the feature schemas
+    (feature_schema.py), which reject events no model can take; rows of
+    another width (another model's, or no features) get score 0 and
+    details.not_applicable instead of reaching the model.
+    """
+    model_name = ''
+    threshold = 0.5
+    fallback_scale = 0.5
+
+    def __init__(self, registry=None):
+        self.registry = registry or get_model_registry()
+        self._registered = None
+
+    def current_model(self):
+        model = self.registry.get(self.model_name)
+        if model is not None and model is not self._registered:
+            get_registry().register_model(self.model_name, model.n_features)
+            self._registered = model
+        return model
+
+    @property
+    def cache_fields(self):
+        # without a model the scores are random placeholders, not worth remembering
+        return ('features',) if self.current_model() is not None else None
+
+    def cache_version(self):
+        model = self.current_model()
+        return model.version if model is not None else None
+
+    def warm(self):
+        self.current_model()
+
+    @property
+    def score_range(self):
+        lo, hi = 0.0, self.fallback_scale
+        model = self.current_model()
+        if model is not None:
+            # score_samples lies in [-1, 0], so -decision_function lies in [offset, offset + 1]
+            lo, hi = min(lo, model.offset), max(hi, min(1.0, model.offset + 1.0))
+        return lo, hi
+
+    def decision_function(self, X):
+        return self.current_model().decision_function(X)
 
     def analyze(self, event):
+        return self.analyze_batch([event])[0]
+
+    def analyze_batch(self, events):
         # use IsolationForest on numeric features if present
-        features = list(event.get('features', {}).values())
-        if self.model is not None and len(features) >= 1:
-            score = float(-self.model.decision_function([features])[0])
-        else:
-            score = random.random() * 0.6
-        return {'technique': self.technique, 'is_threat': score > 0.6, 'score': min(1.0, score), 'details': {}}
+        batch = as_batch(events)
+        # one model version for the whole batch, even if a swap happens meanwhile
+        model = self.current_model()
+        scores = np.zeros(len(batch))
+        errors = {}
+        skipped = {}
+        # one decision_function call per feature width
+        for width, idx in _group_by_width(batch.widths).items():
+            if model is None:
+                scores[idx] = np.random.random(len(idx)) * self.fallback_scale
+                continue
+            if width != model.n_features:
+                for i in idx:
+                    skipped[i] = f'model {self.model_name} takes {model.n_features} features, event has {width}'
+                continue
+            try:
+                scores[idx] = -model.decision_function(batch.X[idx, :width])
+            except Exception as e:
+                for i in idx:
+                    errors[i] = e
+        scores = np.minimum(scores, 1.0)
+        return [
+            self.error_result(errors[i]) if i in errors else
+            {'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {'not_applicable': skipped[i]}}
+            if i in skipped else
+            {'technique': self.technique, 'is_threat': bool(s > self.threshold), 'score': float(s), 'details': {}}
+            for i, s in enumerate(scores)
+        ]
+
+
+class EDRAgent(ForestAgent):
+    technique = 'EDR'
+    model_name = 'edr'
+    threshold = 0.6
+    fallback_scale = 0.6
 
 
 class ThreatIntelAgent(BaseAgent):
     technique = 'Threat Intelligence'
+    cache_fields = ('ip',)
+
+    def __init__(self, index=None):
+        # a given index is used as is; otherwise the saved one is watched for rebuilds
+        self._index = index
+        self._watcher = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        # IOC index built from indicator feeds (see ioc_index.py), mapped on first use and
+        # reloaded when it is rebuilt; falls back to the hash stub below while none exists
+        if self._index is not None:
+            return self._index
+        if self._watcher is None:
+            with self._lock:
+                if self._watcher is None:
+                    settings = get_settings()
+                    self._watcher = IOCIndexWatcher(settings.ioc_index_path or str(MODELS_DIR / 'ioc'),
+                                                    settings.ioc_check_interval)
+        return self._watcher.current()
+
+    def warm(self):
+        self.index
+
+    def cache_version(self):
+        index = self.index
+        return index.meta.get('built_at') if index is not None else None
 
     def analyze(self, event):
-        # naive IOC check: hash IP and look for matches (stub)
         ip = event.get('ip', '')
         if not ip:
             return {'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {}}
+        index = self.index
+        if index is not None:
+            return self._ioc_result(ip, index.lookup(ip))
+        # naive IOC check: hash IP and look for matches (stub)
         h = int(hashlib.sha1(ip.encode()).hexdigest()[:6], 16)
         score = 0.9 if (h % 97) == 0 else 0.1 * (h % 10)
         return {'technique': self.technique, 'is_threat': score > 0.7, 'score': min(1.0, score/1.0), 'details': {'ip': ip}}
 
+    def analyze_batch(self, events):
+        # one index for the whole batch, even if a rebuild is picked up meanwhile
+        index = self.index
+        if index is None:
+            return super().analyze_batch(events)
+        ips = [e.get('ip', '') for e in events]
+        hits = index.contains_many(ips)
+        out = []
+        for ip, hit in zip(ips, hits):
+            if not ip:
+                out.append({'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {}})
+            else:
+                # only hits need the exact/range distinction
+                out.append(self._ioc_result(ip, index.lookup(ip) if hit else None))
+        return out
+
+    def _ioc_result(self, ip, match):
+        score = IOC_MATCH_SCORE if match else 0.0
+        return {'technique': self.technique, 'is_threat': score > 0.7, 'score': score, 'details': {'ip': ip, 'ioc_match': match}}
+
 
 class BehavioralAgent(BaseAgent):
+    """Feature spikes within an event, and deviation from the user's / IP's own baseline.
+
+    The baseline z-score only kicks in once an entity has enough history
+    (BaselineStore.min_count), so new entities score as before.
+    """
     technique = 'Behavioral Analysis'
+    stateful = True
+
+    def __init__(self, baselines=None):
+        self._baselines = baselines
+        self._lock = threading.Lock()
+
+    @property
+    def baselines(self):
+        # built (and the snapshot loaded) on first use
+        if self._baselines is None:
+            with self._lock:
+                if self._baselines is None:
+                    settings = get_settings()
+                    self._baselines = BaselineStore(
+                        shards=settings.baseline_shards,
+                        max_entities=settings.baseline_max_entities,
+                        ttl=settings.baseline_ttl,
+                        snapshot_path=settings.baseline_snapshot_path or str(MODELS_DIR / 'baselines.pkl'),
+                        snapshot_interval=settings.baseline_snapshot_interval,
+                    )
+        return self._baselines
+
+    @baselines.setter
+    def baselines(self, store):
+        self._baselines = store
+
+    def warm(self):
+        self.baselines
+
+    def close(self):
+        if self._baselines is not None:
+            self._baselines.save()
+
+    def _baseline_z(self, event):
+        """Largest |z| of this event's features against its entities' baselines (updates them)."""
+        features = event.get('features') or {}
+        best, entity = 0.0, None
+        if not features:
+            return best, entity
+        for key in entity_keys(event):
+            z = self.baselines.observe(key, features)
+            if z:
+                m = max(abs(v) for v in z.values())
+                if m > best:
+                    best, entity = m, key
+        return best, entity
+
+    def _result(self, z_max, event):
+        baseline_z, entity = self._baseline_z(event)
+        score = float(min(1.0, max(z_max, baseline_z) / 3.0))
+        details = {'z_max': float(z_max)}
+        if entity is not None:
+            details['baseline_z'] = float(baseline_z)
+            details['baseline_entity'] = entity
+        return {'technique': self.technique, 'is_threat': score > 0.6, 'score': score, 'details': details}
 
     def analyze(self, event):
-        # heuristic: sudden numeric spikes in features
-        feats = list(event.get('features', {}).values())
-        if not feats:
-            return {'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {}}
-        arr = np.array(feats)
-        z = (arr - arr.mean()) / (arr.std() + 1e-6)
-        score = float(min(1.0, np.abs(z).max() / 3.0))
-        return {'technique': self.technique, 'is_threat': score > 0.6, 'score': score, 'details': {'z_max': float(np.abs(z).max())}}
+        return self.analyze_batch([event])[0]
 
-
-class SignatureAgent(BaseAgent):
+    def analyze_batch(self, events):
+        # heuristic: sudden numeric spikes in features
+        batch = as_batch(events)
+        empty = batch.widths == 0
+        if empty.all():
+            return [{'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {}} for _ in batch]
+        # ragged rows are NaN-padded, so per-row stats ignore the padding
+        arr = batch.X.astype(np.float64)
+        arr[empty] = 0.0
+        z = (arr - np.nanmean(arr, axis=1, keepdims=True)) / (np.nanstd(arr, axis=1, keepdims=True) + 1e-6)
+        z_max = np.nanmax(np.abs(z), axis=1)
+        out = []
+        # baselines are updated in event order, as with sequential analyze() calls
+        for i, event in enumerate(batch):
+            if empty[i]:
+                out.append({'technique': self.technique, 'is_threat': False, 'score': 0.0, 'details': {}})
+            else:
+                out.append(self._result(float(z_max[i]), event))
+        return out
+
+
+class SignatureAgent(RuleAgent):
     technique = 'Signature Detection'
+    extra_fields = ('event_type',)
 
     def analyze(self, event):
-        # stub: look for suspicious substrings in event_type or details
         et = event.get('event_type', '')
-        suspicious = ['malware', 'trojan', 'exploit', 'ransom']
-        score = 0.0
-        for s in suspicious:
-            if s in et.lower():
-                score = 0.95
-                break
-        return {'technique': self.technique, 'is_threat': score > 0.5, 'score': score, 'details': {'event_type': et}}
+        rules = get_engine().match(event, self.technique)
+        score = max((r.score for r in rules), default=0.0)
+        return {'technique': self.technique, 'is_threat': score > 0.5, 'score': score, 'details': {'event_type': et, 'rules': [r.id for r in rules]}}
 
 
-class AnomalyAgent(BaseAgent):
+class AnomalyAgent(ForestAgent):
     technique = 'Anomaly Detection'
-
-    def __init__(self):
-        self.model_file = MODELS_DIR / 'iso_forest.joblib'
-        if self.model_file.exists():
-            try:
-                self.model = joblib.load(self.model_file)
-            except Exception:
-                self.model = None
-        else:
-            self.model = None
-
-    def analyze(self, event):
-        feats = list(event.get('features', {}).values())
-        if self.model is not None and len(feats) >= 1:
-            score = float(-self.model.decision_function([feats])[0])
-        else:
-            score = random.random() * 0.5
-        return {'technique': self.technique, 'is_threat': score > 0.5, 'score': min(1.0, score), 'details': {}}
+    model_name = 'anomaly'
+    threshold = 0.5
+    fallback_scale = 0.5
 
 
-class SOARAgent(BaseAgent):
+class SOARAgent(RuleAgent):
     technique = 'SOAR'
 
     def analyze(self, event):
         # SOAR decides on actions based on severity hints
-        base = 0.0
-        if 'kill' in event.get('event_type', '') or 'isolate' in event.get('event_type', ''):
-            base = 0.9
+        rules = get_engine().match(event, self.technique)
+        base = max((r.score for r in rules), default=0.0)
         action = 'notify'
         if base > 0.8:
             action = 'isolate'
-        return {'technique': self.technique, 'is_threat': base > 0.5, 'score': base, 'details': {'recommended_action': action}}
+        return {'technique': self.technique, 'is_threat': base > 0.5, 'score': base, 'details': {'recommended_action': action, 'rules': [r.id for r in rules]}}
 
 
-class VulnerabilityAgent(BaseAgent):
+class VulnerabilityAgent(RuleAgent):
     technique = 'Vulnerability Management'
 
     def analyze(self, event):
-        # stub: if event_type mentions outdated software keywords, raise score
-        et = event.get('event_type', '')
-        keywords = ['outdated', 'unpatched', 'vuln', 'cve']
-        score = 0.0
-        for k in keywords:
-            if k in et.lower():
-                score = 0.8
-                break
-        return {'technique': self.technique, 'is_threat': score > 0.5, 'score': score, 'details': {}}
+        # outdated / unpatched software keywords
+        rules = get_engine().match(event, self.technique)
+        score = max((r.score for r in rules), default=0.0)
+        return {'technique': self.technique, 'is_threat': score > 0.5, 'score': score, 'details': {'rules': [r.id for r in rules]}}
 
 
 class NetworkAgent(BaseAgent):
     technique = 'Network Analysis'
+    score_range = (0.0, 0.7)
+    cache_fields = ('features',)
 
     def analyze(self, event):
+        return self.analyze_batch([event])[0]
+
+    def analyze_batch(self, events):
         # simple heuristic: large numeric features or certain ports => higher score
-        feats = list(event.get('features', {}).values())
-        score = 0.0
-        if feats and max(feats) > 5:
-            score = 0.7
-        return {'technique': self.technique, 'is_threat': score > 0.5, 'score': score, 'details': {}}
+        batch = as_batch(events)
+        peak = np.fmax.reduce(batch.X, axis=1, initial=-np.inf) if batch.X.shape[1] else np.full(len(batch), -np.inf)
+        return [
+            {'technique': self.technique, 'is_threat': bool(p > 5), 'score': 0.7 if p > 5 else 0.0, 'details': {}}
+            for p in peak
+        ]
 
 
 class IAMAgent(BaseAgent):
     technique = 'Identity & Access Management'
+    score_range = (0.0, 0.6)
+    cache_fields = ('user',)
 
     def analyze(self, event):
         user = event.get('user', '')
@@ -1,28 +1,33 @@
 import numpy as np
-from sklearn.ensemble import IsolationForest
-import joblib
-from pathlib import Path
+from backend.app.ml.model_registry import get_model_registry
+
+MODEL_NAME = 'anomaly'
 
-MODEL_PATH = Path(__file__).parent / 'models'
-MODEL_PATH.mkdir(exist_ok=True)
 
 class AnomalyDetector:
-    def __init__(self):
-        # small demonstration model; in prod load a trained model
-        self.model_file = MODEL_PATH / 'iso_forest.joblib'
-        if self.model_file.exists():
-            self.model = joblib.load(self.model_file)
-        else:
-            self.model = IsolationForest(n_estimators=50, contamination=0.01, random_state=42)
-            # fit to random data as placeholder
-            X = np.random.randn(1000, 4)
-            self.model.fit(X)
-            joblib.dump(self.model, self.model_file)
+    """Scores with the registry's 'anomaly' model - the same loaded copy AnomalyAgent uses.
+
+    Raises FileNotFoundError while no such model is published.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or get_model_registry()
+
+    def _model(self):
+        model = self.registry.get(MODEL_NAME)
+        if model is None:
+            # a forest fitted to random data would score as if trained; publish a real one instead
+            raise FileNotFoundError(f"no {MODEL_NAME!r} model is published "
+                                    f"(python -m backend.app.ml.model_registry publish {MODEL_NAME} <model.joblib>)")
+        return model
+
+    @property
+    def n_features(self):
+        return self._model().n_features
 
     def score(self, X):
         # return anomaly scores (negative scores from sklearn)
-        Xarr = np.array(X)
-        return self.model.decision_function(Xarr) * -1.0
+        return self._model().decision_function(np.asarray(X)) * -1.0
 
     def is_anomaly(self, score, threshold=0.5):
         return score > threshold
@@ -0,0 +1,196 @@
+"""Per-entity streaming baselines for BehavioralAgent.
+
+Every `user` and `ip` gets its own running mean and variance per feature
+(Welford-style incremental updates), so an event can be scored against how *that* entity
+usually behaves in O(1) time. The count used for updates is capped at
+`max_count`, which turns the estimate into a slowly moving average once an
+entity has enough history and lets baselines follow gradual drift.
+
+Memory is bounded: entities live in `shards` LRU maps of
+max_entities / shards entries each, and an entity not seen for `ttl` seconds
+is dropped (lazily, on access and when its shard needs room). Each shard has
+its own lock, so concurrent detection threads rarely wait on each other.
+
+save() pickles the shards to a file (written to a temp file and renamed);
+the store loads that file on construction, so baselines survive restarts.
+With `snapshot_interval` > 0 a daemon thread also saves periodically. Each
+process keeps its own baselines; in process executor mode the last worker
+to snapshot wins.
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class _Shard:
+    __slots__ = ('lock', 'entities')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [last_seen, {feature: [n, mean, variance]}]
+        self.entities = OrderedDict()
+
+
+class BaselineStore:
+    def __init__(self, shards: int = 16, max_entities: int = 1000000, ttl: float = 7 * 86400,
+                 min_count: int = 5, max_count: int = 1000, snapshot_path: Optional[str] = None,
+                 snapshot_interval: float = 0.0):
+        self.shards = [_Shard() for _ in range(max(1, shards))]
+        self.shard_capacity = max(1, max_entities // len(self.shards))
+        self.ttl = ttl
+        self.min_count = min_count
+        self.max_count = max_count
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        self.evictions = 0
+        self._dirty = False
+        self._snapshot_thread = None
+        self._snapshot_lock = threading.Lock()
+        if self.snapshot_path is not None and self.snapshot_path.exists():
+            self.load(self.snapshot_path)
+
+    def _shard(self, key: str) -> _Shard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def observe(self, key: str, features: Dict[str, float], now: Optional[float] = None) -> Dict[str, float]:
+        """Score `features` against the entity's baseline, then fold them into it.
+
+        Returns {feature: z} for features with at least `min_count` prior
+        observations; an empty dict for new entities.
+        """
+        if self.snapshot_interval > 0 and self._snapshot_thread is None:
+            self._start_snapshots()
+        now = time.time() if now is None else now
+        self._dirty = True
+        shard = self._shard(key)
+        z = {}
+        with shard.lock:
+            entities = shard.entities
+            entry = entities.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                entry = [now, {}]
+                entities[key] = entry
+                self._evict(shard, now)
+            else:
+                entities.move_to_end(key)
+                entry[0] = now
+            stats = entry[1]
+            for name, x in features.items():
+                s = stats.get(name)
+                if s is None:
+                    stats[name] = [1, float(x), 0.0]
+                    continue
+                n, mean, var = s
+                if n >= self.min_count:
+                    z[name] = (x - mean) / (var ** 0.5 + 1e-6)
+                # incremental mean/variance: exact until max_count, then an EWMA with alpha 1/max_count
+                n = min(n + 1, self.max_count)
+                alpha = 1.0 / n
+                delta = x - mean
+                s[0], s[1], s[2] = n, mean + alpha * delta, (1.0 - alpha) * (var + alpha * delta * delta)
+        return z
+
+    def _evict(self, shard: _Shard, now: float):
+        entities = shard.entities
+        # least recently seen first: expired entries sit at the front
+        while entities:
+            key, entry = next(iter(entities.items()))
+            if len(entities) > self.shard_capacity or now - entry[0] > self.ttl:
+                entities.popitem(last=False)
+                self.evictions += 1
+            else:
+                break
+
+    def get(self, key: str) -> Optional[Dict[str, Tuple[int, float, float]]]:
+        """{feature: (count, mean, std)} for an entity, or None if unknown."""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entities.get(key)
+            if entry is None:
+                return None
+            return {name: (n, mean, var ** 0.5) for name, (n, mean, var) in entry[1].items()}
+
+    def __len__(self):
+        return sum(len(s.entities) for s in self.shards)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'entities': len(self), 'shards': len(self.shards), 'capacity': self.shard_capacity * len(self.shards), 'evictions': self.evictions}
+
+    def save(self, path: Optional[Path] = None, force: bool = False):
+        """Snapshot to `path` (default: snapshot_path); skipped if nothing changed since the last save.
+
+        The skip also keeps a process that never scores (the API process in
+        process executor mode) from overwriting its workers' snapshots.
+        """
+        path = Path(path) if path else self.snapshot_path
+        if path is None or not (self._dirty or force):
+            return
+        self._dirty = False
+        items: List[tuple] = []
+        for shard in self.shards:
+            with shard.lock:
+                items.extend((k, e[0], {f: tuple(s) for f, s in e[1].items()}) for k, e in shard.entities.items())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.baselines-', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': SNAPSHOT_VERSION, 'entities': items}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        logger.info('saved %d entity baselines to %s', len(items), path)
+
+    def load(self, path: Path):
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning('could not load baselines from %s: %s', path, e)
+            return
+        if data.get('version') != SNAPSHOT_VERSION:
+            return
+        now = time.time()
+        # oldest first, so each shard's LRU order matches last_seen
+        for key, last_seen, stats in sorted(data['entities'], key=lambda item: item[1]):
+            if now - last_seen > self.ttl:
+                continue
+            shard = self._shard(key)
+            shard.entities[key] = [last_seen, {f: list(s) for f, s in stats.items()}]
+            self._evict(shard, now)
+        logger.info('loaded %d entity baselines from %s', len(self), path)
+
+    def _start_snapshots(self):
+        with self._snapshot_lock:
+            if self._snapshot_thread is None:
+                self._snapshot_thread = threading.Thread(target=self._snapshot_loop, name='baseline-snapshot', daemon=True)
+                self._snapshot_thread.start()
+
+    def _snapshot_loop(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            try:
+                self.save()
+            except Exception as e:
+                logger.warning('baseline snapshot failed: %s', e)
+
+
+def entity_keys(event: Dict[str, Any]) -> List[str]:
+    """Baseline keys for an event: one per non-empty user / ip."""
+    keys = []
+    for field in ('user', 'ip'):
+        value = event.get(field)
+        if value:
+            keys.append(f'{field}:{value}')
+    return keys
@@ -0,0 +1,261 @@
+"""Sliding-window correlation rules for SIEMAgent.
+
+Rules live in a JSON file (default: rules/correlations.json), one object per rule:
+
+    {"id": "COR-0001", "where": {"event_type": ["login_failed"]}, "key": ["user"],
+     "window": 60, "threshold": 5, "score": 0.5}
+
+An event that matches `where` (field -> accepted values; all must match) is
+counted under the values of its `key` fields (skipped if one is missing), and
+the rule fires when that key has seen `threshold` events within the last
+`window` seconds. With `"distinct": "user"` the rule counts distinct values
+of that field instead (e.g. one IP trying several users). `window` must be
+positive, `threshold` at least 1 and `score` between 0 and 1, or the file is
+rejected.
+
+Each key keeps a ring buffer of `buckets` counters of window / buckets seconds
+plus their running total, so counting and evaluating are O(1) per event and
+rule whatever the window or the key's history (and an event only visits the
+rules whose `where.event_type` admits it): an event advances the ring to
+its bucket (zeroing the buckets it passed, at most `buckets` of them) and adds
+one. The window therefore slides in steps of one bucket. A distinct rule also
+remembers, per key, the last bucket of the `threshold` most recently seen
+values: a value seen again moves from its old bucket to the current one, and
+dropping the oldest beyond `threshold` keeps the count exact up to the
+threshold, which is all a rule needs.
+
+Memory is bounded like the behavioral baselines (baselines.py): each rule's
+keys live in `shards` LRU maps, each with its own lock, of max_keys / shards
+entries. A key idle for a whole window has a zero count and is dropped when
+it reaches the front of its map; past the bound the least recently seen key
+is dropped even if it is still counting (`evictions` in stats()).
+
+Time is the arrival time at the agent (time.time()), not the event's own
+timestamp. State is per process and is not persisted; in process executor
+mode each worker correlates the events it scores.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from backend.app.logger import get_logger
+from backend.app.ml.signatures import RULES_DIR
+
+logger = get_logger(__name__)
+
+DEFAULT_RULES = RULES_DIR / 'correlations.json'
+# ring-buffer layout of a key's entry: [head bucket, total, distinct values or None, counts...]
+_HEAD, _TOTAL, _SEEN, _COUNTS = 0, 1, 2, 3
+
+
+class CorrelationRule(NamedTuple):
+    id: str
+    where: Dict[str, frozenset]
+    key: tuple
+    window: float
+    threshold: int
+    score: float
+    distinct: Optional[str]
+
+
+def parse_rules(items) -> List[CorrelationRule]:
+    rules = []
+    for i, item in enumerate(items):
+        key = tuple(item.get('key') or ())
+        if not key:
+            raise ValueError(f"correlation rule #{i} has no key fields")
+        window = float(item.get('window', 60))
+        threshold = int(item.get('threshold', 1))
+        if not window > 0 or threshold < 1:
+            raise ValueError(f"correlation rule #{i} needs window > 0 and threshold >= 1")
+        score = float(item.get('score', 0.5))
+        # added to SIEMAgent's score, which (like every agent's) must stay within 0..1
+        if not 0.0 <= score <= 1.0:
+            raise ValueError(f"correlation rule #{i} has score {score}; scores must be between 0 and 1")
+        rules.append(CorrelationRule(
+            id=str(item.get('id') or f'correlation-{i}'),
+            where={f: frozenset(v if isinstance(v, list) else [v]) for f, v in (item.get('where') or {}).items()},
+            key=key,
+            window=window,
+            threshold=threshold,
+            score=score,
+            distinct=item.get('distinct') or None,
+        ))
+    return rules
+
+
+class _Shard:
+    __slots__ = ('lock', 'keys')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()
+
+
+class _RuleState:
+    """Ring-buffer counters of one rule, sharded by key."""
+
+    def __init__(self, rule: CorrelationRule, buckets: int, shards: int, max_keys: int):
+        self.rule = rule
+        # event_type is matched through CorrelationEngine's index, the other `where` fields here
+        self.where = tuple((f, v) for f, v in rule.where.items() if f != 'event_type')
+        self.buckets = buckets
+        self.width = rule.window / buckets
+        self.shards = [_Shard() for _ in range(shards)]
+        self.shard_capacity = max(1, max_keys // shards)
+        self.zeros = [0] * buckets
+        self.evictions = 0
+
+    def observe(self, key: str, value, now: float) -> int:
+        """Count one event for `key` (`value` of the distinct field, if any); returns the count in the window."""
+        n = self.buckets
+        epoch = int(now / self.width)
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.lock:
+            keys = shard.keys
+            entry = keys.get(key)
+            if entry is None:
+                entry = keys[key] = [epoch, 0, {} if self.rule.distinct else None] + self.zeros
+                self._evict(shard, epoch)
+            else:
+                keys.move_to_end(key)
+                gap = epoch - entry[_HEAD]
+                if gap >= n:
+                    entry[_COUNTS:] = self.zeros
+                    entry[_TOTAL] = 0
+                    entry[_HEAD] = epoch
+                elif gap > 0:
+                    for e in range(entry[_HEAD] + 1, epoch + 1):
+                        i = _COUNTS + e % n
+                        entry[_TOTAL] -= entry[i]
+                        entry[i] = 0
+                    entry[_HEAD] = epoch
+                else:
+                    # a clock step back (or another thread's slightly older now) counts as the head bucket
+                    epoch = entry[_HEAD]
+            seen = entry[_SEEN]
+            if seen is not None:
+                last = seen.pop(value, None)
+                if last is not None and epoch - last < n:
+                    i = _COUNTS + last % n
+                    entry[i] -= 1
+                    entry[_TOTAL] -= 1
+                seen[value] = epoch
+                if len(seen) > self.rule.threshold:
+                    # the oldest value (first in insertion order) can no longer change whether the
+                    # threshold is reached; the dict never holds more than threshold + 1 values
+                    last = seen.pop(next(iter(seen)))
+                    if epoch - last < n:
+                        entry[_COUNTS + last % n] -= 1
+                        entry[_TOTAL] -= 1
+            entry[_COUNTS + epoch % n] += 1
+            entry[_TOTAL] += 1
+            return entry[_TOTAL]
+
+    def _evict(self, shard: _Shard, epoch: int):
+        keys = shard.keys
+        # least recently seen first: keys idle for a whole window sit at the front
+        while keys:
+            entry = next(iter(keys.values()))
+            if epoch - entry[_HEAD] >= self.buckets:
+                keys.popitem(last=False)
+            elif len(keys) > self.shard_capacity:
+                keys.popitem(last=False)
+                self.evictions += 1
+            else:
+                break
+
+    def __len__(self):
+        return sum(len(s.keys) for s in self.shards)
+
+
+class CorrelationEngine:
+    def __init__(self, rules: List[CorrelationRule], buckets: int = 10, shards: int = 16,
+                 max_keys: int = 1000000):
+        self.rules = rules
+        self.buckets = max(1, buckets)
+        self.states = [_RuleState(r, self.buckets, max(1, shards), max_keys) for r in rules]
+        # event_type -> states of the rules that can match it, in rule order; other event types
+        # only reach the rules without an event_type condition
+        self._any = [s for s in self.states if 'event_type' not in s.rule.where]
+        self._by_event_type: Dict[str, List[_RuleState]] = {}
+        for et in set().union(*(s.rule.where.get('event_type', ()) for s in self.states)):
+            self._by_event_type[et] = [s for s in self.states if et in s.rule.where.get('event_type', (et,))]
+
+    @classmethod
+    def from_file(cls, path: Optional[Path] = None, **kwargs) -> 'CorrelationEngine':
+        """Engine over the rules in `path` (default rules/correlations.json); no rules if it is unreadable."""
+        path = Path(path) if path else DEFAULT_RULES
+        try:
+            rules = parse_rules(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning('could not load correlation rules from %s: %s', path, e)
+            rules = []
+        else:
+            logger.info('loaded %d correlation rules from %s', len(rules), path)
+        return cls(rules, **kwargs)
+
+    def observe(self, event: Dict[str, Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Count `event` under every rule it matches; returns [{'id', 'count', 'score'}] for the rules that fire."""
+        fired = []
+        states = self._by_event_type.get(event.get('event_type'), self._any)
+        if not states:
+            return fired
+        now = time.time() if now is None else now
+        for state in states:
+            rule = state.rule
+            for f, values in state.where:
+                if event.get(f) not in values:
+                    break
+            else:
+                if len(rule.key) == 1:
+                    key = event.get(rule.key[0])
+                    if key is None or key == '':
+                        continue
+                else:
+                    parts = [event.get(f) for f in rule.key]
+                    if None in parts or '' in parts:
+                        continue
+                    key = '\x1f'.join(map(str, parts))
+                value = None
+                if rule.distinct:
+                    value = event.get(rule.distinct)
+                    if value is None or value == '':
+                        continue
+                count = state.observe(key, value, now)
+                if count >= rule.threshold:
+                    fired.append({'id': rule.id, 'count': count, 'score': rule.score})
+        return fired
+
+    def __len__(self):
+        return sum(len(s) for s in self.states)
+
+    def stats(self) -> Dict[str, Any]:
+        return {s.rule.id: {'keys': len(s), 'evictions': s.evictions} for s in self.states}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_correlator() -> CorrelationEngine:
+    """Process-wide engine used by SIEMAgent (rules path and bounds from settings)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from backend.app.deps import get_settings
+                settings = get_settings()
+                if settings.correlation_enabled:
+                    _engine = CorrelationEngine.from_file(
+                        settings.correlation_rules_path or None,
+                        buckets=settings.correlation_buckets,
+                        shards=settings.correlation_shards,
+                        max_keys=settings.correlation_max_keys,
+                    )
+                else:
+                    _engine = CorrelationEngine([])
+    return _engine
@@ -1,43 +1,141 @@
-from typing import Dict, Any
+"""Weighted ensemble over all agents.
+
+In 'full' mode every agent scores every event. In 'cascade' mode agents run
+cheapest first (by a measured moving average of seconds per event) and an
+event stops as soon as the `aggregate_score > 0.5` decision can no longer
+change: with the scores seen so far and each remaining agent's score_range,
+the final aggregate is known to lie in [lo, hi], and once lo > 0.5 or
+hi <= 0.5 the remaining agents are skipped. The decision always matches full
+evaluation (given correct score ranges); cascade results add 'skipped' and
+'aggregate_bounds', and 'aggregate_score' is the weighted mean of the agents
+that ran, clamped to the bounds. Skipped agents do not see the event, so
+stateful ones (BehavioralAgent's baselines, SIEMAgent's correlation
+counters) only learn from events that reach them.
+
+In 'concurrent' mode the agents of a batch run at the same time on a shared
+thread pool (NumPy and sklearn release the GIL for much of their work), and
+each has a deadline (AGENT_DEADLINE_MS, per technique AGENT_DEADLINES_MS)
+counted from the start of the batch. Agents that miss it are listed in
+'timed_out' and left out of the aggregate and top technique, so a batch
+returns within the largest deadline however slow one agent gets. A late agent
+keeps its pool thread until it finishes; its result is discarded, and agents
+still queued behind it are cancelled at their own deadline. Agents whose
+measured cost per call is below ENSEMBLE_INLINE_US run on the calling thread
+instead, where a pool hand-off would cost more than the agent; they have no
+deadline.
+
+In every mode, results of agents that declare `cache_fields` are memoized per
+agent in a bounded LRU/TTL cache keyed by the values of those fields (the
+feature row's bytes for 'features') and the agent's cache_version(); a
+version change empties the cache. Only the misses of a batch reach the agent,
+once per distinct key. Error results are not cached. Cached result dicts are
+shared between events and must be treated as read-only. Hit ratios are on
+/metrics (cache="agent:<technique>") and in cache_stats().
+
+When an agent's analyze_batch raises, its events are retried one at a time
+so only the failing ones get an error result, except for `stateful` agents
+(SIEMAgent's correlation counters, BehavioralAgent's baselines): they have
+already counted the events before the failure, so the whole batch gets the
+error result instead of a replay.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Dict, Any, List
+import numpy as np
+from backend.app.cache import TTLCache
+from backend.app.deps import get_settings
+from backend.app.metrics import agent_seconds, agent_timeouts, ensemble_seconds, track_cache
 from backend.app.ml.agents import ALL_AGENTS
-from backend.app.database import SessionLocal
-from sqlalchemy import Column, String, Float
-from backend.app.models.user import Base
+from backend.app.ml.feature_schema import FeatureSchemaError, as_batch, get_registry
+from backend.app.ml.weight_store import AgentWeight, weight_store as default_weight_store
+
+# smoothing for the per-agent cost estimate
+COST_ALPHA = 0.1
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_agent_pool() -> ThreadPoolExecutor:
+    """Process-wide pool for 'concurrent' mode (ENSEMBLE_WORKERS threads); a forked child gets its own."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=get_settings().ensemble_workers, thread_name_prefix='agent')
+                _pool_pid = os.getpid()
+    return _pool
 
 
-class AgentWeight(Base):
-    __tablename__ = 'agent_weights'
-    technique = Column(String, primary_key=True)
-    weight = Column(Float, default=1.0)
+def shutdown_agent_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 class EnsembleAnalyzer:
-    def __init__(self, agents=None):
+    def __init__(self, agents=None, weight_store=None, mode=None):
+        settings = get_settings()
         self.agents = agents or ALL_AGENTS
-        # load weights from DB or default to 1.0
-        self.weights = self._load_weights()
+        # weights live in a shared versioned store; techniques without a row weigh 1.0
+        self.weight_store = weight_store or default_weight_store
+        self.mode = mode or settings.ensemble_mode
+        # technique -> moving average of seconds per event
+        self.costs: Dict[str, float] = {}
+        # concurrent mode, in seconds
+        self.deadline = settings.agent_deadline_ms / 1000.0
+        self.deadlines = {t: ms / 1000.0 for t, ms in settings.agent_deadlines_ms.items()}
+        self.inline_cost = settings.ensemble_inline_us / 1e6
+        # technique -> [cache_version, TTLCache]
+        self.cache_size = settings.agent_cache_size
+        self.cache_ttl = settings.agent_cache_ttl
+        self._caches: Dict[str, list] = {}
+        self._caches_lock = threading.Lock()
+
+    @property
+    def weights(self) -> Dict[str, float]:
+        return self.weight_store.current().weights
+
+    def _record_cost(self, agent, seconds: float, n: int):
+        per_event = seconds / max(1, n)
+        agent_seconds.observe(per_event, agent.technique, count=max(1, n))
+        prev = self.costs.get(agent.technique)
+        self.costs[agent.technique] = per_event if prev is None else prev + COST_ALPHA * (per_event - prev)
+
+    def cascade_order(self) -> List[int]:
+        """Agent indices, cheapest first; agents not measured yet go first so they get measured."""
+        return sorted(range(len(self.agents)), key=lambda j: self.costs.get(self.agents[j].technique, 0.0))
 
     def analyze(self, event: Dict[str, Any]):
-        results = []
+        """Score one event; raises FeatureSchemaError if its features do not fit its schema."""
+        t0 = time.perf_counter()
+        batch = as_batch([event])
+        if self.mode in ('cascade', 'concurrent'):
+            result = (self.analyze_cascade if self.mode == 'cascade' else self.analyze_concurrent)(batch)[0]
+            ensemble_seconds.observe(time.perf_counter() - t0, 'analyze')
+            return result
         # dispatch to all agents
-        for a in self.agents:
-            try:
-                r = a.analyze(event)
-                results.append(r)
-            except Exception as e:
-                results.append({'technique': a.technique, 'is_threat': False, 'score': 0.0, 'details': {'error': str(e)}})
+        keys = {}
+        results = [self._agent_batch(a, batch, keys)[0] for a in self.agents]
 
         # aggregate: apply per-technique weights
+        weights = self.weights
         weighted_sum = 0.0
         total_weight = 0.0
         for r in results:
-            w = self.weights.get(r.get('technique'), 1.0)
+            w = weights.get(r.get('technique'), 1.0)
             weighted_sum += r.get('score', 0.0) * w
             total_weight += w
         agg_score = (weighted_sum / total_weight) if total_weight > 0 else 0.0
 
         # choose highest-confidence technique
         best = max(results, key=lambda r: r.get('score', 0.0)) if results else None
+        ensemble_seconds.observe(time.perf_counter() - t0, 'analyze')
         return {
             'aggregate_score': agg_score,
             'is_threat': agg_score > 0.5,
@@ -45,18 +143,260 @@ class EnsembleAnalyzer:
             'top_technique': best
         }
 
-    def _load_weights(self):
-        weights = {}
-        # default weights
-        for a in (self.agents or ALL_AGENTS):
-            weights[a.technique] = 1.0
+    def _cache(self, a):
+        """(fields, version, cache) for an agent, cache None if it is not cached; a new version empties the cache."""
+        fields = a.cache_fields if self.cache_size > 0 else None
+        if fields is None:
+            return None, None, None
+        version = a.cache_version()
+        entry = self._caches.get(a.technique)
+        if entry is None or entry[0] != version:
+            with self._caches_lock:
+                entry = self._caches.get(a.technique)
+                if entry is None:
+                    cache = TTLCache(maxsize=self.cache_size, ttl=self.cache_ttl)
+                    track_cache(f'agent:{a.technique}', cache)
+                    entry = self._caches[a.technique] = [version, cache]
+                elif entry[0] != version:
+                    entry[1].clear()
+                    entry[0] = version
+        return fields, version, entry[1]
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {technique: dict(cache.stats(), version=version) for technique, (version, cache) in self._caches.items()}
+
+    @staticmethod
+    def _cache_keys(fields, events, keys):
+        """Per-event tuples of the values of `fields`, shared through `keys` by agents with the same fields."""
+        out = keys.get(fields)
+        if out is None:
+            columns = []
+            for f in fields:
+                if f == 'features':
+                    columns.append([events.X[i, :w].tobytes() for i, w in enumerate(events.widths)])
+                else:
+                    columns.append([e.get(f) for e in events])
+            out = keys[fields] = list(zip(*columns))
+        return out
+
+    def _score(self, a, events):
         try:
-            db = SessionLocal()
-            # ensure table exists and query
-            for aw in db.query(AgentWeight).all():
-                weights[aw.technique] = aw.weight
-            db.close()
-        except Exception:
-            # DB might not exist yet; keep defaults
-            pass
-        return weights
+            return a.analyze_batch(events)
+        except Exception as exc:
+            if a.stateful:
+                # a replay would count the events before the failure twice
+                return [a.error_result(exc)] * len(events)
+            # isolate the failing event(s) instead of failing the whole batch
+            rs = []
+            for e in events:
+                try:
+                    rs.append(a.analyze(e))
+                except Exception as exc:
+                    rs.append(a.error_result(exc))
+            return rs
+
+    def _agent_batch(self, a, events, keys=None):
+        """`a`'s results for `events`, through its cache; `keys` shares cache keys between calls on the same batch."""
+        t0 = time.perf_counter()
+        fields, version, cache = self._cache(a)
+        if cache is None:
+            rs = self._score(a, events)
+        else:
+            event_keys = self._cache_keys(fields, events, {} if keys is None else keys)
+            rs = [None] * len(events)
+            misses = {}
+            for i, key in enumerate(event_keys):
+                r = cache.get((version, key))
+                if r is None:
+                    misses.setdefault(key, []).append(i)
+                else:
+                    rs[i] = r
+            if misses:
+                first = [idx[0] for idx in misses.values()]
+                scored = self._score(a, events if len(first) == len(events) else events.take(first))
+                for (key, idx), r in zip(misses.items(), scored):
+                    if 'error' not in r.get('details', ()):
+                        cache.set((version, key), r)
+                    for i in idx:
+                        rs[i] = r
+        self._record_cost(a, time.perf_counter() - t0, len(events))
+        return rs
+
+    def analyze_batch(self, events: List[Dict[str, Any]]):
+        """Score a list of events; equivalent to [analyze(e) for e in events].
+
+        Every agent sees the whole batch at once and the weighted aggregate is
+        computed as one matrix-vector product over the (events x agents) scores.
+        Events whose features do not fit their schema get the FeatureSchemaError
+        in their slot instead of a result.
+        """
+        if not events:
+            return []
+        t0 = time.perf_counter()
+        try:
+            events = as_batch(events)
+        except FeatureSchemaError as exc:
+            return self._analyze_valid(events, exc)
+        if self.mode in ('cascade', 'concurrent'):
+            out = (self.analyze_cascade if self.mode == 'cascade' else self.analyze_concurrent)(events)
+            ensemble_seconds.observe((time.perf_counter() - t0) / len(events), 'batch', count=len(events))
+            return out
+        keys = {}
+        per_agent = [self._agent_batch(a, events, keys) for a in self.agents]
+
+        scores = np.array([[r.get('score', 0.0) for r in rs] for rs in per_agent], dtype=float)
+        scores = scores.reshape(len(per_agent), len(events)).T
+        weights = self.weights
+        w = np.array([weights.get(a.technique, 1.0) for a in self.agents], dtype=float)
+        total_weight = w.sum()
+        agg = scores @ w / total_weight if total_weight > 0 else np.zeros(len(events))
+        best = scores.argmax(axis=1) if per_agent else None
+
+        out = []
+        for i in range(len(events)):
+            results = [rs[i] for rs in per_agent]
+            out.append({
+                'aggregate_score': float(agg[i]),
+                'is_threat': bool(agg[i] > 0.5),
+                'per_technique': results,
+                'top_technique': results[best[i]] if results else None
+            })
+        ensemble_seconds.observe((time.perf_counter() - t0) / len(events), 'batch', count=len(events))
+        return out
+
+    def _analyze_valid(self, events, error):
+        """Score the events that convert on their own; the others get their FeatureSchemaError."""
+        out, valid = [], []
+        registry = get_registry()
+        for i, e in enumerate(events):
+            try:
+                registry.validate(e)
+                # a row that validates but does not convert must not send the batch round again
+                registry.build_batch([e])
+            except FeatureSchemaError as exc:
+                out.append(exc)
+            else:
+                out.append(None)
+                valid.append(i)
+        if len(valid) == len(events):
+            # every event converts alone, so the batch failed as a whole; nothing to isolate
+            raise error
+        if valid:
+            for i, r in zip(valid, self.analyze_batch([events[i] for i in valid])):
+                out[i] = r
+        return out
+
+    def analyze_cascade(self, events: List[Dict[str, Any]]):
+        """Cascade evaluation of a batch: each agent only sees the events still undecided."""
+        events = as_batch(events)
+        n = len(events)
+        if not n:
+            return []
+        weights = self.weights
+        w = [weights.get(a.technique, 1.0) for a in self.agents]
+        total = sum(w)
+        # weighted score so far, and the weighted min / max still to come, per event; a negative
+        # weight (rows stored before the endpoints rejected them) swaps its agent's range ends
+        lows = [min(wj * a.score_range[0], wj * a.score_range[1]) for wj, a in zip(w, self.agents)]
+        highs = [max(wj * a.score_range[0], wj * a.score_range[1]) for wj, a in zip(w, self.agents)]
+        partial = np.zeros(n)
+        evaluated_weight = np.zeros(n)
+        rest_lo = np.full(n, sum(lows))
+        rest_hi = np.full(n, sum(highs))
+        results = [{} for _ in range(n)]
+        active = np.arange(n)
+        for j in self.cascade_order():
+            if not len(active):
+                break
+            a, wj = self.agents[j], w[j]
+            if wj == 0:
+                # cannot move the aggregate
+                continue
+            rs = self._agent_batch(a, events.take(active))
+            partial[active] += wj * np.array([r.get('score', 0.0) for r in rs], dtype=float)
+            evaluated_weight[active] += wj
+            rest_lo[active] -= lows[j]
+            rest_hi[active] -= highs[j]
+            for i, r in zip(active, rs):
+                results[i][j] = r
+            if total > 0:
+                lo = (partial[active] + rest_lo[active]) / total
+                hi = (partial[active] + rest_hi[active]) / total
+                active = active[(lo <= 0.5) & (hi > 0.5)]
+
+        if total > 0:
+            lo_all = (partial + rest_lo) / total
+            hi_all = (partial + rest_hi) / total
+        else:
+            lo_all = hi_all = np.zeros(n)
+        out = []
+        for i in range(n):
+            ran = results[i]
+            per_technique = [ran[j] for j in range(len(self.agents)) if j in ran]
+            lo, hi = float(lo_all[i]), float(hi_all[i])
+            estimate = float(partial[i] / evaluated_weight[i]) if evaluated_weight[i] > 0 else 0.0
+            agg = min(hi, max(lo, estimate))
+            out.append({
+                'aggregate_score': agg,
+                'is_threat': agg > 0.5,
+                'per_technique': per_technique,
+                'top_technique': max(per_technique, key=lambda r: r.get('score', 0.0)) if per_technique else None,
+                'skipped': [a.technique for j, a in enumerate(self.agents) if j not in ran],
+                'aggregate_bounds': [lo, hi],
+            })
+        return out
+
+    def agent_deadline(self, agent) -> float:
+        return self.deadlines.get(agent.technique, self.deadline)
+
+    def analyze_concurrent(self, events: List[Dict[str, Any]]):
+        """Concurrent evaluation of a batch: every agent at once, each bounded by its deadline."""
+        events = as_batch(events)
+        n = len(events)
+        if not n:
+            return []
+        t0 = time.perf_counter()
+        pool = get_agent_pool()
+        futures, ran, keys = {}, {}, {}
+        inline = []
+        for j, a in enumerate(self.agents):
+            cost = self.costs.get(a.technique)
+            # unmeasured agents go to the pool, where a deadline applies
+            if cost is not None and cost * n <= self.inline_cost:
+                inline.append(j)
+            else:
+                futures[j] = pool.submit(self._agent_batch, a, events, keys)
+        for j in inline:
+            ran[j] = self._agent_batch(self.agents[j], events, keys)
+        timed_out = []
+        for j in sorted(futures, key=lambda j: self.agent_deadline(self.agents[j])):
+            a = self.agents[j]
+            try:
+                ran[j] = futures[j].result(timeout=max(0.0, t0 + self.agent_deadline(a) - time.perf_counter()))
+            except FuturesTimeout:
+                # not started yet: never runs; running: finishes on its own, result dropped
+                futures[j].cancel()
+                timed_out.append(j)
+                agent_timeouts.inc(a.technique)
+            except Exception as e:
+                ran[j] = [a.error_result(e)] * n
+
+        order = sorted(ran)
+        weights = self.weights
+        w = np.array([weights.get(self.agents[j].technique, 1.0) for j in order], dtype=float)
+        scores = np.array([[r.get('score', 0.0) for r in ran[j]] for j in order], dtype=float).reshape(len(order), n).T
+        total_weight = w.sum()
+        agg = scores @ w / total_weight if total_weight > 0 else np.zeros(n)
+        best = scores.argmax(axis=1) if order else None
+        late = [self.agents[j].technique for j in sorted(timed_out)]
+        out = []
+        for i in range(n):
+            results = [ran[j][i] for j in order]
+            out.append({
+                'aggregate_score': float(agg[i]),
+                'is_threat': bool(agg[i] > 0.5),
+                'per_technique': results,
+                'top_technique': results[best[i]] if results else None,
+                'timed_out': late,
+            })
+        return out
@@ -0,0 +1,228 @@
+"""Feature schemas: fixed column layouts for event features, one per event source.
+
+A schema lists the feature names of a source in column order. Events from a
+registered source must carry exactly those features; anything else is
+rejected up front (FeatureSchemaError, a 422 at the API) instead of reaching
+a model with the wrong shape. Events from unregistered sources keep the
+legacy layout - their features in JSON key order - unless the registry is
+strict, in which case they are rejected too.
+
+Schemas are read from feature_schemas.json (or FEATURE_SCHEMA_PATH):
+
+    {"schemas": {"edr-sensor": ["cpu", "mem", "proc_count", "net_in", "net_out", "disk_io"]}}
+
+Forest agents record their model's input width here when the model loads
+(register_model). An event whose feature count no loaded model takes is
+rejected like a schema mismatch, registered source or not, so width errors
+never surface from inside sklearn; an event without features passes (the
+forest agents skip it). A registered schema whose width no model takes is
+logged when the models load.
+
+EventBatch converts a batch of events to one float32 matrix, once, and every
+agent reads from it. Rows shorter than the widest row are NaN-padded;
+`widths` holds each row's real feature count.
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# features are scored as float32; anything larger would become inf in the batch matrix
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+
+DEFAULT_SCHEMAS = Path(__file__).parent / 'feature_schemas.json'
+
+
+class FeatureSchemaError(ValueError):
+    pass
+
+
+class FeatureSchema:
+    def __init__(self, source: str, features: Sequence[str]):
+        if len(set(features)) != len(features):
+            raise ValueError(f"duplicate feature names in schema for {source!r}")
+        self.source = source
+        self.features = tuple(features)
+        self.index = {name: i for i, name in enumerate(self.features)}
+        self.width = len(self.features)
+
+    def validate(self, features: Dict[str, Any]):
+        if len(features) == self.width and all(name in self.index for name in features):
+            return
+        missing = [n for n in self.features if n not in features]
+        extra = [n for n in features if n not in self.index]
+        parts = []
+        if missing:
+            parts.append(f"missing {missing}")
+        if extra:
+            parts.append(f"unexpected {extra}")
+        raise FeatureSchemaError(f"features do not match the schema for source {self.source!r}: " + ', '.join(parts))
+
+    def fill(self, row: np.ndarray, features: Dict[str, Any]):
+        index = self.index
+        for name, value in features.items():
+            row[index[name]] = value
+
+
+class EventBatch(Sequence):
+    """A list of events plus their features as one float32 matrix.
+
+    Behaves like the list of event dicts, so agents that only look at other
+    fields need no changes.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], X: np.ndarray, widths: np.ndarray, schemas: List[Optional[FeatureSchema]]):
+        self.events = events
+        self.X = X
+        self.widths = widths
+        self.schemas = schemas
+
+    def __len__(self):
+        return len(self.events)
+
+    def __getitem__(self, i):
+        return self.events[i]
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def take(self, idx) -> 'EventBatch':
+        """Sub-batch of the rows in `idx`, sharing no conversion work."""
+        idx = np.asarray(idx, dtype=np.intp)
+        return EventBatch([self.events[i] for i in idx], self.X[idx], self.widths[idx], [self.schemas[i] for i in idx])
+
+    def column(self, name: str) -> np.ndarray:
+        """Values of feature `name` per row, NaN where a row does not have it."""
+        out = np.full(len(self.events), np.nan, dtype=np.float32)
+        first = self.schemas[0] if self.schemas else None
+        if first is not None and all(s is first for s in self.schemas):
+            if name in first.index:
+                out[:] = self.X[:, first.index[name]]
+            return out
+        for i, (event, schema) in enumerate(zip(self.events, self.schemas)):
+            if schema is not None:
+                if name in schema.index:
+                    out[i] = self.X[i, schema.index[name]]
+            else:
+                value = (event.get('features') or {}).get(name)
+                if value is not None:
+                    out[i] = value
+        return out
+
+
+class FeatureSchemaRegistry:
+    def __init__(self, schemas: Optional[Dict[str, Sequence[str]]] = None, strict: bool = False):
+        self.strict = strict
+        self.schemas: Dict[str, FeatureSchema] = {}
+        # model name -> input width, from the forest agents' loaded models
+        self.model_widths: Dict[str, int] = {}
+        for source, features in (schemas or {}).items():
+            self.register(source, features)
+
+    @classmethod
+    def from_file(cls, path: Path, strict: bool = False) -> 'FeatureSchemaRegistry':
+        path = Path(path)
+        if not path.exists():
+            return cls(strict=strict)
+        data = json.loads(path.read_text(encoding='utf-8'))
+        registry = cls(data.get('schemas') or {}, strict=strict or bool(data.get('strict', False)))
+        logger.info('loaded %d feature schemas from %s', len(registry.schemas), path)
+        return registry
+
+    def register(self, source: str, features: Sequence[str]) -> FeatureSchema:
+        schema = FeatureSchema(source, list(features))
+        self.schemas[source] = schema
+        return schema
+
+    def get(self, source: str) -> Optional[FeatureSchema]:
+        return self.schemas.get(source)
+
+    def register_model(self, name: str, width: int):
+        """Record that model `name` takes `width` features; logs when no registered schema has that width."""
+        if self.model_widths.get(name) == width:
+            return
+        self.model_widths[name] = width
+        if self.schemas and not any(s.width == width for s in self.schemas.values()):
+            logger.warning('model %s takes %d features, but no registered feature schema has %d', name, width, width)
+
+    def check_width(self, width: int, source: Any):
+        """Raise FeatureSchemaError unless some loaded model takes `width` features (0 = no features)."""
+        widths = self.model_widths
+        if width and widths and width not in widths.values():
+            expected = ' or '.join(str(w) for w in sorted(set(widths.values())))
+            raise FeatureSchemaError(f"event from source {source!r} has {width} features; the models take {expected}")
+
+    def validate(self, event: Dict[str, Any]) -> Optional[FeatureSchema]:
+        """Raise FeatureSchemaError unless the event's features fit its source's layout."""
+        features = event.get('features') or {}
+        for name, value in features.items():
+            # the same rule build_batch applies: finite once cast to float32 (also rejects NaN)
+            if not isinstance(value, (int, float)) or not abs(value) <= FLOAT32_MAX:
+                raise FeatureSchemaError(f"feature {name!r} must be a finite float32 number")
+        schema = self.schemas.get(event.get('source'))
+        if schema is None:
+            if self.strict:
+                raise FeatureSchemaError(f"no feature schema registered for source {event.get('source')!r}")
+        else:
+            schema.validate(features)
+        self.check_width(len(features), event.get('source'))
+        return schema
+
+    def build_batch(self, events: Iterable[Dict[str, Any]]) -> EventBatch:
+        """Convert events to an EventBatch; raises FeatureSchemaError on the first bad event."""
+        events = list(events)
+        schemas = [self.schemas.get(e.get('source')) for e in events]
+        widths = np.array([s.width if s is not None else len(e.get('features') or ()) for e, s in zip(events, schemas)], dtype=np.intp)
+        X = np.full((len(events), int(widths.max(initial=0))), np.nan, dtype=np.float32)
+        for i, (event, schema) in enumerate(zip(events, schemas)):
+            features = event.get('features') or {}
+            try:
+                # values past float32 become inf here and are reported by the finite check below
+                with np.errstate(over='ignore'):
+                    if schema is not None:
+                        schema.validate(features)
+                        schema.fill(X[i], features)
+                    elif self.strict:
+                        raise FeatureSchemaError(f"no feature schema registered for source {event.get('source')!r}")
+                    elif features:
+                        X[i, :widths[i]] = list(features.values())
+            except (TypeError, ValueError, OverflowError) as e:
+                if isinstance(e, FeatureSchemaError):
+                    raise
+                raise FeatureSchemaError(f"features of event {i} must be finite numbers: {e}")
+            self.check_width(int(widths[i]), event.get('source'))
+        # NaN padding past a row's width is expected; anything else must be a finite number
+        inside = np.arange(X.shape[1]) < widths[:, None]
+        bad = np.flatnonzero((~np.isfinite(X) & inside).any(axis=1))
+        if len(bad):
+            raise FeatureSchemaError(f"features must be finite numbers (events {bad[:10].tolist()})")
+        return EventBatch(events, X, widths, schemas)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> FeatureSchemaRegistry:
+    """Process-wide registry (path and strictness from settings)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from backend.app.deps import get_settings
+                settings = get_settings()
+                _registry = FeatureSchemaRegistry.from_file(settings.feature_schema_path or DEFAULT_SCHEMAS, settings.feature_schema_strict)
+    return _registry
+
+
+def as_batch(events) -> EventBatch:
+    """`events` as an EventBatch, converting through the registry if it is a plain list."""
+    if isinstance(events, EventBatch):
+        return events
+    return get_registry().build_batch(events)
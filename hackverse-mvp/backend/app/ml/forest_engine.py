@@ -0,0 +1,179 @@
+"""Low-latency inference engine for trained IsolationForest models.
+
+sklearn's IsolationForest.decision_function validates its input and walks every
+tree through a separate Python call, which costs milliseconds even for a single
+row. CompiledIsolationForest flattens all trees of a fitted forest into a few
+contiguous NumPy arrays once, at load time:
+
+ - feature:    split feature per node (in the forest's input space)
+ - threshold:  split threshold per node (+inf on leaves)
+ - children:   (n_nodes, 2) left/right child ids; leaves point to themselves
+ - leaf_value: depth of the leaf + average path length correction c(n_leaf)
+
+Scoring a batch is then max_depth rounds of gather/compare over an
+(n_rows, n_trees) node matrix, and reproduces sklearn's scores to float
+rounding error.
+
+save() writes the arrays as .npy files; load() can memory-map them read-only,
+so every worker process scores from the same physical pages.
+"""
+import json
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# maximum absolute difference tolerated between engine and sklearn scores
+DEFAULT_TOLERANCE = 1e-6
+# rows scored per traversal pass
+CHUNK_ROWS = 256
+
+_ARRAYS = ('feature', 'threshold', 'children', 'leaf_value', 'roots')
+_SCALARS = ('max_depth', 'n_features', 'denominator', 'offset')
+
+
+def average_path_length(n_samples):
+    """c(n): average path length of an unsuccessful BST search (sklearn's _average_path_length)."""
+    n = np.asarray(n_samples, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    m = n > 2
+    out[m] = 2.0 * (np.log(n[m] - 1.0) + np.euler_gamma) - 2.0 * (n[m] - 1.0) / n[m]
+    return out
+
+
+def _node_depths(children_left, children_right):
+    depth = np.zeros(len(children_left), dtype=np.float64)
+    # sklearn stores nodes in depth-first order, so parents precede children
+    for i in range(len(children_left)):
+        if children_left[i] != -1:
+            depth[children_left[i]] = depth[i] + 1
+            depth[children_right[i]] = depth[i] + 1
+    return depth
+
+
+class CompiledIsolationForest:
+    def __init__(self, feature, threshold, children, leaf_value, roots, max_depth,
+                 n_features, denominator, offset):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.denominator = float(denominator)
+        self.offset = float(offset)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        feature, threshold, children, leaf_value, roots = [], [], [], [], []
+        base = 0
+        max_depth = 0
+        for est, cols in zip(model.estimators_, model.estimators_features_):
+            t = est.tree_
+            n = t.node_count
+            ids = np.arange(n)
+            is_leaf = t.children_left == -1
+            cols = np.asarray(cols)
+            feature.append(np.where(is_leaf, 0, cols[np.maximum(t.feature, 0)]))
+            threshold.append(np.where(is_leaf, np.inf, t.threshold))
+            children.append(np.stack([
+                np.where(is_leaf, ids, t.children_left) + base,
+                np.where(is_leaf, ids, t.children_right) + base,
+            ], axis=1))
+            depth = _node_depths(t.children_left, t.children_right)
+            leaf_value.append(np.where(is_leaf, depth + average_path_length(t.n_node_samples), 0.0))
+            roots.append(base)
+            max_depth = max(max_depth, t.max_depth)
+            base += n
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(feature), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.concatenate(threshold), dtype=np.float64),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.int32),
+            leaf_value=np.ascontiguousarray(np.concatenate(leaf_value), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            n_features=model.n_features_in_,
+            denominator=len(model.estimators_) * float(average_path_length([model.max_samples_])[0]),
+            offset=model.offset_,
+        )
+
+    def save(self, directory: Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(directory / f'{name}.npy', getattr(self, name))
+        (directory / 'engine.json').write_text(json.dumps({name: getattr(self, name) for name in _SCALARS}))
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> 'CompiledIsolationForest':
+        directory = Path(directory)
+        mode = 'r' if mmap else None
+        # np.asarray drops the np.memmap subclass (slow per-call overhead) but keeps the mapping
+        arrays = {name: np.asarray(np.load(directory / f'{name}.npy', mmap_mode=mode)) for name in _ARRAYS}
+        scalars = json.loads((directory / 'engine.json').read_text())
+        return cls(**arrays, **scalars)
+
+    def _check(self, X):
+        # sklearn scores trees on float32 input; do the same so splits match exactly
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2:
+            raise ValueError(f"Expected 2D array, got {X.ndim}D array instead")
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but IsolationForest is expecting {self.n_features} features as input.")
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        return X
+
+    def score_samples(self, X):
+        X = self._check(X)
+        depths = np.empty(X.shape[0], dtype=np.float64)
+        # chunk rows so the (rows, trees) node matrix stays cache resident
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            depths[start:start + CHUNK_ROWS] = self._path_lengths(X[start:start + CHUNK_ROWS])
+        return -(2.0 ** (-depths / self.denominator))
+
+    def _path_lengths(self, X):
+        flat = np.ascontiguousarray(X).ravel()
+        row_offset = (np.arange(X.shape[0], dtype=np.int32) * X.shape[1])[:, None]
+        children = self.children.ravel()
+        node = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+        for _ in range(self.max_depth):
+            values = flat.take(row_offset + self.feature.take(node))
+            go_right = values > self.threshold.take(node)
+            node = children.take(2 * node + go_right)
+        return self.leaf_value.take(node).sum(axis=1)
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset
+
+    def max_abs_error(self, model, X) -> float:
+        """Largest difference between this engine's and sklearn's decision_function on X."""
+        return float(np.max(np.abs(self.decision_function(X) - model.decision_function(np.asarray(X, dtype=np.float64)))))
+
+
+def compile_forest(model, tolerance: float = DEFAULT_TOLERANCE, probe_rows: int = 64) -> Optional[CompiledIsolationForest]:
+    """Compile a fitted IsolationForest and verify it against sklearn on probe rows.
+
+    Returns None (callers keep using sklearn) if the model is missing, is not an
+    IsolationForest, or the compiled scores disagree beyond `tolerance`.
+    """
+    if model is None or not hasattr(model, 'estimators_features_'):
+        return None
+    try:
+        engine = CompiledIsolationForest.from_sklearn(model)
+        probe = np.random.RandomState(0).normal(0.0, 3.0, size=(probe_rows, engine.n_features))
+        err = engine.max_abs_error(model, probe)
+    except Exception as e:
+        logger.warning('could not compile IsolationForest: %s', e)
+        return None
+    if err > tolerance:
+        logger.warning('compiled IsolationForest disagrees with sklearn (max error %.3g); using sklearn', err)
+        return None
+    return engine
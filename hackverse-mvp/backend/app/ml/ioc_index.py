@@ -0,0 +1,338 @@
+"""Indicator-of-compromise index for fast IP / CIDR lookups.
+
+Feeds (CSV or plain lists, one IP or CIDR per line) are bulk-loaded into a
+few sorted arrays:
+
+ - v4_ips:                 sorted unique uint32 addresses
+ - v4_starts / v4_ends:    disjoint, sorted uint32 ranges merged from CIDRs
+ - v6_ips, v6_starts/ends: the same for IPv6, as 16-byte big-endian strings
+                           (S16 sorts bytewise, which is numeric order)
+
+An exact IP is found by binary search; an address is inside a CIDR if the last
+range starting at or below it also ends at or above it. Both are single
+np.searchsorted calls, so contains_many() checks a whole batch at once.
+
+IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) are looked up as IPv4.
+
+save() writes each array as a .npy file plus meta.json; load() maps them
+read-only, so opening an index is O(1) and every worker process shares the
+same pages through the OS page cache.
+
+IOCIndexWatcher serves the index saved in a directory and re-checks its
+meta.json mtime at most every `check_interval` seconds, like the signature
+engine does with its rules file. Because save() swaps the directory in
+atomically, rebuilding the index from updated feeds is picked up without a
+restart. Until an index exists, and whenever a load fails, the watcher keeps
+what it had.
+
+Build from the command line:
+    python -m backend.app.ml.ioc_index --out models/ioc feed1.csv feed2.txt
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+_ARRAYS = ('v4_ips', 'v4_starts', 'v4_ends', 'v6_ips', 'v6_starts', 'v6_ends')
+_HEADER_NAMES = {'ip', 'ips', 'indicator', 'ioc', 'cidr', 'network', 'value', 'address'}
+_V4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+
+
+def _parse_ip(text: str):
+    """Return (4, int) or (6, bytes16) for an address string, or None."""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), 'big')
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, text)
+    except OSError:
+        return None
+    if packed[:12] == _V4_MAPPED_PREFIX:
+        return 4, int.from_bytes(packed[12:], 'big')
+    return 6, packed
+
+
+def _parse_indicator(text: str):
+    """Return (version, start, end) for an IP or CIDR string, or None."""
+    text = text.strip()
+    if '/' not in text:
+        parsed = _parse_ip(text)
+        if parsed is None:
+            return None
+        return parsed[0], parsed[1], None
+    addr, _, plen = text.partition('/')
+    parsed = _parse_ip(addr)
+    if parsed is None or not plen.isdigit():
+        return None
+    version, value = parsed
+    bits = 32 if version == 4 else 128
+    plen = int(plen)
+    if version == 4 and ':' in addr:
+        # prefix was written against the IPv4-mapped IPv6 form
+        plen -= 96
+    if not 0 <= plen <= bits:
+        return None
+    if version == 6:
+        value = int.from_bytes(value, 'big')
+    host_mask = (1 << (bits - plen)) - 1
+    start = value & ~host_mask
+    end = start | host_mask
+    if version == 6:
+        return 6, start.to_bytes(16, 'big'), end.to_bytes(16, 'big')
+    return 4, start, end
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def read_feed(path: Path) -> Iterable[str]:
+    """Yield indicator strings from a CSV file or a plain one-per-line list."""
+    path = Path(path)
+    with path.open('r', newline='', encoding='utf-8', errors='replace') as f:
+        if path.suffix.lower() != '.csv':
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    yield line
+            return
+        reader = csv.reader(f)
+        column = 0
+        for i, row in enumerate(reader):
+            if not row or row[0].lstrip().startswith('#'):
+                continue
+            if i == 0:
+                names = [c.strip().lower() for c in row]
+                header = [j for j, n in enumerate(names) if n in _HEADER_NAMES]
+                if header:
+                    column = header[0]
+                    continue
+            if column < len(row):
+                yield row[column]
+
+
+class IOCIndex:
+    def __init__(self, v4_ips, v4_starts, v4_ends, v6_ips, v6_starts, v6_ends, meta=None):
+        self.v4_ips = v4_ips
+        self.v4_starts = v4_starts
+        self.v4_ends = v4_ends
+        self.v6_ips = v6_ips
+        self.v6_starts = v6_starts
+        self.v6_ends = v6_ends
+        self.meta = meta or {}
+
+    @classmethod
+    def build(cls, indicators: Iterable[str], meta=None) -> 'IOCIndex':
+        v4_ips, v6_ips, v4_ranges, v6_ranges = [], [], [], []
+        rejected = 0
+        for text in indicators:
+            parsed = _parse_indicator(text)
+            if parsed is None:
+                rejected += 1
+                continue
+            version, start, end = parsed
+            if end is None:
+                (v4_ips if version == 4 else v6_ips).append(start)
+            elif version == 4:
+                v4_ranges.append((start, end))
+            else:
+                v6_ranges.append((int.from_bytes(start, 'big'), int.from_bytes(end, 'big')))
+        v4 = _merge_ranges(v4_ranges)
+        v6 = _merge_ranges(v6_ranges)
+        meta = dict(meta or {})
+        meta.update({
+            'built_at': time.time(),
+            'v4_ips': 0, 'v6_ips': 0, 'v4_ranges': len(v4), 'v6_ranges': len(v6),
+            'rejected': rejected,
+        })
+        index = cls(
+            v4_ips=np.unique(np.array(v4_ips, dtype=np.uint32)),
+            v4_starts=np.array([r[0] for r in v4], dtype=np.uint32),
+            v4_ends=np.array([r[1] for r in v4], dtype=np.uint32),
+            v6_ips=np.unique(np.array(v6_ips, dtype='S16')),
+            v6_starts=np.array([r[0].to_bytes(16, 'big') for r in v6], dtype='S16'),
+            v6_ends=np.array([r[1].to_bytes(16, 'big') for r in v6], dtype='S16'),
+            meta=meta,
+        )
+        index.meta['v4_ips'] = int(len(index.v4_ips))
+        index.meta['v6_ips'] = int(len(index.v6_ips))
+        return index
+
+    @classmethod
+    def from_feeds(cls, paths: Sequence[Path]) -> 'IOCIndex':
+        def indicators():
+            for p in paths:
+                yield from read_feed(p)
+        return cls.build(indicators(), meta={'feeds': [str(p) for p in paths]})
+
+    def save(self, directory: Path):
+        """Write the index to `directory`, replacing any previous index atomically."""
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix='.ioc-', dir=directory.parent))
+        for name in _ARRAYS:
+            np.save(tmp / f'{name}.npy', np.ascontiguousarray(getattr(self, name)))
+        (tmp / 'meta.json').write_text(json.dumps(self.meta))
+        old = None
+        if directory.exists():
+            old = directory.with_name(directory.name + f'.old-{os.getpid()}')
+            os.replace(directory, old)
+        os.replace(tmp, directory)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> 'IOCIndex':
+        directory = Path(directory)
+        mode = 'r' if mmap else None
+        # np.asarray drops the np.memmap subclass (slow per-call overhead) but keeps the mapping
+        arrays = {name: np.asarray(np.load(directory / f'{name}.npy', mmap_mode=mode)) for name in _ARRAYS}
+        meta = json.loads((directory / 'meta.json').read_text())
+        return cls(meta=meta, **arrays)
+
+    def __len__(self):
+        return len(self.v4_ips) + len(self.v6_ips) + len(self.v4_starts) + len(self.v6_starts)
+
+    @staticmethod
+    def _match(ips, starts, ends, key):
+        # key must already have the arrays' dtype: searchsorted with a Python int
+        # converts the whole array on every call
+        i = ips.searchsorted(key)
+        if i < len(ips) and ips[i] == key:
+            return 'ip'
+        j = starts.searchsorted(key, side='right') - 1
+        if j >= 0 and ends[j] >= key:
+            return 'cidr'
+        return None
+
+    def lookup(self, ip: str) -> Optional[str]:
+        """Return 'ip' for an exact indicator, 'cidr' if inside a listed range, else None."""
+        parsed = _parse_ip(ip)
+        if parsed is None:
+            return None
+        version, value = parsed
+        if version == 4:
+            return self._match(self.v4_ips, self.v4_starts, self.v4_ends, np.uint32(value))
+        # a 0-d S16 array, not np.bytes_: scalars drop trailing NUL bytes and compare unequal
+        return self._match(self.v6_ips, self.v6_starts, self.v6_ends, np.array(value, dtype='S16'))
+
+    def contains(self, ip: str) -> bool:
+        return self.lookup(ip) is not None
+
+    @staticmethod
+    def _match_many(ips, starts, ends, keys):
+        hit = np.zeros(len(keys), dtype=bool)
+        if len(ips):
+            i = np.minimum(np.searchsorted(ips, keys), len(ips) - 1)
+            hit |= ips[i] == keys
+        if len(starts):
+            j = np.searchsorted(starts, keys, side='right') - 1
+            hit |= (j >= 0) & (ends[np.maximum(j, 0)] >= keys)
+        return hit
+
+    def contains_many(self, ips: Sequence[str]) -> np.ndarray:
+        """Vectorized contains() for a batch of address strings."""
+        v4_idx, v4_keys, v6_idx, v6_keys = [], [], [], []
+        for n, ip in enumerate(ips):
+            parsed = _parse_ip(ip) if ip else None
+            if parsed is None:
+                continue
+            if parsed[0] == 4:
+                v4_idx.append(n)
+                v4_keys.append(parsed[1])
+            else:
+                v6_idx.append(n)
+                v6_keys.append(parsed[1])
+        hit = np.zeros(len(ips), dtype=bool)
+        if v4_idx:
+            hit[v4_idx] = self._match_many(self.v4_ips, self.v4_starts, self.v4_ends, np.array(v4_keys, dtype=np.uint32))
+        if v6_idx:
+            hit[v6_idx] = self._match_many(self.v6_ips, self.v6_starts, self.v6_ends, np.array(v6_keys, dtype='S16'))
+        return hit
+
+
+class IOCIndexWatcher:
+    """The index saved in `directory`, reloaded when a new one is saved there."""
+
+    def __init__(self, directory: Path, check_interval: float = 5.0):
+        self.directory = Path(directory)
+        self.check_interval = check_interval
+        self._index: Optional[IOCIndex] = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> Optional[IOCIndex]:
+        """Load the saved index; keeps the current one if there is none or it cannot be read."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.directory / 'meta.json').st_mtime_ns
+                index = IOCIndex.load(self.directory)
+            except FileNotFoundError:
+                # not built yet, or save() is between its two renames
+                return self._index
+            except (OSError, ValueError) as e:
+                logger.warning('could not load IOC index from %s: %s', self.directory, e)
+                return self._index
+            self._index = index
+            self._mtime = mtime
+            logger.info('loaded IOC index from %s (%d entries)', self.directory, len(index))
+            return index
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.check_interval
+            try:
+                changed = os.stat(self.directory / 'meta.json').st_mtime_ns != self._mtime
+            except OSError:
+                changed = False
+        finally:
+            self._lock.release()
+        if changed:
+            self.reload()
+
+    def current(self) -> Optional[IOCIndex]:
+        """The index, after picking up a newly saved one; None until one has been built."""
+        self._maybe_reload()
+        return self._index
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Build an IOC index from feed files')
+    parser.add_argument('feeds', nargs='+', help='CSV files or plain lists of IPs / CIDRs')
+    parser.add_argument('--out', '-o', required=True, help='output directory')
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    index = IOCIndex.from_feeds([Path(p) for p in args.feeds])
+    index.save(Path(args.out))
+    print(f"Built IOC index in {time.perf_counter() - t0:.1f}s: {json.dumps(index.meta)}")
+
+
+if __name__ == '__main__':
+    main()
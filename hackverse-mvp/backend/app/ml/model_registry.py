@@ -0,0 +1,256 @@
+"""Versioned registry for the IsolationForest models used by the agents.
+
+Layout under models/registry/ (or MODEL_REGISTRY_PATH):
+
+    <name>/<version>/meta.json     name, version, kind, n_features, offset, created_at, ...
+    <name>/<version>/*.npy         compiled forest arrays (kind 'compiled')
+    <name>/<version>/model.joblib  the sklearn model, if it could not be compiled (kind 'joblib')
+    <name>/CURRENT                 the active version
+
+publish() compiles a fitted model (forest_engine.compile_forest), writes it to
+a temporary directory and renames that into place, then points CURRENT at it
+with an atomic replace. Readers therefore only ever see complete versions.
+
+get() loads the active version on first use and memory-maps its arrays
+read-only, so every worker process on the host shares one copy in the page
+cache. It re-reads CURRENT at most every `check_interval` seconds; a new
+version is loaded completely before it replaces the old one, and requests
+already holding the old LoadedModel finish with it, so a swap never fails a
+request. Versions are never deleted here, which keeps old mappings valid.
+
+If a model has no published version yet but its legacy joblib file exists
+(models/edr_iso.joblib, models/iso_forest.joblib), get() imports it once as
+version 'legacy-<mtime>'. joblib (and through it sklearn) is only imported to
+read or write pickled models, so serving compiled versions never imports sklearn.
+
+Command line:
+    python -m backend.app.ml.model_registry list
+    python -m backend.app.ml.model_registry publish anomaly path/to/model.joblib
+    python -m backend.app.ml.model_registry activate anomaly v2
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.app.logger import get_logger
+from backend.app.ml.forest_engine import CompiledIsolationForest, compile_forest
+
+logger = get_logger(__name__)
+
+MODELS_DIR = Path(__file__).parent / 'models'
+REGISTRY_DIR = MODELS_DIR / 'registry'
+# pre-registry model files, imported on first use
+LEGACY_FILES = {'edr': 'edr_iso.joblib', 'anomaly': 'iso_forest.joblib'}
+
+
+class LoadedModel:
+    """One loaded model version; scores through the compiled engine when there is one."""
+
+    def __init__(self, name: str, version: str, meta: Dict[str, Any], engine=None, model=None):
+        self.name = name
+        self.version = version
+        self.meta = meta
+        self.engine = engine
+        self.model = model
+        self.n_features = int(meta['n_features'])
+        self.offset = float(meta['offset'])
+
+    def decision_function(self, X):
+        if self.engine is not None:
+            return self.engine.decision_function(X)
+        return self.model.decision_function(np.asarray(X, dtype=np.float64))
+
+
+class ModelRegistry:
+    def __init__(self, root: Optional[Path] = None, check_interval: float = 5.0, legacy_dir: Path = MODELS_DIR):
+        self.root = Path(root) if root else REGISTRY_DIR
+        self.check_interval = check_interval
+        self.legacy_dir = Path(legacy_dir)
+        self._loaded: Dict[str, LoadedModel] = {}
+        self._next_check: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def current_version(self, name: str) -> Optional[str]:
+        try:
+            return (self.root / name / 'CURRENT').read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self, name: str) -> List[str]:
+        d = self.root / name
+        if not d.is_dir():
+            return []
+        return sorted(p.name for p in d.iterdir() if (p / 'meta.json').exists())
+
+    def _next_version(self, name: str) -> str:
+        numbers = [int(v[1:]) for v in self.versions(name) if v[:1] == 'v' and v[1:].isdigit()]
+        return f'v{max(numbers, default=0) + 1}'
+
+    def publish(self, name: str, model, version: Optional[str] = None, activate: bool = True,
+                meta: Optional[Dict[str, Any]] = None) -> str:
+        """Store a fitted IsolationForest as a new version of `name`; returns the version."""
+        version = version or self._next_version(name)
+        target = self.root / name / version
+        if target.exists():
+            raise FileExistsError(f"{name} {version} already exists")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        engine = compile_forest(model)
+        info = dict(meta or {})
+        info.update({
+            'name': name, 'version': version, 'kind': 'compiled' if engine is not None else 'joblib',
+            'n_features': int(model.n_features_in_), 'offset': float(model.offset_),
+            'n_estimators': len(model.estimators_), 'created_at': time.time(),
+        })
+        tmp = Path(tempfile.mkdtemp(prefix=f'.{version}-', dir=target.parent))
+        try:
+            if engine is not None:
+                engine.save(tmp)
+            else:
+                import joblib
+                joblib.dump(model, tmp / 'model.joblib')
+            (tmp / 'meta.json').write_text(json.dumps(info, indent=2))
+            os.rename(tmp, target)
+        except BaseException as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if isinstance(e, OSError) and target.exists():
+                raise FileExistsError(f"{name} {version} already exists") from e
+            raise
+        logger.info('published model %s %s (%s)', name, version, info['kind'])
+        if activate:
+            self.activate(name, version)
+        return version
+
+    def activate(self, name: str, version: str):
+        """Point CURRENT at `version`; processes pick it up on their next check."""
+        if not (self.root / name / version / 'meta.json').exists():
+            raise FileNotFoundError(f"{name} {version} is not published")
+        fd, tmp = tempfile.mkstemp(prefix='.CURRENT-', dir=self.root / name)
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp, self.root / name / 'CURRENT')
+        # this process switches on its next get()
+        self._next_check[name] = 0.0
+
+    def load(self, name: str, version: str) -> LoadedModel:
+        d = self.root / name / version
+        meta = json.loads((d / 'meta.json').read_text())
+        if meta['kind'] == 'compiled':
+            return LoadedModel(name, version, meta, engine=CompiledIsolationForest.load(d, mmap=True))
+        import joblib
+        return LoadedModel(name, version, meta, model=joblib.load(d / 'model.joblib'))
+
+    def get(self, name: str) -> Optional[LoadedModel]:
+        """The active version of `name`, loaded on first use; None if there is none."""
+        loaded = self._loaded.get(name)
+        if time.monotonic() < self._next_check.get(name, 0.0):
+            return loaded
+        # one thread re-checks; the others keep the model they have
+        if not self._lock.acquire(blocking=loaded is None):
+            return loaded
+        try:
+            return self._refresh(name)
+        finally:
+            self._lock.release()
+
+    def _refresh(self, name: str) -> Optional[LoadedModel]:
+        loaded = self._loaded.get(name)
+        now = time.monotonic()
+        if now < self._next_check.get(name, 0.0):
+            # another thread just checked
+            return loaded
+        self._next_check[name] = now + self.check_interval
+        version = self.current_version(name)
+        if version is None:
+            version = self._import_legacy(name)
+            if version is None:
+                return loaded
+        if loaded is not None and loaded.version == version:
+            return loaded
+        try:
+            new = self.load(name, version)
+        except Exception as e:
+            logger.warning('could not load model %s %s, keeping %s: %s', name, version,
+                           loaded.version if loaded else None, e)
+            return loaded
+        self._loaded[name] = new
+        logger.info('loaded model %s %s', name, version)
+        return new
+
+    def _import_legacy(self, name: str) -> Optional[str]:
+        filename = LEGACY_FILES.get(name)
+        path = self.legacy_dir / filename if filename else None
+        if path is None or not path.exists():
+            return None
+        version = f'legacy-{int(path.stat().st_mtime)}'
+        if not (self.root / name / version / 'meta.json').exists():
+            import joblib
+            try:
+                self.publish(name, joblib.load(path), version=version, activate=False, meta={'source': str(path)})
+            except FileExistsError:
+                # another worker imported it first
+                pass
+            except Exception as e:
+                logger.warning('could not import legacy model %s: %s', path, e)
+                return None
+        if self.current_version(name) is None:
+            self.activate(name, version)
+        return self.current_version(name)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Process-wide registry (path and check interval from settings)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from backend.app.deps import get_settings
+                settings = get_settings()
+                _registry = ModelRegistry(settings.model_registry_path or None, settings.model_check_interval)
+    return _registry
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Manage published IsolationForest models')
+    parser.add_argument('--root', help='registry directory (default: settings / models/registry)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list')
+    p = sub.add_parser('publish', help='publish a joblib IsolationForest as a new version')
+    p.add_argument('name')
+    p.add_argument('path')
+    p.add_argument('--version')
+    p.add_argument('--no-activate', action='store_true')
+    p = sub.add_parser('activate', help='make a published version current')
+    p.add_argument('name')
+    p.add_argument('version')
+    args = parser.parse_args(argv)
+    import joblib
+
+    registry = ModelRegistry(args.root) if args.root else get_model_registry()
+    if args.command == 'publish':
+        version = registry.publish(args.name, joblib.load(args.path), version=args.version,
+                                   activate=not args.no_activate, meta={'source': args.path})
+        print(f"published {args.name} {version}")
+    elif args.command == 'activate':
+        registry.activate(args.name, args.version)
+        print(f"{args.name} -> {args.version}")
+    else:
+        names = sorted(p.name for p in registry.root.iterdir() if p.is_dir()) if registry.root.is_dir() else []
+        for name in names:
+            current = registry.current_version(name)
+            print(f"{name}: " + ', '.join(v + ('*' if v == current else '') for v in registry.versions(name)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Multi-pattern signature engine shared by the keyword-based agents.
+
+Rules live in a JSON file (default: rules/signatures.json), one object per rule:
+
+    {"id": "SIG-0001", "group": "Signature Detection", "pattern": "malware",
+     "fields": ["event_type"], "case_sensitive": false, "score": 0.95}
+
+`group` is the technique of the agent that consumes the rule; `score` is
+between 0 and 1 (default 1), or the file is rejected. For every
+(field, case sensitivity) pair the engine builds one Aho-Corasick automaton over
+all patterns for that field, so matching a field against thousands of rules is
+a single pass over its characters. Case-insensitive rules are matched against
+the lower-cased value.
+
+Results are memoized per (field, value): agents share one engine, so the
+second agent that looks at the same event_type gets the cached answer.
+
+SignatureEngine.reload() rebuilds from the file and swaps the compiled rule
+set in atomically; match() also re-checks the file's mtime at most every
+`check_interval` seconds, so edits are picked up without a restart.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+RULES_DIR = Path(__file__).parent / 'rules'
+DEFAULT_RULES = RULES_DIR / 'signatures.json'
+# distinct (field, value) pairs remembered per compiled rule set
+MATCH_CACHE_SIZE = 65536
+
+
+class Rule(NamedTuple):
+    id: str
+    group: str
+    pattern: str
+    fields: tuple
+    case_sensitive: bool
+    score: float
+
+
+def parse_rules(items: Iterable[Dict[str, Any]]) -> List[Rule]:
+    rules = []
+    for i, item in enumerate(items):
+        pattern = item.get('pattern')
+        if not pattern:
+            raise ValueError(f"rule #{i} has no pattern")
+        score = float(item.get('score', 1.0))
+        # agents return rule scores as is, and the ensemble (and its cascade bounds) expects 0..1
+        if not 0.0 <= score <= 1.0:
+            raise ValueError(f"rule #{i} has score {score}; scores must be between 0 and 1")
+        rules.append(Rule(
+            id=str(item.get('id') or f'rule-{i}'),
+            group=item.get('group', ''),
+            pattern=pattern,
+            fields=tuple(item.get('fields') or ('event_type',)),
+            case_sensitive=bool(item.get('case_sensitive', False)),
+            score=score,
+        ))
+    return rules
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton mapping each pattern to an integer label."""
+
+    def __init__(self, patterns: Iterable[tuple]):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [frozenset()]
+        outputs = [set()]
+        for pattern, label in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    outputs.append(set())
+                state = nxt
+            outputs[state].add(label)
+        # breadth-first: a state's fail link always points to a shallower state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                outputs[nxt] |= outputs[self.fail[nxt]]
+        self.out = [frozenset(o) for o in outputs]
+
+    def search(self, text: str) -> set:
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class CompiledSignatures:
+    def __init__(self, rules: List[Rule], version: int = 0):
+        self.rules = rules
+        self.version = version
+        self.by_group: Dict[str, List[int]] = {}
+        group_fields: Dict[str, set] = {}
+        per_field: Dict[tuple, list] = {}
+        for idx, r in enumerate(rules):
+            self.by_group.setdefault(r.group, []).append(idx)
+            group_fields.setdefault(r.group, set()).update(r.fields)
+            pattern = r.pattern if r.case_sensitive else r.pattern.lower()
+            for field in r.fields:
+                per_field.setdefault((field, r.case_sensitive), []).append((pattern, idx))
+        self.fields = sorted({f for f, _ in per_field})
+        self.group_fields = {g: tuple(sorted(fs)) for g, fs in group_fields.items()}
+        self.automata = {key: AhoCorasick(pats) for key, pats in per_field.items()}
+        self.match_field = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match_field)
+
+    def _match_field(self, field: str, value: str) -> FrozenSet[int]:
+        found = set()
+        sensitive = self.automata.get((field, True))
+        if sensitive is not None:
+            found |= sensitive.search(value)
+        insensitive = self.automata.get((field, False))
+        if insensitive is not None:
+            found |= insensitive.search(value.lower())
+        return frozenset(found)
+
+    def match(self, event: Dict[str, Any]) -> FrozenSet[int]:
+        found = set()
+        for field in self.fields:
+            value = event.get(field)
+            if isinstance(value, str) and value:
+                found |= self.match_field(field, value)
+        return frozenset(found)
+
+
+class SignatureEngine:
+    def __init__(self, path: Optional[Path] = None, check_interval: float = 5.0):
+        self.path = Path(path) if path else DEFAULT_RULES
+        self.check_interval = check_interval
+        self._compiled = CompiledSignatures([], version=0)
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    @property
+    def version(self) -> int:
+        return self._compiled.version
+
+    def __len__(self):
+        return len(self._compiled.rules)
+
+    def current_version(self) -> int:
+        """version, after picking up a changed rules file (as match() would)."""
+        self._maybe_reload()
+        return self._compiled.version
+
+    def group_fields(self, group: str) -> tuple:
+        """Event fields searched by the rules of `group`."""
+        return self._compiled.group_fields.get(group, ())
+
+    def reload(self) -> int:
+        """Rebuild from the rules file; keeps the current rules if the file is invalid."""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                rules = parse_rules(json.loads(self.path.read_text(encoding='utf-8')))
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                logger.warning('could not load signatures from %s: %s', self.path, e)
+                return self._compiled.version
+            self._compiled = CompiledSignatures(rules, version=self._compiled.version + 1)
+            self._mtime = mtime
+            logger.info('loaded %d signatures from %s (version %d)', len(rules), self.path, self._compiled.version)
+            return self._compiled.version
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.check_interval
+            try:
+                changed = os.stat(self.path).st_mtime_ns != self._mtime
+            except OSError:
+                changed = False
+        finally:
+            self._lock.release()
+        if changed:
+            self.reload()
+
+    def match(self, event: Dict[str, Any], group: Optional[str] = None) -> List[Rule]:
+        """Rules matching any of their fields in `event`, optionally limited to one group."""
+        self._maybe_reload()
+        compiled = self._compiled
+        hits = compiled.match(event)
+        if not hits:
+            return []
+        if group is None:
+            return [compiled.rules[i] for i in sorted(hits)]
+        return [compiled.rules[i] for i in compiled.by_group.get(group, ()) if i in hits]
+
+    def match_ids(self, event: Dict[str, Any]) -> List[str]:
+        return [r.id for r in self.match(event)]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> SignatureEngine:
+    """Process-wide engine used by the agents (rules path from settings)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from backend.app.deps import get_settings
+                settings = get_settings()
+                _engine = SignatureEngine(settings.signature_rules_path or None, settings.signature_check_interval)
+    return _engine
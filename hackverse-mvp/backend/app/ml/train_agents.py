@@ -1,10 +1,12 @@
 """
-Train agent-specific models (EDR and Anomaly) and save them to backend/app/ml/models/
+Train agent-specific models (EDR and Anomaly), save them to backend/app/ml/models/
+and publish them to the model registry as new versions.
 """
 from pathlib import Path
 import joblib
 import numpy as np
-from sklearn.ensemble import IsolationForest
+from backend.app.ml.model_registry import get_model_registry
+from backend.app.ml.training import fit_forest
 
 MODELS_DIR = Path(__file__).parent / 'models'
 MODELS_DIR.mkdir(exist_ok=True)
@@ -23,22 +25,25 @@ def generate_synthetic(n_samples=3000, n_features=6, seed=42):
     return X
 
 
-def train_and_save(path, X, n_estimators=100, contamination=0.01):
+def train_and_save(path, X, n_estimators=100, contamination=0.01, name=None):
     print(f"Training IsolationForest -> {path} shape={X.shape}")
-    model = IsolationForest(n_estimators=n_estimators, contamination=contamination, random_state=42)
-    model.fit(X)
+    model, report = fit_forest(X, n_estimators=n_estimators, contamination=contamination, n_jobs=-1)
     joblib.dump(model, path)
     print(f"Saved model: {path}")
+    if name:
+        # running servers switch to the new version on their next registry check
+        version = get_model_registry().publish(name, model, meta={'source': str(path), 'training': report})
+        print(f"Published {name} {version}")
 
 
 def main():
     # EDR model trained on 6-dim endpoint telemetry
     X_edr = generate_synthetic(n_samples=2500, n_features=6, seed=1)
-    train_and_save(EDR_MODEL, X_edr, n_estimators=100, contamination=0.02)
+    train_and_save(EDR_MODEL, X_edr, n_estimators=100, contamination=0.02, name='edr')
 
     # Anomaly model trained on 4-dim logs/features
     X_anom = generate_synthetic(n_samples=2000, n_features=4, seed=2)
-    train_and_save(ANOM_MODEL, X_anom, n_estimators=100, contamination=0.01)
+    train_and_save(ANOM_MODEL, X_anom, n_estimators=100, contamination=0.01, name='anomaly')
 
 if __name__ == '__main__':
     main()
@@ -1,19 +1,25 @@
 """
-Train and save an IsolationForest model for the HACKVERSE MVP.
+Train an IsolationForest model for the HACKVERSE MVP and publish it to the model registry.
 
 Usage:
   - Use default synthetic data for a quick train:
-      python train_model.py
-  - Train from a CSV file (rows=observations, cols=features):
-      python train_model.py --input data.csv --output iso_forest.joblib --n-estimators 100 --contamination 0.01
-
-The trained model is saved into the `backend/app/ml/models/` directory as `iso_forest.joblib` by default.
+      python -m backend.app.ml.train_model
+  - Train from a CSV or NDJSON export (rows=observations, cols=features; .gz is fine), streamed in chunks:
+      python -m backend.app.ml.train_model --input data.csv --max-samples 1000000 --n-jobs -1
+  - Stratify the sample by a column (e.g. the event source), or re-train from the .npy a previous run wrote:
+      python -m backend.app.ml.train_model --input events.ndjson --max-samples 500000 --stratify source
+      python -m backend.app.ml.train_model --input data.npy --n-estimators 200
+
+The model is published as a new version of `anomaly` (see model_registry.py) in the compiled,
+memory-mapped format the servers load; its training report (rows/s, fit time, peak memory) is
+stored in the version's meta.json and printed. `--output` also writes a joblib file.
 """
 from pathlib import Path
 import argparse
-import joblib
+import json
 import numpy as np
-from sklearn.ensemble import IsolationForest
+from backend.app.ml.model_registry import get_model_registry
+from backend.app.ml.training import CHUNK_ROWS, fit_forest, ingest, read_chunks, sample_rows
 
 MODELS_DIR = Path(__file__).parent / 'models'
 MODELS_DIR.mkdir(exist_ok=True)
@@ -22,15 +28,31 @@ DEFAULT_MODEL = MODELS_DIR / 'iso_forest.joblib'
 
 
 def load_csv(path: Path):
-    import csv
-    rows = []
-    with path.open('r', newline='') as f:
-        reader = csv.reader(f)
-        for r in reader:
-            if not r:
-                continue
-            rows.append([float(x) for x in r])
-    return np.array(rows)
+    # small files only; large ones go through training.ingest
+    _, chunks = read_chunks(path)
+    return np.concatenate([X for X, _ in chunks])
+
+
+def load_input(args):
+    """(X, report) for --input: a .npy is memory-mapped, CSV/NDJSON is streamed into one."""
+    path = Path(args.input)
+    if not path.exists():
+        raise SystemExit(f"Input file not found: {path}")
+    if path.suffix == '.npy':
+        X = np.load(path, mmap_mode='r')
+        report = {'input': str(path), 'rows': int(X.shape[0])}
+    else:
+        npy = None if args.no_npy else Path(args.npy or path.with_name(path.name.split('.')[0] + '.npy'))
+        result = ingest(path, npy, chunk_rows=args.chunk_rows, max_samples=args.max_samples,
+                        stratify=args.stratify, columns=args.columns.split(',') if args.columns else None)
+        report = result['info']
+        if result['sample'] is not None:
+            return result['sample'], report
+        X = result['data']
+    if args.max_samples:
+        report['sampling'] = 'uniform'
+        X = sample_rows(X, args.max_samples)
+    return X, report
 
 
 def generate_synthetic(n_samples=2000, n_features=4):
@@ -40,34 +62,52 @@ def generate_synthetic(n_samples=2000, n_features=4):
     return X
 
 
-def train_and_save(X, n_estimators=100, contamination=0.01, output_path=DEFAULT_MODEL):
+def train_and_save(X, n_estimators=100, contamination=0.01, output_path=None, name=None, n_jobs=None, report=None):
     print(f"Training IsolationForest (n_estimators={n_estimators}, contamination={contamination}) on data shape {X.shape}")
-    model = IsolationForest(n_estimators=n_estimators, contamination=contamination, random_state=42)
-    model.fit(X)
-    joblib.dump(model, output_path)
-    print(f"Saved model to {output_path}")
+    model, fit_report = fit_forest(X, n_estimators=n_estimators, contamination=contamination, n_jobs=n_jobs)
+    report = dict(report or {}, **fit_report)
+    if output_path:
+        import joblib
+        joblib.dump(model, output_path)
+        print(f"Saved model to {output_path}")
+    if name:
+        version = get_model_registry().publish(name, model, meta={'source': report.get('input', 'synthetic'), 'training': report})
+        print(f"Published {name} {version}")
+    print(json.dumps(report, indent=2))
+    return model, report
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--input', '-i', type=str, help='CSV file with numeric features')
-    parser.add_argument('--output', '-o', type=str, default=str(DEFAULT_MODEL), help='Output joblib path')
+    parser.add_argument('--input', '-i', type=str, help='CSV/NDJSON file (optionally .gz) or a .npy written by an earlier run')
+    parser.add_argument('--output', '-o', type=str, help=f'also write a joblib file (e.g. {DEFAULT_MODEL})')
     parser.add_argument('--n-estimators', type=int, default=100)
     parser.add_argument('--contamination', type=float, default=0.01)
+    parser.add_argument('--n-jobs', type=int, default=-1, help='cores to build trees on (-1: all)')
+    parser.add_argument('--max-samples', type=int, help='fit on a random sample of at most this many rows')
+    parser.add_argument('--stratify', type=str, help='column/field whose values are sampled proportionally')
+    parser.add_argument('--columns', type=str, help='comma-separated feature columns (default: all)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--npy', type=str, help='where to write the parsed data (default: next to --input)')
+    parser.add_argument('--no-npy', action='store_true', help='do not keep the parsed data (needs --max-samples)')
     parser.add_argument('--samples', type=int, default=2000)
     parser.add_argument('--features', type=int, default=4)
+    parser.add_argument('--name', type=str, default='anomaly', help='model registry name to publish under')
+    parser.add_argument('--no-publish', action='store_true', help='only write the joblib file')
     args = parser.parse_args()
+    if args.no_publish and not args.output:
+        raise SystemExit('--no-publish needs --output')
+    if args.no_npy and not args.max_samples:
+        raise SystemExit('--no-npy needs --max-samples')
 
     if args.input:
-        input_path = Path(args.input)
-        if not input_path.exists():
-            raise SystemExit(f"Input file not found: {input_path}")
-        X = load_csv(input_path)
+        X, report = load_input(args)
     else:
-        X = generate_synthetic(n_samples=args.samples, n_features=args.features)
+        X, report = generate_synthetic(n_samples=args.samples, n_features=args.features), {'input': 'synthetic'}
 
-    out = Path(args.output)
-    train_and_save(X, n_estimators=args.n_estimators, contamination=args.contamination, output_path=out)
+    train_and_save(X, n_estimators=args.n_estimators, contamination=args.contamination,
+                   output_path=Path(args.output) if args.output else None,
+                   name=None if args.no_publish else args.name, n_jobs=args.n_jobs, report=report)
 
 
 if __name__ == '__main__':
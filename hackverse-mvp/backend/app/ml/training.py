@@ -0,0 +1,358 @@
+"""Out-of-core training pipeline for the IsolationForest models.
+
+Large telemetry exports never have to fit in memory:
+
+  1. read_chunks() streams a CSV or NDJSON file (optionally .gz) in chunks of
+     `chunk_rows` rows, parsed straight to float32.
+  2. ingest() appends every chunk to an on-disk .npy file (NpyWriter) that can
+     be memory-mapped later, so re-training with other parameters skips the
+     parse. At the same time it draws a uniform reservoir sample of at most
+     `max_samples` rows, or one reservoir per value of a `stratify` column
+     whose sizes are set proportionally to each stratum's row count at the end.
+  3. fit_forest() fits on the sample - or on the memory-mapped data when there
+     is no `max_samples` - building trees and scoring the training rows for
+     the contamination offset on `n_jobs` cores.
+
+The report (rows, rows/s, fit time, peak RSS, ...) is returned alongside the
+model, and train_model.py stores it in the registry's meta.json as `training`
+when it publishes the model in the registry's compiled, memory-mapped format.
+"""
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_ROWS = 100_000
+# bytes reserved for the .npy header, so it can be rewritten once the row count is known
+NPY_HEADER_SIZE = 128
+
+
+def _open(path: Path):
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', newline='')
+    return path.open('r', newline='')
+
+
+def _format(path: Path) -> str:
+    suffixes = [s for s in path.suffixes if s != '.gz']
+    suffix = suffixes[-1] if suffixes else ''
+    if suffix in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if suffix == '.csv':
+        return 'csv'
+    raise ValueError(f"unsupported input {path.name}: expected .csv, .ndjson or .jsonl (optionally .gz)")
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _csv_chunks(f, chunk_rows: int, columns: Optional[Sequence[str]], stratify: Optional[str]):
+    first = f.readline()
+    while first and not first.strip():
+        first = f.readline()
+    if not first:
+        return
+    fields = [x.strip() for x in first.rstrip('\r\n').split(',')]
+    if all(_is_number(x) for x in fields):
+        # no header: every column is a feature
+        if columns or stratify:
+            raise ValueError('columns/stratify need a CSV header row')
+        names = [str(i) for i in range(len(fields))]
+        lines = itertools.chain([first], f)
+    else:
+        names = fields
+        lines = f
+    wanted = list(columns) if columns else [n for n in names if n != stratify]
+    missing = [n for n in wanted + ([stratify] if stratify else []) if n not in names]
+    if missing:
+        raise ValueError(f"CSV has no column(s) {missing}")
+    usecols = [names.index(n) for n in wanted]
+    yield wanted
+    while True:
+        block = list(itertools.islice(lines, chunk_rows))
+        if not block:
+            return
+        X = np.loadtxt(block, delimiter=',', dtype=np.float32, usecols=usecols, ndmin=2)
+        strata = np.loadtxt(block, delimiter=',', dtype=str, usecols=[names.index(stratify)], ndmin=1) if stratify else None
+        yield X, strata
+
+
+def _ndjson_chunks(f, chunk_rows: int, columns: Optional[Sequence[str]], stratify: Optional[str]):
+    """Lines are events ({"source": ..., "features": {...}}) or flat feature objects."""
+    lines = (line for line in f if line.strip())
+    first = next(lines, None)
+    if first is None:
+        return
+    wanted = list(columns) if columns else _ndjson_columns(json.loads(first), stratify)
+    yield wanted
+    lines = itertools.chain([first], lines)
+    n = 0
+    while True:
+        block = list(itertools.islice(lines, chunk_rows))
+        if not block:
+            return
+        rows, strata = [], []
+        for line in block:
+            n += 1
+            record = json.loads(line)
+            features = _ndjson_features(record)
+            try:
+                rows.append([features[c] for c in wanted])
+            except KeyError as e:
+                raise ValueError(f"line {n}: missing feature {e.args[0]!r}") from None
+            if stratify:
+                strata.append(str(record.get(stratify)))
+        yield np.array(rows, dtype=np.float32), (np.array(strata) if stratify else None)
+
+
+def _ndjson_features(record):
+    features = record.get('features')
+    return features if isinstance(features, dict) else record
+
+
+def _ndjson_columns(record, stratify):
+    # the serving-side column order: the source's registered schema, else key order
+    from backend.app.ml.feature_schema import get_registry
+    features = _ndjson_features(record)
+    schema = get_registry().get(record.get('source')) if features is not record else None
+    if schema is not None:
+        return list(schema.features)
+    return [c for c in features if c != stratify]
+
+
+def read_chunks(path, chunk_rows: int = CHUNK_ROWS, columns: Optional[Sequence[str]] = None,
+                stratify: Optional[str] = None) -> Tuple[List[str], Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]]:
+    """(feature columns, iterator of (float32 chunk, stratum labels or None))."""
+    path = Path(path)
+    reader = _csv_chunks if _format(path) == 'csv' else _ndjson_chunks
+
+    def chunks():
+        with _open(path) as f:
+            it = reader(f, chunk_rows, columns, stratify)
+            names = next(it, None)
+            if names is None:
+                return
+            yield names
+            yield from it
+
+    it = chunks()
+    names = next(it, None)
+    if names is None:
+        raise ValueError(f"{path} contains no rows")
+    return names, it
+
+
+class NpyWriter:
+    """Appends float32 rows to a .npy file whose row count is only known at the end."""
+
+    def __init__(self, path, n_features: int):
+        self.path = Path(path)
+        self.n_features = n_features
+        self.rows = 0
+        self._tmp = self.path.with_name(f'.{self.path.name}.tmp')
+        self._f = self._tmp.open('wb')
+        self._f.write(self._header(0))
+
+    def _header(self, rows: int) -> bytes:
+        header = repr({'descr': '<f4', 'fortran_order': False, 'shape': (rows, self.n_features)})
+        prefix = np.lib.format.magic(1, 0)
+        body = header.ljust(NPY_HEADER_SIZE - len(prefix) - 2 - 1) + '\n'
+        return prefix + len(body).to_bytes(2, 'little') + body.encode('latin1')
+
+    def append(self, X: np.ndarray):
+        X = np.ascontiguousarray(X, dtype='<f4')
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected rows of {self.n_features} features, got shape {X.shape}")
+        self._f.write(X.tobytes())
+        self.rows += len(X)
+
+    def close(self) -> Path:
+        self._f.seek(0)
+        self._f.write(self._header(self.rows))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self):
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class Reservoir:
+    """Uniform sample of at most `capacity` rows from a stream (Algorithm R, one chunk at a time)."""
+
+    def __init__(self, capacity: int, n_features: int, rng: np.random.Generator):
+        self.capacity = capacity
+        self.rng = rng
+        self.data = np.empty((capacity, n_features), dtype=np.float32)
+        self.seen = 0
+
+    def add(self, X: np.ndarray):
+        fill = min(max(self.capacity - self.seen, 0), len(X))
+        if fill:
+            self.data[self.seen:self.seen + fill] = X[:fill]
+        rest = X[fill:]
+        if len(rest):
+            # row i of the stream replaces a random slot with probability capacity / (i + 1)
+            positions = np.arange(self.seen + fill, self.seen + len(X)) + 1
+            slots = (self.rng.random(len(rest)) * positions).astype(np.int64)
+            hit = np.flatnonzero(slots < self.capacity)
+            if len(hit):
+                # a later row wins a slot over an earlier one, as in the sequential algorithm
+                _, last = np.unique(slots[hit][::-1], return_index=True)
+                keep = hit[::-1][last]
+                self.data[slots[keep]] = rest[keep]
+        self.seen += len(X)
+
+    def sample(self, n: Optional[int] = None) -> np.ndarray:
+        rows = self.data[:min(self.seen, self.capacity)]
+        if n is None or n >= len(rows):
+            return rows
+        return rows[np.sort(self.rng.choice(len(rows), n, replace=False))]
+
+
+class StratifiedSampler:
+    """One reservoir per stratum; the final sample gives each stratum its share of rows."""
+
+    def __init__(self, capacity: int, n_features: int, rng: np.random.Generator):
+        self.capacity = capacity
+        self.n_features = n_features
+        self.rng = rng
+        self.reservoirs: Dict[str, Reservoir] = {}
+
+    def add(self, X: np.ndarray, strata: np.ndarray):
+        labels, inverse = np.unique(strata, return_inverse=True)
+        for k, label in enumerate(labels):
+            reservoir = self.reservoirs.get(label)
+            if reservoir is None:
+                reservoir = self.reservoirs[label] = Reservoir(self.capacity, self.n_features, self.rng)
+            reservoir.add(X[inverse == k])
+
+    def allocation(self) -> Dict[str, int]:
+        """Rows per stratum: proportional to its count (largest remainder), at least one each."""
+        counts = {k: r.seen for k, r in self.reservoirs.items()}
+        total = sum(counts.values())
+        if total <= self.capacity:
+            return counts
+        exact = {k: self.capacity * c / total for k, c in counts.items()}
+        quota = {k: max(1, int(e)) for k, e in exact.items()}
+        order = sorted(exact, key=lambda k: exact[k] - int(exact[k]), reverse=True)
+        for k in itertools.islice(itertools.cycle(order), max(self.capacity - sum(quota.values()), 0)):
+            quota[k] += 1
+        return quota
+
+    def sample(self) -> np.ndarray:
+        allocation = self.allocation()
+        parts = [self.reservoirs[k].sample(n) for k, n in sorted(allocation.items())]
+        return np.concatenate(parts) if parts else np.empty((0, self.n_features), dtype=np.float32)
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def ingest(path, out: Optional[Path] = None, chunk_rows: int = CHUNK_ROWS, max_samples: Optional[int] = None,
+           stratify: Optional[str] = None, columns: Optional[Sequence[str]] = None, seed: int = 42) -> Dict[str, Any]:
+    """Stream `path` into `out` (.npy) and/or a sample; returns data, sample and counters."""
+    if out is None and not max_samples:
+        raise ValueError('need an output .npy path, max_samples, or both')
+    if stratify and not max_samples:
+        raise ValueError('stratify needs max_samples')
+    t0 = time.perf_counter()
+    names, chunks = read_chunks(path, chunk_rows, columns, stratify)
+    rng = np.random.default_rng(seed)
+    writer = NpyWriter(out, len(names)) if out else None
+    sampler = None
+    if max_samples:
+        sampler = (StratifiedSampler if stratify else Reservoir)(max_samples, len(names), rng)
+    rows = 0
+    try:
+        for X, strata in chunks:
+            if writer:
+                writer.append(X)
+            if stratify:
+                sampler.add(X, strata)
+            elif sampler:
+                sampler.add(X)
+            rows += len(X)
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    data = writer.close() if writer else None
+    seconds = time.perf_counter() - t0
+    info = {
+        'input': str(path), 'columns': names, 'rows': rows, 'ingest_seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None, 'data_path': str(data) if data else None,
+        'sampling': ('stratified' if stratify else 'reservoir') if sampler else None,
+    }
+    if stratify:
+        info['strata'] = sampler.allocation()
+    logger.info('ingested %d rows from %s in %.1fs', rows, path, seconds)
+    return {'info': info, 'data': np.load(data, mmap_mode='r') if data else None,
+            'sample': sampler.sample() if sampler else None}
+
+
+def sample_rows(X: np.ndarray, max_samples: int, seed: int = 42) -> np.ndarray:
+    """Uniform sample of an already materialized (e.g. memory-mapped .npy) dataset, read in row order."""
+    if max_samples >= len(X):
+        return X
+    idx = np.sort(np.random.default_rng(seed).choice(len(X), max_samples, replace=False))
+    return X[idx]
+
+
+def _score_samples(model, X, n_jobs: Optional[int], chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """model.score_samples(X) over row chunks on `n_jobs` threads (tree traversal releases the GIL)."""
+    from concurrent.futures import ThreadPoolExecutor
+    from joblib import effective_n_jobs
+    starts = range(0, X.shape[0], chunk_rows)
+    with ThreadPoolExecutor(max_workers=effective_n_jobs(n_jobs)) as pool:
+        return np.concatenate(list(pool.map(lambda i: model.score_samples(X[i:i + chunk_rows]), starts)))
+
+
+def fit_forest(X, n_estimators: int = 100, contamination: float = 0.01, n_jobs: Optional[int] = None,
+               random_state: int = 42):
+    """Fit an IsolationForest using `n_jobs` cores; returns (model, report).
+
+    The model equals IsolationForest(contamination=...).fit(X), but the
+    training-set scoring that sets `offset_` - most of the time on large
+    inputs, and single-threaded in sklearn - runs in parallel chunks.
+    """
+    from sklearn.ensemble import IsolationForest
+    t0 = time.perf_counter()
+    model = IsolationForest(n_estimators=n_estimators, contamination='auto', random_state=random_state, n_jobs=n_jobs)
+    model.fit(X)
+    t1 = time.perf_counter()
+    if contamination != 'auto':
+        model.contamination = contamination
+        model.offset_ = np.percentile(_score_samples(model, X, n_jobs), 100.0 * contamination)
+    seconds = time.perf_counter() - t0
+    report = {
+        'fit_rows': int(X.shape[0]), 'n_features': int(X.shape[1]), 'n_estimators': n_estimators,
+        'contamination': contamination, 'n_jobs': n_jobs, 'fit_seconds': round(seconds, 3),
+        'offset_seconds': round(seconds - (t1 - t0), 3), 'peak_rss_mb': peak_rss_mb(),
+    }
+    logger.info('fitted IsolationForest on %s in %.1fs', X.shape, seconds)
+    return model, report
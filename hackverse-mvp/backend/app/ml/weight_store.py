@@ -0,0 +1,96 @@
+"""Versioned in-memory store for per-technique ensemble weights.
+
+The detect hot path reads weights from an immutable WeightSnapshot held in a
+single attribute, so lookups never take a lock. Writers (the /weights
+endpoints) update `agent_weights` and bump a one-row `weight_version` counter
+in the same transaction. Every process - each uvicorn worker and each detection
+pool process - checks that counter at most once per `check_interval_ms` and, if
+it moved, reloads the weights and swaps in a new snapshot. A check that is due
+is done by whichever request gets the refresh lock first; everyone else keeps
+reading the current snapshot without waiting.
+"""
+import threading
+import time
+from typing import Dict, NamedTuple
+
+from sqlalchemy import Column, String, Float, Integer, update
+
+from backend.app.database import SessionLocal
+from backend.app.deps import get_settings
+from backend.app.models.user import Base
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AgentWeight(Base):
+    __tablename__ = 'agent_weights'
+    technique = Column(String, primary_key=True)
+    weight = Column(Float, default=1.0)
+
+
+class WeightVersion(Base):
+    __tablename__ = 'weight_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class WeightSnapshot(NamedTuple):
+    version: int
+    weights: Dict[str, float]
+
+
+def bump_weight_version(db):
+    """Increment the shared weight version; call inside the transaction that changed weights."""
+    res = db.execute(update(WeightVersion).where(WeightVersion.id == 1).values(version=WeightVersion.version + 1))
+    if res.rowcount == 0:
+        db.add(WeightVersion(id=1, version=1))
+
+
+class WeightStore:
+    def __init__(self, check_interval_ms: float = 500.0, session_factory=SessionLocal):
+        self.check_interval = check_interval_ms / 1000.0
+        self.session_factory = session_factory
+        self._snapshot = WeightSnapshot(-1, {})
+        self._next_check = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def current(self) -> WeightSnapshot:
+        now = time.monotonic()
+        if now >= self._next_check and self._refresh_lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.check_interval
+                self._refresh()
+            finally:
+                self._refresh_lock.release()
+        return self._snapshot
+
+    def get(self, technique: str, default: float = 1.0) -> float:
+        return self.current().weights.get(technique, default)
+
+    def refresh(self):
+        """Reload now if the shared version moved (e.g. right after a local write)."""
+        with self._refresh_lock:
+            self._next_check = time.monotonic() + self.check_interval
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            db = self.session_factory()
+            try:
+                row = db.query(WeightVersion.version).filter(WeightVersion.id == 1).first()
+                version = row[0] if row else 0
+                if version == self._snapshot.version:
+                    return
+                weights = {aw.technique: float(aw.weight) for aw in db.query(AgentWeight).all()}
+            finally:
+                db.close()
+        except Exception as e:
+            # DB might not exist yet; keep the current snapshot
+            logger.debug('weight refresh failed: %s', e)
+            return
+        self._snapshot = WeightSnapshot(version, weights)
+
+
+# process-wide store shared by every EnsembleAnalyzer and the /weights endpoints
+weight_store = WeightStore(check_interval_ms=get_settings().weight_check_interval_ms)
@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Text, Index, text
+from backend.app.models.user import Base
+import datetime
+
+class Detection(Base):
+    __tablename__ = 'detections'
+    id = Column(Integer, primary_key=True)
+    detected_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # the event as received
+    source = Column(String)
+    timestamp = Column(String)
+    ip = Column(String)
+    user = Column(String)
+    event_type = Column(String)
+    features = Column(Text)  # JSON
+    # the ensemble's verdict
+    aggregate_score = Column(Float)
+    is_threat = Column(Boolean)
+    top_technique = Column(String)
+    result = Column(Text)  # JSON: per_technique, skipped, ...
+
+    # history listing is newest first by (detected_at, id); each filter gets an index that ends in
+    # the same key, so filter + time range + keyset page is a single index range scan. Threats are
+    # a small minority, so they get a partial index rather than one on a two-valued column.
+    __table_args__ = (
+        Index('ix_detections_time', 'detected_at', 'id'),
+        Index('ix_detections_ip_time', 'ip', 'detected_at', 'id'),
+        Index('ix_detections_user_time', 'user', 'detected_at', 'id'),
+        Index('ix_detections_technique_time', 'top_technique', 'detected_at', 'id'),
+        Index('ix_detections_threats_time', 'detected_at', 'id',
+              sqlite_where=text('is_threat = 1'), postgresql_where=text('is_threat')),
+    )
+
+
+# rollups, updated in the transaction that inserts the detections (see detection_rollups.py);
+# clustered on (bucket, key) so a time range is one contiguous scan
+
+class _TechniqueCounts:
+    bucket = Column(DateTime, primary_key=True)
+    technique = Column(String, primary_key=True)  # '' for no top technique
+    count = Column(Integer, nullable=False, default=0)
+    threats = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    max_score = Column(Float, nullable=False, default=0.0)
+    __table_args__ = {'sqlite_with_rowid': False}
+
+
+class _IpCounts:
+    bucket = Column(DateTime, primary_key=True)
+    ip = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    threats = Column(Integer, nullable=False, default=0)
+    __table_args__ = {'sqlite_with_rowid': False}
+
+
+class DetectionMinute(_TechniqueCounts, Base):
+    __tablename__ = 'detection_rollup_minute'
+
+
+class DetectionHour(_TechniqueCounts, Base):
+    __tablename__ = 'detection_rollup_hour'
+
+
+class DetectionIpHour(_IpCounts, Base):
+    __tablename__ = 'detection_rollup_ip_hour'
+
+
+class DetectionIpDay(_IpCounts, Base):
+    __tablename__ = 'detection_rollup_ip_day'
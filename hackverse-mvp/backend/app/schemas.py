@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, conlist, confloat
 from typing import Optional, Dict
 
+MAX_BATCH_EVENTS = 10000
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -22,6 +24,13 @@ class ThreatEvent(BaseModel):
     event_type: str
     features: Dict[str, float]
 
+class ThreatEventBatch(BaseModel):
+    events: conlist(ThreatEvent, min_items=1, max_items=MAX_BATCH_EVENTS)
+
+class WeightItem(BaseModel):
+    technique: str
+    weight: confloat(ge=0)
+
 class DetectionResult(BaseModel):
     is_threat: bool
     score: float
@@ -0,0 +1,53 @@
+"""Helpers for full-duplex NDJSON endpoints (stream in, stream out)."""
+from typing import AsyncIterator, Tuple
+from starlette.responses import StreamingResponse
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse that can run while the request body is still being read.
+
+    Starlette's StreamingResponse listens on `receive` for a disconnect while it
+    streams, which would swallow request body chunks that the body iterator
+    still needs. Here the request stream itself reports disconnects instead
+    (it raises ClientDisconnect), so `receive` is left alone.
+    """
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[bytes, bool]]:
+    """Split a byte stream into lines, holding at most one partial line in memory.
+
+    Yields (line, too_long). A line longer than `max_line_bytes` is dropped up to
+    its terminating newline and reported once as (b'', True).
+    """
+    buf = b''
+    skipping = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            nl = chunk.find(b'\n', start)
+            if nl == -1:
+                break
+            if skipping:
+                skipping = False
+            else:
+                line = buf + chunk[start:nl]
+                buf = b''
+                if len(line) > max_line_bytes:
+                    yield b'', True
+                elif line.strip():
+                    yield line, False
+            start = nl + 1
+        if not skipping:
+            buf += chunk[start:]
+            if len(buf) > max_line_bytes:
+                buf = b''
+                skipping = True
+                yield b'', True
+    if buf.strip() and not skipping:
+        yield buf, False
@@ -0,0 +1,74 @@
+"""Background warm-up, so importing the app stays cheap.
+
+Importing backend.app.main only defines the app; nothing touches the
+database, loads a model, index or rules file, or starts a pool. Those are
+steps of a Warmup that runs in a daemon thread once the server has started.
+The server answers /healthz (liveness) immediately, and /readyz returns 503
+with per-step progress until every required step is done; load balancers and
+orchestrators should route traffic on /readyz.
+
+A step that fails is reported with its error. Failing required steps keep
+/readyz at 503; optional ones (e.g. pre-spawning the password pool) do not.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Warmup:
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any], bool]]):
+        """`steps` are (name, fn, required) tuples, run in order."""
+        self.steps = steps
+        self.status: Dict[str, Dict[str, Any]] = {
+            name: {'state': 'pending', 'seconds': None, 'required': required} for name, _, required in steps
+        }
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return all(s['state'] == 'done' for s in self.status.values() if s['required'])
+
+    def run(self):
+        self.started_at = time.monotonic()
+        for name, fn, _ in self.steps:
+            status = self.status[name]
+            status['state'] = 'running'
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                status['state'] = 'failed'
+                status['error'] = str(e)
+                logger.exception('warm-up step %s failed', name)
+            else:
+                status['state'] = 'done'
+            status['seconds'] = round(time.perf_counter() - t0, 4)
+        self.finished_at = time.monotonic()
+        logger.info('warm-up finished in %.2fs (ready=%s)', self.finished_at - self.started_at, self.ready)
+
+    def start(self):
+        """Run the steps in a background thread (once)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def report(self) -> Dict[str, Any]:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return {
+            'ready': self.ready,
+            'elapsed': round(end - self.started_at, 4) if self.started_at is not None else None,
+            'steps': self.status,
+        }
@@ -0,0 +1,104 @@
+"""Per-agent and ensemble micro-benchmarks, compared against a baseline.
+
+Times every agent class in backend/app/ml/agents.py, and EnsembleAnalyzer
+over all of them, on the same synthetic events:
+
+  analyze        one event per call, per-call p50/p99 (us)
+  analyze_batch  --batch-size events per call, mean cost per event (us),
+                 best of --repeat passes
+
+Forest agents get events as wide as their model expects. Every agent and
+the ensemble are fresh instances warmed up on --warmup events first, and the
+ensemble uses a static weight store, so nothing touches the database.
+
+Results are compared with the [agents] section of benchmarks/baseline.json
+([agents.<mode>] for another --mode; see benchmarks/common.py);
+--save-baseline records a new one.
+
+Usage (from hackverse-mvp/):
+    python -m benchmarks.bench_agents --events 2000
+    python -m benchmarks.bench_agents --events 2000 --save-baseline
+"""
+import argparse
+import sys
+import time
+
+from benchmarks.common import StaticWeights, add_baseline_args, finish, make_events, percentiles, scratch_dir
+
+SECTION = 'agents'
+
+
+def time_analyze(analyze, events):
+    latencies = []
+    for e in events:
+        t0 = time.perf_counter()
+        analyze(e)
+        latencies.append(time.perf_counter() - t0)
+    return percentiles(latencies, scale=1e6, unit='us')
+
+
+def time_batches(analyze_batch, events, size, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for i in range(0, len(events), size):
+            analyze_batch(events[i:i + size])
+        best = min(best, time.perf_counter() - t0)
+    return best / len(events) * 1e6
+
+
+def bench(name, target, events, args, metrics):
+    for e in events[:args.warmup]:
+        target.analyze(e)
+    single = time_analyze(target.analyze, events)
+    per_event = time_batches(target.analyze_batch, events, args.batch_size, args.repeat)
+    metrics[f'{name}.analyze_p50_us'] = single['p50_us']
+    metrics[f'{name}.analyze_p99_us'] = single['p99_us']
+    metrics[f'{name}.batch_per_event_us'] = per_event
+    print(f"{name:<20} analyze p50 {single['p50_us']:9.1f} us  p95 {single['p95_us']:9.1f} us  "
+          f"p99 {single['p99_us']:9.1f} us   batch {per_event:9.2f} us/event")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--features', type=int, default=4, help='features per event for agents without a model')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=3, help='analyze_batch passes (best is kept)')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--mode', default='full', choices=['full', 'cascade', 'concurrent'], help='ensemble mode')
+    parser.add_argument('--agent', action='append', help='only these agent classes (repeatable)')
+    parser.add_argument('--seed', type=int, default=7)
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    scratch_dir()
+    from backend.app.ml.agents import ALL_AGENTS, ForestAgent
+    from backend.app.ml.ensemble import EnsembleAnalyzer
+
+    events = {args.features: make_events(args.events, args.features, args.seed)}
+    metrics = {}
+    agents = [type(a)() for a in ALL_AGENTS]
+    # all first, as the app's warm-up does: the feature schemas only accept widths of loaded models
+    for agent in agents:
+        agent.warm()
+    for agent in agents:
+        cls = type(agent)
+        if args.agent and cls.__name__ not in args.agent:
+            continue
+        width = args.features
+        if isinstance(agent, ForestAgent) and agent.current_model() is not None:
+            width = agent.current_model().n_features
+        if width not in events:
+            events[width] = make_events(args.events, width, args.seed)
+        bench(cls.__name__, agent, events[width], args, metrics)
+    if not args.agent or 'EnsembleAnalyzer' in args.agent:
+        ensemble = EnsembleAnalyzer(agents=agents, weight_store=StaticWeights(), mode=args.mode)
+        bench('EnsembleAnalyzer', ensemble, events[args.features], args, metrics)
+
+    print()
+    sys.exit(finish(args, SECTION if args.mode == 'full' else f'{SECTION}.{args.mode}', metrics))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Cascade vs full ensemble evaluation: latency saved and decision agreement.
+
+Scores the same synthetic events with EnsembleAnalyzer in 'full' and
+'cascade' mode, one event at a time (the /detect path) and in batches (the
+executor / batch path), and reports latency percentiles, how often the two
+modes reach the same is_threat decision (should be 100%), and how many agents
+the cascade skipped on average.
+
+Usage (from hackverse-mvp/):
+    python -m benchmarks.bench_cascade --events 2000 --batch-size 64
+"""
+import argparse
+import time
+from collections import Counter
+
+import numpy as np
+
+from backend.app.ml.ensemble import EnsembleAnalyzer
+from benchmarks.common import StaticWeights, make_events
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000.0
+    return (f"p50 {np.percentile(ms, 50):.3f} ms  p95 {np.percentile(ms, 95):.3f} ms  "
+            f"p99 {np.percentile(ms, 99):.3f} ms  mean {ms.mean():.3f} ms")
+
+
+def single(analyzer, events):
+    latencies, results = [], []
+    for e in events:
+        t0 = time.perf_counter()
+        results.append(analyzer.analyze(e))
+        latencies.append(time.perf_counter() - t0)
+    return latencies, results
+
+
+def batched(analyzer, events, size):
+    latencies, results = [], []
+    for i in range(0, len(events), size):
+        t0 = time.perf_counter()
+        results.extend(analyzer.analyze_batch(events[i:i + size]))
+        latencies.append(time.perf_counter() - t0)
+    return latencies, results
+
+
+def report(name, full, cascade):
+    (full_lat, full_res), (casc_lat, casc_res) = full, cascade
+    agree = sum(f['is_threat'] == c['is_threat'] for f, c in zip(full_res, casc_res))
+    skipped = Counter(t for r in casc_res for t in r['skipped'])
+    saved_mean = 1.0 - sum(casc_lat) / sum(full_lat)
+    saved_p50 = 1.0 - np.median(casc_lat) / np.median(full_lat)
+    print(f"== {name}")
+    print(f"  full:    {percentiles(full_lat)}")
+    print(f"  cascade: {percentiles(casc_lat)}")
+    print(f"  latency saved: {saved_mean:.1%} mean, {saved_p50:.1%} p50   decision agreement: {agree}/{len(full_res)} ({agree / len(full_res):.2%})")
+    print(f"  agents skipped per event: {sum(skipped.values()) / len(casc_res):.2f}")
+    for technique, count in skipped.most_common():
+        print(f"    {technique:<30} {count / len(casc_res):.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--features', type=int, default=4, help='features per event (the anomaly model expects 4)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.features, args.seed)
+    full = EnsembleAnalyzer(weight_store=StaticWeights(), mode='full')
+    cascade = EnsembleAnalyzer(weight_store=StaticWeights(), mode='cascade')
+    # warm up, and let the cascade measure agent costs
+    for e in events[:50]:
+        full.analyze(e)
+        cascade.analyze(e)
+    print('measured cost per event (us): ' + ', '.join(
+        f"{t}={c * 1e6:.1f}" for t, c in sorted(cascade.costs.items(), key=lambda kv: kv[1])))
+
+    report('single event', single(full, events), single(cascade, events))
+    report(f'batches of {args.batch_size}', batched(full, events, args.batch_size),
+           batched(cascade, events, args.batch_size))
+
+
+if __name__ == '__main__':
+    main()
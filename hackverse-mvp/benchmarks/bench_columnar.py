@@ -0,0 +1,129 @@
+"""CPU per event of the JSON batch path vs the columnar msgpack path.
+
+Runs the app in-process (no sockets) and sends the same synthetic events as
+--requests batches of --batch-size to:
+
+  json              POST /detect/batch, JSON in and out
+  columnar          POST /detect/columnar, msgpack in, JSON out
+  columnar_msgpack  POST /detect/columnar, msgpack in and out
+
+measuring process CPU time (all threads, so scoring on the executor pool
+counts too) per event. Parsing alone is timed outside the app as well:
+JSON decoding plus ThreatEvent validation, the feature schema check and the
+EventBatch conversion, against columnar.decode_batch. The detection store
+is off so its SQLite writes do not blur the comparison.
+
+Results are compared with the [columnar] section of benchmarks/baseline.json
+(see benchmarks/common.py); --save-baseline records a new one.
+
+Usage (from hackverse-mvp/; needs msgpack):
+    python -m benchmarks.bench_columnar --batch-size 256 --requests 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from benchmarks.common import add_baseline_args, finish, make_events, scratch_dir
+
+SECTION = 'columnar'
+
+
+def cpu_per_event(fn, repeat, n_events):
+    fn()
+    t0 = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - t0) / (repeat * n_events) * 1e6
+
+
+async def run_app(args, events, json_body, columnar_body):
+    import httpx
+    from backend.app import columnar
+    from backend.app.auth import create_access_token
+    from backend.app.main import app, warmup
+    from benchmarks.bench_login import BENCH_USER, ensure_user
+
+    ensure_user()
+    await app.router.startup()
+    while not warmup.ready:
+        await asyncio.sleep(0.05)
+    headers = {'Authorization': 'Bearer ' + create_access_token({'sub': BENCH_USER})}
+    paths = {
+        'json': ('/api/v1/threats/detect/batch', {'json': json_body}, headers),
+        'columnar': ('/api/v1/threats/detect/columnar', {'content': columnar_body}, headers),
+        'columnar_msgpack': ('/api/v1/threats/detect/columnar', {'content': columnar_body},
+                             {**headers, 'Accept': columnar.MEDIA_TYPE}),
+    }
+    out = {}
+    try:
+        async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+            for name, (path, body, hdrs) in paths.items():
+                for _ in range(args.warmup):
+                    (await client.post(path, headers=hdrs, **body)).raise_for_status()
+                t0 = time.process_time()
+                for _ in range(args.requests):
+                    (await client.post(path, headers=hdrs, **body)).raise_for_status()
+                out[name] = (time.process_time() - t0) / (args.requests * len(events)) * 1e6
+    finally:
+        await app.router.shutdown()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--requests', type=int, default=40, help='timed requests per path')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--features', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=7)
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    scratch_dir()
+    os.environ.setdefault('DETECTION_STORE_ENABLED', 'false')
+    from backend.app import columnar
+    if not columnar.available():
+        print('msgpack is not installed (pip install msgpack)')
+        sys.exit(1)
+    from backend.app.ml.feature_schema import get_registry
+    from backend.app.schemas import MAX_BATCH_EVENTS, ThreatEventBatch
+
+    events = make_events(args.batch_size, args.features, args.seed)
+    json_body = {'events': events}
+    json_bytes = json.dumps(json_body).encode()
+    columnar_body = columnar.encode_batch(events)
+    registry = get_registry()
+
+    def parse_json():
+        batch = ThreatEventBatch.parse_raw(json_bytes)
+        parsed = [e.dict() for e in batch.events]
+        for e in parsed:
+            registry.validate(e)
+        return registry.build_batch(parsed)
+
+    def parse_columnar():
+        return columnar.decode_batch(columnar_body, registry, MAX_BATCH_EVENTS)
+
+    repeat = max(1, args.requests)
+    metrics = {
+        'parse_json_us_per_event': cpu_per_event(parse_json, repeat, len(events)),
+        'parse_columnar_us_per_event': cpu_per_event(parse_columnar, repeat, len(events)),
+    }
+    for name, us in asyncio.run(run_app(args, events, json_body, columnar_body)).items():
+        metrics[f'{name}_cpu_us_per_event'] = us
+
+    print(f"{len(events)} events per request, {args.features} features; body {len(json_bytes):,} B JSON, "
+          f"{len(columnar_body):,} B msgpack")
+    print(f"parse only:  JSON {metrics['parse_json_us_per_event']:8.2f} us/event   "
+          f"columnar {metrics['parse_columnar_us_per_event']:8.2f} us/event")
+    for name in ('json', 'columnar', 'columnar_msgpack'):
+        print(f"end to end:  {name:<17} {metrics[f'{name}_cpu_us_per_event']:8.2f} us CPU/event")
+    print()
+    sys.exit(finish(args, SECTION, metrics))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Throughput and memory of the SIEM correlation engine at millions of distinct keys.
+
+Feeds --events synthetic events through CorrelationEngine.observe() with the
+rules in backend/app/ml/rules/correlations.json (or --rules), on a simulated
+clock that advances --rate events per second, so windows slide and idle keys
+are evicted as in production. Users and IPs are drawn from --keys distinct
+values each, a --hot share of events from a small set of brute-forcing keys
+so the rules also fire. Events are generated in chunks outside the timed
+loop.
+
+Reports events/s, the per-event p50/p99 of observe() (sampled), keys held
+and resident memory per key (RSS growth over the run divided by keys held).
+
+Results are compared with the [correlation] section of
+benchmarks/baseline.json (see benchmarks/common.py); --save-baseline
+records a new one.
+
+Usage (from hackverse-mvp/):
+    python -m benchmarks.bench_correlation --events 2000000 --keys 1000000
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.common import add_baseline_args, finish, percentiles, scratch_dir
+
+SECTION = 'correlation'
+CHUNK = 100000
+HOT_KEYS = 50
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            import os
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        # peak rather than current where /proc is missing (kB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def make_chunk(rng, n, keys, hot):
+    events = []
+    for _ in range(n):
+        if rng.random() < hot:
+            k = rng.randrange(HOT_KEYS)
+            events.append({'event_type': 'login_failed', 'user': f'hot{k}', 'ip': f'192.0.2.{k}'})
+        else:
+            events.append({'event_type': rng.choice(('login', 'login_failed', 'network_scan', 'file_access')),
+                           'user': f'u{rng.randrange(keys)}', 'ip': f'ip{rng.randrange(keys)}'})
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=2000000)
+    parser.add_argument('--keys', type=int, default=1000000, help='distinct users and distinct IPs')
+    parser.add_argument('--rate', type=float, default=20000.0, help='simulated events per second')
+    parser.add_argument('--hot', type=float, default=0.01, help='share of events from brute-forcing keys')
+    parser.add_argument('--rules', help='correlation rules JSON (default: the shipped rules)')
+    parser.add_argument('--buckets', type=int, default=10)
+    parser.add_argument('--max-keys', type=int, default=1000000, help='keys kept per rule')
+    parser.add_argument('--sample-every', type=int, default=100, help='time every Nth observe() for percentiles')
+    parser.add_argument('--seed', type=int, default=7)
+    add_baseline_args(parser)
+    args = parser.parse_args()
+
+    scratch_dir()
+    from backend.app.ml.correlation import CorrelationEngine
+
+    engine = CorrelationEngine.from_file(args.rules, buckets=args.buckets, max_keys=args.max_keys)
+    rng = random.Random(args.seed)
+    rss0 = rss_bytes()
+    now, step = 0.0, 1.0 / args.rate
+    elapsed, fired, samples = 0.0, 0, []
+    done = 0
+    while done < args.events:
+        events = make_chunk(rng, min(CHUNK, args.events - done), args.keys, args.hot)
+        observe = engine.observe
+        t0 = time.perf_counter()
+        for i, e in enumerate(events):
+            now += step
+            if i % args.sample_every:
+                fired += bool(observe(e, now))
+            else:
+                s0 = time.perf_counter()
+                fired += bool(observe(e, now))
+                samples.append(time.perf_counter() - s0)
+        elapsed += time.perf_counter() - t0
+        done += len(events)
+        del events
+    keys = len(engine)
+    rss = rss_bytes() - rss0
+
+    stats = percentiles(samples, scale=1e6, unit='us')
+    throughput = done / elapsed
+    print(f"{done} events over {now:.0f} simulated s, {len(engine.rules)} rules: "
+          f"{throughput:,.0f} events/s, observe p50 {stats['p50_us']:.2f} us  p99 {stats['p99_us']:.2f} us")
+    print(f"fired on {fired} events ({fired / done:.2%}); {keys:,} keys held, "
+          f"RSS +{rss / 2**20:.0f} MiB ({rss / max(keys, 1):.0f} B/key)")
+    for rule_id, s in engine.stats().items():
+        print(f"  {rule_id:<28} keys {s['keys']:>10,}  capacity evictions {s['evictions']:>10,}")
+    print()
+    metrics = {'observe_per_s': throughput, 'observe_p50_us': stats['p50_us'], 'observe_p99_us': stats['p99_us']}
+    sys.exit(finish(args, SECTION, metrics))
+
+
+if __name__ == '__main__':
+    main()
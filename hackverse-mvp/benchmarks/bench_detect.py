@@ -0,0 +1,224 @@
+"""End-to-end load test of /api/v1/threats/detect (or /detect/batch).
+
+Sends synthetic events (benchmarks/common.py) to the app, either
+
+  --target inprocess   the FastAPI app in this process (httpx ASGI transport,
+                       startup/shutdown hooks run, warm-up awaited)
+  --target uvicorn     a uvicorn server started in a scratch directory, or an
+                       already running one with --url (and --username/--password)
+
+with one of two load models:
+
+  --concurrency N      closed loop: N clients each send the next request as soon
+                       as the previous one answers
+  --rate R             open loop: requests start on a fixed schedule of R/s,
+                       whether or not earlier ones have answered; latency is
+                       measured from the scheduled start, so queueing is counted
+
+and reports throughput and p50/p95/p99 latency over --duration seconds, after
+--warmup-requests unmeasured requests. Results are compared with the matching
+section of benchmarks/baseline.json (one per target/endpoint/load); see
+benchmarks/common.py for --save-baseline and --threshold.
+
+Usage (from hackverse-mvp/, needs httpx):
+    python -m benchmarks.bench_detect --concurrency 16 --duration 10
+    python -m benchmarks.bench_detect --rate 200 --duration 10 --target uvicorn
+    python -m benchmarks.bench_detect --endpoint batch --batch-size 64 --concurrency 4
+"""
+import argparse
+import asyncio
+import itertools
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.bench_startup import child_env, free_port, wait_for
+from benchmarks.common import add_baseline_args, finish, make_events, percentiles, scratch_dir
+
+PATHS = {'detect': '/api/v1/threats/detect', 'batch': '/api/v1/threats/detect/batch'}
+
+
+class Load:
+    def __init__(self, client, path, bodies, headers):
+        self.client = client
+        self.path = path
+        self.bodies = itertools.cycle(bodies)
+        self.headers = headers
+        self.latencies = []
+        self.rejected = []  # latencies of 429s from admission control
+        self.statuses = Counter()
+
+    async def send(self, started=None):
+        started = started or time.perf_counter()
+        try:
+            r = await self.client.post(self.path, json=next(self.bodies), headers=self.headers)
+            status = r.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.statuses[status] += 1
+        if status == 200:
+            self.latencies.append(time.perf_counter() - started)
+        elif status == 429:
+            self.rejected.append(time.perf_counter() - started)
+
+    async def closed(self, concurrency, duration):
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                await self.send()
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    async def open(self, rate, duration, max_outstanding):
+        start = time.perf_counter()
+        pending = set()
+        for i in range(int(rate * duration)):
+            at = start + i / rate
+            delay = at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(pending) >= max_outstanding:
+                # the server is this far behind; count the request as shed by the client
+                self.statuses['client_dropped'] += 1
+                continue
+            task = asyncio.ensure_future(self.send(at))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+
+
+def request_bodies(args):
+    events = make_events(args.events, args.features, args.seed)
+    if args.endpoint == 'detect':
+        return events
+    return [{'events': events[i:i + args.batch_size]} for i in range(0, len(events), args.batch_size)]
+
+
+def start_uvicorn(workdir, workers, timeout=120.0):
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'backend.app.main:app', '--port', str(port),
+                             '--workers', str(workers), '--log-level', 'warning'],
+                            cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    if wait_for(url + '/readyz', time.perf_counter() + timeout) is None:
+        proc.terminate()
+        raise SystemExit(f'uvicorn did not become ready within {timeout:.0f}s')
+    return proc, url
+
+
+async def token_for(client, args):
+    if args.url:
+        r = await client.post('/api/v1/auth/token', data={'username': args.username, 'password': args.password})
+        r.raise_for_status()
+        return r.json()['access_token']
+    from backend.app.auth import create_access_token
+    return create_access_token({'sub': args.username})
+
+
+async def drive(client, args):
+    headers = {'Authorization': 'Bearer ' + await token_for(client, args)}
+    load = Load(client, PATHS[args.endpoint], request_bodies(args), headers)
+    for _ in range(args.warmup_requests):
+        await load.send()
+    load.latencies.clear()
+    load.rejected.clear()
+    load.statuses.clear()
+    t0 = time.perf_counter()
+    if args.rate:
+        await load.open(args.rate, args.duration, args.max_outstanding)
+    else:
+        await load.closed(args.concurrency, args.duration)
+    return load, time.perf_counter() - t0
+
+
+async def run_inprocess(args):
+    from backend.app.main import app, warmup
+
+    await app.router.startup()
+    try:
+        while not warmup.ready:
+            await asyncio.sleep(0.05)
+        async with httpx.AsyncClient(app=app, base_url='http://bench', timeout=args.timeout) as client:
+            return await drive(client, args)
+    finally:
+        await app.router.shutdown()
+
+
+async def run_remote(url, args):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        return await drive(client, args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', default='inprocess', choices=['inprocess', 'uvicorn'])
+    parser.add_argument('--url', help='benchmark a running server instead of starting one (implies --target uvicorn)')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers when starting a server')
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench-password')
+    parser.add_argument('--endpoint', default='detect', choices=sorted(PATHS))
+    parser.add_argument('--batch-size', type=int, default=64, help='events per request for --endpoint batch')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, default=8, help='closed loop: clients in flight')
+    load.add_argument('--rate', type=float, help='open loop: requests started per second')
+    parser.add_argument('--max-outstanding', type=int, default=1000, help='open loop: requests in flight before the client sheds')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup-requests', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--events', type=int, default=2000, help='distinct synthetic events, sent round robin')
+    parser.add_argument('--features', type=int, default=4, help='features per event (the anomaly model expects 4)')
+    parser.add_argument('--seed', type=int, default=7)
+    add_baseline_args(parser)
+    args = parser.parse_args()
+    if args.url:
+        args.target = 'uvicorn'
+
+    workdir = scratch_dir()
+    server = None
+    if not args.url:
+        # the bench user goes into the scratch database, which a started server shares
+        from benchmarks.bench_login import BENCH_PASSWORD, BENCH_USER, ensure_user
+        ensure_user()
+        args.username, args.password = BENCH_USER, BENCH_PASSWORD
+    try:
+        if args.target == 'inprocess':
+            result, elapsed = asyncio.run(run_inprocess(args))
+        else:
+            url = args.url
+            if url is None:
+                server, url = start_uvicorn(workdir, args.workers)
+            result, elapsed = asyncio.run(run_remote(url, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(30)
+
+    per_request = args.batch_size if args.endpoint == 'batch' else 1
+    stats = percentiles(result.latencies)
+    load_name = f'rate{args.rate:g}' if args.rate else f'c{args.concurrency}'
+    section = f'detect.{args.target}.{args.endpoint}.{load_name}'
+    print(f"== {section}: {elapsed:.1f}s, statuses {dict(result.statuses)}")
+    if not stats['n']:
+        print('no successful requests')
+        sys.exit(1)
+    throughput = stats['n'] / elapsed
+    print(f"  throughput {throughput:.1f} req/s ({throughput * per_request:.1f} events/s)")
+    print(f"  latency p50 {stats['p50_ms']:.2f} ms  p95 {stats['p95_ms']:.2f} ms  p99 {stats['p99_ms']:.2f} ms  "
+          f"mean {stats['mean_ms']:.2f} ms")
+    if result.rejected:
+        rejected = percentiles(result.rejected)
+        print(f"  rejected (429) p50 {rejected['p50_ms']:.2f} ms  p99 {rejected['p99_ms']:.2f} ms")
+    print()
+    metrics = {'throughput_per_s': throughput, 'p50_ms': stats['p50_ms'], 'p95_ms': stats['p95_ms'],
+               'p99_ms': stats['p99_ms']}
+    sys.exit(finish(args, section, metrics))
+
+
+if __name__ == '__main__':
+    main()
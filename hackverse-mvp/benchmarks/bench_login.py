@@ -0,0 +1,119 @@
+"""Login throughput and its effect on detect latency.
+
+Drives the FastAPI app in-process (httpx ASGI transport, one event loop) so any
+work that blocks the loop shows up directly in detect latency:
+
+  1. detect latency with no other traffic
+  2. a login storm (--login-concurrency clients logging in back to back) and,
+     at the same time, the same detect probe
+
+Reports logins/s, how many logins were shed (503), and detect p50/p95/p99 for
+both phases.
+
+Usage (from hackverse-mvp/, needs httpx):
+    python -m benchmarks.bench_login --duration 10 --login-concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+from backend.app.main import app
+from backend.app.auth import create_access_token, get_password_hash, password_pool
+from backend.app.database import SessionLocal, init_db
+from backend.app.models.user import User
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+
+EVENT = {
+    'source': 'bench', 'timestamp': '2024-01-01T00:00:00Z', 'ip': '10.0.0.1', 'user': 'alice',
+    'event_type': 'login', 'features': {'f0': 0.1, 'f1': 0.2, 'f2': 0.3, 'f3': 0.4},
+}
+
+
+def ensure_user():
+    init_db()
+    db = SessionLocal()
+    try:
+        if not db.query(User).filter(User.username == BENCH_USER).first():
+            db.add(User(username=BENCH_USER, hashed_password=get_password_hash(BENCH_PASSWORD), role='analyst'))
+            db.commit()
+    finally:
+        db.close()
+
+
+def percentiles(samples):
+    if not samples:
+        return {'n': 0}
+    ms = np.array(samples) * 1000.0
+    return {'n': len(ms), 'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p95_ms': round(float(np.percentile(ms, 95)), 2), 'p99_ms': round(float(np.percentile(ms, 99)), 2)}
+
+
+async def detect_probe(client, headers, stop, interval):
+    latencies = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        r = await client.post('/api/v1/threats/detect', json=EVENT, headers=headers)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def login_loop(client, stop, counts):
+    form = {'username': BENCH_USER, 'password': BENCH_PASSWORD}
+    while not stop.is_set():
+        r = await client.post('/api/v1/auth/token', data=form)
+        counts[r.status_code] = counts.get(r.status_code, 0) + 1
+        if r.status_code == 503:
+            await asyncio.sleep(float(r.headers.get('Retry-After', '1')) / 10.0)
+
+
+async def run(args):
+    headers = {'Authorization': 'Bearer ' + create_access_token({'sub': BENCH_USER})}
+    async with httpx.AsyncClient(app=app, base_url='http://bench', timeout=60.0) as client:
+        # warm up pools and caches
+        await client.post('/api/v1/auth/token', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+        await client.post('/api/v1/threats/detect', json=EVENT, headers=headers)
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(detect_probe(client, headers, stop, args.probe_interval))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        idle = await probe
+
+        stop = asyncio.Event()
+        counts = {}
+        logins = [asyncio.create_task(login_loop(client, stop, counts)) for _ in range(args.login_concurrency)]
+        probe = asyncio.create_task(detect_probe(client, headers, stop, args.probe_interval))
+        t0 = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        loaded = await probe
+        await asyncio.gather(*logins)
+        elapsed = time.perf_counter() - t0
+
+    print(f"logins: {counts.get(200, 0) / elapsed:.1f}/s ok, status counts {counts}")
+    print(f"detect idle:        {percentiles(idle)}")
+    print(f"detect under login: {percentiles(loaded)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per phase')
+    parser.add_argument('--login-concurrency', type=int, default=50)
+    parser.add_argument('--probe-interval', type=float, default=0.01, help='pause between detect probes (s)')
+    args = parser.parse_args()
+    ensure_user()
+    try:
+        asyncio.run(run(args))
+    finally:
+        password_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
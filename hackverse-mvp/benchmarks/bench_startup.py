@@ -0,0 +1,135 @@
+"""Cold-start cost: app import time per package and warm-up time per step.
+
+Each run starts a fresh interpreter (so nothing is cached in-process) in a
+scratch directory (so the SQLite file it creates is throwaway) and measures:
+
+  1. `import backend.app.main`, wall time plus `-X importtime` self time
+     grouped by top-level package (sklearn should not appear)
+  2. every warm-up step (see backend/app/warmup.py), run synchronously
+  3. with --server: time from launching uvicorn until /healthz and /readyz
+     first answer 200
+
+Reports the median over --runs runs.
+
+Usage (from hackverse-mvp/):
+    python -m benchmarks.bench_startup --runs 5 --server
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+from statistics import median
+
+REPO = Path(__file__).resolve().parent.parent
+
+CHILD = '''
+import json, time
+t0 = time.perf_counter()
+import backend.app.main as m
+t1 = time.perf_counter()
+m.warmup.run()
+m.password_pool.shutdown()
+print("RESULT " + json.dumps({"import": t1 - t0, "steps": {k: v["seconds"] for k, v in m.warmup.status.items()},
+                              "ready": m.warmup.ready}))
+'''
+
+
+def child_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = str(REPO) + os.pathsep + env.get('PYTHONPATH', '')
+    env['PYTHONWARNINGS'] = 'ignore'
+    return env
+
+
+def import_profile(workdir):
+    """Self time (s) per top-level package from -X importtime."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import backend.app.main'],
+                          cwd=workdir, env=child_env(), capture_output=True, text=True, check=True)
+    per_package = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, self_us, _, name = (part.strip() for part in line.split('|', 1)[0].split(':', 1) + line.split('|')[1:])
+        package = name.split('.')[0]
+        if package == 'backend':
+            package = '.'.join(name.split('.')[:3])
+        per_package[package] += int(self_us) / 1e6
+    return per_package
+
+
+def warm_profile(workdir):
+    proc = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=child_env(), capture_output=True, text=True, check=True)
+    line = next(l for l in proc.stdout.splitlines() if l.startswith('RESULT '))
+    return json.loads(line[len('RESULT '):])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as r:
+                if r.status == 200:
+                    return time.perf_counter()
+        except Exception:
+            time.sleep(0.01)
+    return None
+
+
+def server_profile(workdir, timeout=60.0):
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'backend.app.main:app', '--port', str(port), '--log-level', 'warning'],
+                            cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        live = wait_for(f'http://127.0.0.1:{port}/healthz', t0 + timeout)
+        ready = wait_for(f'http://127.0.0.1:{port}/readyz', t0 + timeout)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+    return {'live': live - t0 if live else None, 'ready': ready - t0 if ready else None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--server', action='store_true', help='also time uvicorn until /healthz and /readyz answer')
+    parser.add_argument('--top', type=int, default=12, help='packages to list')
+    args = parser.parse_args()
+
+    imports, warms, servers = [], [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            imports.append(import_profile(workdir))
+            warms.append(warm_profile(workdir))
+            if args.server:
+                servers.append(server_profile(workdir))
+
+    print(f"import backend.app.main: {median(w['import'] for w in warms):.3f}s (median of {args.runs})")
+    packages = {p for run in imports for p in run}
+    rows = sorted(((median(run.get(p, 0.0) for run in imports), p) for p in packages), reverse=True)
+    for seconds, package in rows[:args.top]:
+        print(f"  {package:<40} {seconds:.3f}s")
+    print(f"warm-up: ready={all(w['ready'] for w in warms)}")
+    for step in warms[0]['steps']:
+        print(f"  {step:<40} {median(w['steps'][step] for w in warms):.3f}s")
+    if servers:
+        live = [s['live'] for s in servers if s['live'] is not None]
+        ready = [s['ready'] for s in servers if s['ready'] is not None]
+        print(f"uvicorn: /healthz after {median(live):.3f}s, /readyz after {median(ready):.3f}s" if live and ready
+              else f"uvicorn did not become ready: {servers}")
+
+
+if __name__ == '__main__':
+    main()
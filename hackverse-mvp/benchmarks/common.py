@@ -0,0 +1,130 @@
+"""Shared pieces of the benchmarks: synthetic events, percentiles, baselines.
+
+Events come from train_agents.generate_synthetic (the same distribution the
+agents are trained on) with random IPs, users and event types on top.
+
+Baselines live in benchmarks/baseline.json, one section per benchmark, as flat
+{metric: number} maps. Metric names end in their unit; `_per_s` metrics are
+better when higher, everything else (latencies) when lower. --save-baseline
+rewrites a section; a normal run compares against it and flags metrics that
+got worse by more than --threshold. Numbers are machine-specific: regenerate
+the baseline on the machine that runs the comparison.
+"""
+import atexit
+import json
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+EVENT_TYPES = ['login', 'logout', 'file_access', 'login_failed', 'malware_detected', 'process_kill',
+               'unpatched_service', 'network_scan', 'error_disk', 'trojan_beacon']
+USERS = ['alice', 'bob', 'root', 'svc_backup', 'Administrator', 'carol']
+
+
+class StaticWeights:
+    """Weight store stand-in so the benchmark never touches the database."""
+
+    class _Snapshot:
+        version = 0
+        weights = {}
+
+    def current(self):
+        return self._Snapshot
+
+
+def make_events(n, n_features, seed):
+    from backend.app.ml.train_agents import generate_synthetic
+
+    rng = random.Random(seed)
+    X = generate_synthetic(n_samples=n, n_features=n_features, seed=seed)
+    return [{
+        'source': 'bench', 'timestamp': '2024-01-01T00:00:00Z',
+        'ip': f'10.0.{rng.randrange(256)}.{rng.randrange(256)}', 'user': rng.choice(USERS),
+        'event_type': rng.choice(EVENT_TYPES),
+        'features': {f'f{j}': float(v) for j, v in enumerate(row)},
+    } for row in X]
+
+
+def scratch_dir():
+    """Run from a throwaway directory so the SQLite file, log, model registry and
+    baseline snapshot the app creates never land in the repo. Call before
+    importing the app."""
+    workdir = tempfile.mkdtemp(prefix='hv-bench-')
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.environ.setdefault('MODEL_REGISTRY_PATH', os.path.join(workdir, 'registry'))
+    os.environ.setdefault('BASELINE_SNAPSHOT_PATH', os.path.join(workdir, 'baselines.pkl'))
+    os.chdir(workdir)
+    return workdir
+
+
+def percentiles(samples, scale=1000.0, unit='ms'):
+    """n, mean, p50, p95, p99 of durations in seconds (reported in ms by default)."""
+    if not len(samples):
+        return {'n': 0}
+    x = np.asarray(samples) * scale
+    out = {'n': len(x), f'mean_{unit}': float(x.mean())}
+    for p in (50, 95, 99):
+        out[f'p{p}_{unit}'] = float(np.percentile(x, p))
+    return out
+
+
+def load_baseline(path=BASELINE):
+    path = Path(path)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_baseline(section, metrics, path=BASELINE):
+    baseline = load_baseline(path)
+    baseline[section] = {k: round(float(v), 3) for k, v in sorted(metrics.items())}
+    Path(path).write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+    print(f"saved {len(metrics)} metrics to {path} [{section}]")
+
+
+def compare(section, metrics, path=BASELINE, threshold=0.2):
+    """Print current vs baseline per metric; returns the names that regressed by more than `threshold`."""
+    base = load_baseline(path).get(section)
+    if not base:
+        print(f"no baseline for [{section}] in {path} (run with --save-baseline)")
+        return []
+    regressed = []
+    width = max(len(k) for k in metrics)
+    print(f"{'metric':<{width}}  {'baseline':>12}  {'current':>12}  change")
+    for name in sorted(metrics):
+        value, ref = metrics[name], base.get(name)
+        if ref is None:
+            print(f"{name:<{width}}  {'-':>12}  {value:>12.3f}  new")
+            continue
+        change = (value - ref) / ref if ref else 0.0
+        worse = -change if name.endswith('_per_s') else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        elif worse < -threshold:
+            flag = '  improved'
+        print(f"{name:<{width}}  {ref:>12.3f}  {value:>12.3f}  {change:+7.1%}{flag}")
+    return regressed
+
+
+def add_baseline_args(parser):
+    parser.add_argument('--baseline', default=str(BASELINE), help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='write this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative change flagged as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit 1 if any metric regressed')
+
+
+def finish(args, section, metrics):
+    """Save or compare per the baseline arguments; exit code for main()."""
+    if args.save_baseline:
+        save_baseline(section, metrics, args.baseline)
+        return 0
+    regressed = compare(section, metrics, args.baseline, args.threshold)
+    if regressed:
+        print(f"{len(regressed)} metric(s) regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+    return 1 if regressed and args.fail_on_regression else 0
@@ -2,14 +2,35 @@ import React, { useEffect, useState } from 'react'
 import axios from 'axios'
 import AnimatedKPI from '../components/AnimatedKPI'
 
+const authHeaders = () => {
+  const token = localStorage.getItem('hv_token')
+  return { Authorization: token ? `Bearer ${token}` : '' }
+}
+
 export default function Dashboard(){
   const [summary, setSummary] = useState(null)
+  const [topIps, setTopIps] = useState([])
+  const [recent, setRecent] = useState([])
+  const [cursor, setCursor] = useState(null)
   const [loading, setLoading] = useState(true)
 
+  const loadRecent = (after) => {
+    // keyset pagination: pass the previous page's next_cursor to continue
+    return axios.get('/api/v1/detections/', { params: { limit: 25, cursor: after || undefined }, headers: authHeaders() }).then(r=>{
+      setRecent(prev => after ? [...prev, ...r.data.items] : r.data.items)
+      setCursor(r.data.next_cursor)
+    })
+  }
+
   useEffect(()=>{
-    const token = localStorage.getItem('hv_token')
-    axios.get('/api/v1/threats/detect', { params: {dummy: 1}, headers: { Authorization: token ? `Bearer ${token}` : '' } }).then(r=>{
-      setSummary(r.data)
+    // last 24h, served from the rollup tables
+    Promise.all([
+      axios.get('/api/v1/detections/stats/summary', { headers: authHeaders() }),
+      axios.get('/api/v1/detections/stats/top-ips', { params: { limit: 5 }, headers: authHeaders() }),
+      loadRecent(null),
+    ]).then(([s, ips])=>{
+      setSummary(s.data)
+      setTopIps(ips.data)
       setLoading(false)
     }).catch(()=>{
       setSummary(null)
@@ -17,33 +38,69 @@ export default function Dashboard(){
     })
   },[])
 
+  const maxCount = Math.max(1, ...(summary?.per_technique || []).map(p => p.count))
+
   return (
     <div>
       <h1>Dashboard</h1>
       <div className="kpi-grid">
-        <AnimatedKPI label="Aggregate score" value={summary?.aggregate_score || 0} suffix="" />
-        <AnimatedKPI label="Is threat" value={summary?.is_threat ? 1 : 0} />
-        <AnimatedKPI label="Top technique score" value={summary?.top_technique?.score || 0} />
+        <AnimatedKPI label="Detections (24h)" value={summary?.count || 0} />
+        <AnimatedKPI label="Threats (24h)" value={summary?.threats || 0} />
+        <AnimatedKPI label="Threat rate" value={summary?.count ? 100 * summary.threats / summary.count : 0} suffix="%" />
       </div>
 
       {loading && <div className="spinner" />}
 
       {!loading && summary && (
-        <div className="card" style={{marginTop:20}}>
-          <h3>Per-technique results</h3>
-          <ul>
-            {summary.per_technique.map(p => (
-              <li key={p.technique} className="tech-row">
-                <strong>{p.technique}</strong>
-                <div className="bar-wrap"><div className="bar" style={{width: `${Math.min(100, p.score*100)}%`}}></div></div>
-                <code>{p.score.toFixed(2)}</code>
-              </li>
-            ))}
-          </ul>
-        </div>
+        <>
+          <div className="card" style={{marginTop:20}}>
+            <h3>Detections by top technique</h3>
+            <ul>
+              {summary.per_technique.map(p => (
+                <li key={p.technique || 'none'} className="tech-row">
+                  <strong>{p.technique || 'none'}</strong>
+                  <div className="bar-wrap"><div className="bar" style={{width: `${Math.min(100, p.count / maxCount * 100)}%`}}></div></div>
+                  <code>{p.count} / {p.threats} threats</code>
+                </li>
+              ))}
+            </ul>
+          </div>
+
+          <div className="card" style={{marginTop:20}}>
+            <h3>Top source IPs</h3>
+            <table style={{width:'100%'}}>
+              <thead><tr><th>IP</th><th>Detections</th><th>Threats</th></tr></thead>
+              <tbody>
+                {topIps.map(ip => (
+                  <tr key={ip.ip || 'none'}><td>{ip.ip || '-'}</td><td>{ip.count}</td><td>{ip.threats}</td></tr>
+                ))}
+              </tbody>
+            </table>
+          </div>
+
+          <div className="card" style={{marginTop:20}}>
+            <h3>Recent detections</h3>
+            <table style={{width:'100%'}}>
+              <thead><tr><th>Time (UTC)</th><th>IP</th><th>User</th><th>Top technique</th><th>Score</th><th>Threat</th></tr></thead>
+              <tbody>
+                {recent.map(d => (
+                  <tr key={d.id}>
+                    <td>{d.detected_at.replace('T', ' ').slice(0, 19)}</td>
+                    <td>{d.ip}</td>
+                    <td>{d.user}</td>
+                    <td>{d.top_technique || '-'}</td>
+                    <td><code>{d.aggregate_score.toFixed(2)}</code></td>
+                    <td>{d.is_threat ? 'yes' : ''}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+            {cursor && <button className="btn" onClick={()=>loadRecent(cursor)}>Load more</button>}
+          </div>
+        </>
       )}
 
-      {!loading && !summary && <div className="card">No status (login required or server offline)</div>}
+      {!loading && !summary && <div className="card">No history (login required or server offline)</div>}
     </div>
   )
 }
@@ -0,0 +1,49 @@
+"""Feature values that overflow float32 are rejected per event, never by recursing.
+
+Run from hackverse-mvp/:  python -m pytest -q tests
+"""
+from benchmarks.common import scratch_dir
+
+scratch_dir()
+
+import pytest  # noqa: E402
+
+from backend.app.ml.agents import BaseAgent  # noqa: E402
+from backend.app.ml.ensemble import EnsembleAnalyzer  # noqa: E402
+from backend.app.ml.feature_schema import FeatureSchemaError, get_registry  # noqa: E402
+from backend.app.ml.weight_store import WeightSnapshot  # noqa: E402
+
+
+class ConstantAgent(BaseAgent):
+    technique = 'constant'
+
+    def analyze(self, event):
+        return {'technique': self.technique, 'is_threat': False, 'score': 0.25, 'details': {}}
+
+
+class FixedWeights:
+    def current(self):
+        return WeightSnapshot(1, {})
+
+
+def event(*values):
+    return {'source': 'test', 'timestamp': '', 'ip': '', 'user': '', 'event_type': 'login',
+            'features': {f'f{i}': v for i, v in enumerate(values)}}
+
+
+@pytest.mark.parametrize('value', [1e300, -1e300, 10 ** 400, float('inf'), float('nan')])
+def test_validate_rejects_what_float32_cannot_hold(value):
+    with pytest.raises(FeatureSchemaError):
+        get_registry().validate(event(value, 1.0, 1.0, 1.0))
+    with pytest.raises(FeatureSchemaError):
+        get_registry().build_batch([event(value, 1.0, 1.0, 1.0)])
+
+
+@pytest.mark.parametrize('mode', ['full', 'cascade', 'concurrent'])
+def test_huge_feature_gets_an_error_not_a_recursion(mode):
+    analyzer = EnsembleAnalyzer(agents=[ConstantAgent()], weight_store=FixedWeights(), mode=mode)
+    good = event(1.0, 2.0, 3.0, 4.0)
+    out = analyzer.analyze_batch([good, event(1e300, 2.0, 3.0, 4.0), good])
+    assert isinstance(out[1], FeatureSchemaError)
+    assert [r['aggregate_score'] for r in (out[0], out[2])] == [0.25, 0.25]
+    assert isinstance(analyzer.analyze_batch([event(1e300, 2.0, 3.0, 4.0)])[0], FeatureSchemaError)
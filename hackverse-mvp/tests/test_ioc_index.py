@@ -0,0 +1,36 @@
+"""A rebuilt IOC index is picked up without a restart.
+
+Run from hackverse-mvp/:  python -m pytest -q tests
+"""
+import os
+
+from backend.app.ml.agents import ThreatIntelAgent
+from backend.app.ml.ioc_index import IOCIndex, IOCIndexWatcher
+
+
+def test_watcher_picks_up_a_rebuilt_index(tmp_path):
+    directory = tmp_path / 'ioc'
+    watcher = IOCIndexWatcher(directory, check_interval=0.0)
+    assert watcher.current() is None
+
+    IOCIndex.build(['203.0.113.7']).save(directory)
+    assert watcher.current().contains('203.0.113.7')
+
+    IOCIndex.build(['198.51.100.0/24']).save(directory)
+    # mtimes can repeat within the filesystem's resolution; make the rebuild visible
+    meta = directory / 'meta.json'
+    st = os.stat(meta)
+    os.utime(meta, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+    index = watcher.current()
+    assert index.contains('198.51.100.20') and not index.contains('203.0.113.7')
+
+
+def test_agent_scores_with_the_current_index(tmp_path, monkeypatch):
+    from backend.app.deps import get_settings
+    directory = tmp_path / 'ioc'
+    IOCIndex.build(['203.0.113.7']).save(directory)
+    monkeypatch.setattr(get_settings(), 'ioc_index_path', str(directory))
+    monkeypatch.setattr(get_settings(), 'ioc_check_interval', 0.0)
+    agent = ThreatIntelAgent()
+    assert agent.analyze({'ip': '203.0.113.7'})['details']['ioc_match'] == 'ip'
+    assert agent.analyze_batch([{'ip': '203.0.113.8'}])[0]['details']['ioc_match'] is None
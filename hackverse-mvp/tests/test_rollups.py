@@ -0,0 +1,46 @@
+"""The portable UPDATE-then-INSERT rollup path matches SQLite's native upsert.
+
+Run from hackverse-mvp/:  python -m pytest -q tests
+"""
+import random
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import detection_rollups
+from backend.app.detection_store import to_row
+from backend.app.models.detection import DetectionHour, DetectionIpDay, DetectionIpHour, DetectionMinute
+from backend.app.models.user import Base
+
+TABLES = (DetectionMinute, DetectionHour, DetectionIpHour, DetectionIpDay)
+
+
+def make_rows(n, seed=1):
+    rng = random.Random(seed)
+    return [to_row({'source': 's', 'ip': f'10.0.0.{rng.randrange(3)}', 'user': 'u', 'event_type': 'login', 'features': {}},
+                   {'aggregate_score': rng.random(), 'is_threat': rng.random() > 0.5,
+                    'top_technique': {'technique': rng.choice(('EDR', 'SIEM', 'SOAR'))}},
+                   1.7e9 + rng.randrange(3 * 3600))
+            for _ in range(n)]
+
+
+def rollups_after(rows, monkeypatch=None):
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    if monkeypatch is not None:
+        def portable(db, table, keys, rows, add, greatest=()):
+            if rows:
+                detection_rollups._update_or_insert(db, table.__table__, keys, rows, add, greatest)
+        monkeypatch.setattr(detection_rollups, '_upsert', portable)
+    for i in range(0, len(rows), 50):
+        detection_rollups.update_rollups(db, rows[i:i + 50])
+        db.commit()
+    return {t.__name__: sorted(tuple(r) for r in db.execute(select(t.__table__)).all()) for t in TABLES}
+
+
+def test_portable_rollups_match_native_upsert(monkeypatch):
+    rows = make_rows(300)
+    native = rollups_after(rows)
+    assert all(native.values())
+    assert rollups_after(rows, monkeypatch) == native
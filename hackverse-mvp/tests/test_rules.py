@@ -0,0 +1,32 @@
+"""Rule files are checked when they are parsed, so agents never see out-of-range scores.
+
+Run from hackverse-mvp/:  python -m pytest -q tests
+"""
+import json
+
+import pytest
+
+from backend.app.ml import correlation, signatures
+
+
+def test_shipped_signatures_parse():
+    assert signatures.parse_rules(json.loads(signatures.DEFAULT_RULES.read_text(encoding='utf-8')))
+
+
+@pytest.mark.parametrize('score', [3, -1, 1.0001, float('nan')])
+def test_signature_score_outside_0_1_is_rejected(score):
+    with pytest.raises(ValueError, match='between 0 and 1'):
+        signatures.parse_rules([{'pattern': 'malware', 'score': score}])
+
+
+def test_shipped_correlations_parse():
+    assert correlation.parse_rules(json.loads(correlation.DEFAULT_RULES.read_text(encoding='utf-8')))
+
+
+@pytest.mark.parametrize('change', [{'score': 2}, {'score': -0.5}, {'score': float('nan')}, {'window': 0},
+                                    {'window': -10}, {'window': float('nan')}, {'threshold': 0}])
+def test_bad_correlation_rule_is_rejected(change):
+    rule = {'id': 'COR-T', 'where': {'event_type': ['login_failed']}, 'key': ['user'], 'window': 60,
+            'threshold': 5, 'score': 0.5}
+    with pytest.raises(ValueError):
+        correlation.parse_rules([{**rule, **change}])